@@ -0,0 +1,82 @@
+import hashlib
+import os
+import pathlib
+import pickle
+import re
+import tempfile
+
+CACHE_DIRNAME = ".varat_cache"
+# the name of an entry is its key, a sha256 hex digest; the other files of the
+# cache folder (e.g. the definition table of lib.dataset) are not entries
+_KEY_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+
+def file_digest(path) -> str:
+    """return the sha256 hex digest of the file content."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ArtifactCache:
+    """content-addressed on-disk cache of pipeline artifacts for one document.
+
+    An entry is keyed by the digest of the source file together with the
+    fingerprint of the code which produced it. When either of them changes the
+    old entry is never hit again, and it is evicted on the next store.
+
+    Args:
+        cache_dir (Path): folder in which the entries are saved.
+        fingerprint (str): version of the code which produces the artifacts.
+    """
+
+    suffix = ".pkl"
+
+    def __init__(self, cache_dir, fingerprint: str):
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.fingerprint = fingerprint
+
+    def key(self, source_path) -> str:
+        h = hashlib.sha256()
+        h.update(file_digest(source_path).encode())
+        h.update(self.fingerprint.encode())
+        return h.hexdigest()
+
+    def _entry_path(self, key: str) -> pathlib.Path:
+        return self.cache_dir / (key + self.suffix)
+
+    def __contains__(self, key: str) -> bool:
+        return self._entry_path(key).is_file()
+
+    def load(self, key: str):
+        """return the cached value, or None if there is no valid entry."""
+        entry_path = self._entry_path(key)
+        if not entry_path.is_file():
+            return None
+        try:
+            with open(entry_path, "rb") as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            # broken or written by an incompatible version of the code
+            return None
+
+    def store(self, key: str, value) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # write to a temporary file first so that a concurrent reader never sees
+        # a partially written entry.
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self._entry_path(key))
+        self.evict(keep=key)
+
+    def evict(self, keep: str = None) -> None:
+        """remove every entry except `keep`; other files are left alone."""
+        for entry_path in self.cache_dir.glob("*" + self.suffix):
+            if entry_path.stem != keep and _KEY_PATTERN.fullmatch(entry_path.stem):
+                try:
+                    entry_path.unlink()
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,314 @@
+import re
+from typing import List
+
+import numpy as np
+
+from lib.masking import MASK_PATTERN
+from lib.xmldoc_child import Candidate
+
+TOKEN_PATTERN = re.compile(
+    r"(?P<mask>MATH_[0-9]{4})|(?P<word>[^\W\d_]+(?:[-'][^\W\d_]+)*)|(?P<other>\S)"
+)
+
+# words which end a noun phrase
+STOPWORD_SET = frozenset(
+    """
+    a an the this that these those its their each every any all some such other
+    both either and or but nor if then than so also not of for in on at to by
+    with from into onto over under between through per via as about where which
+    who whose when while here there it we they he she our us is are be been
+    being was were has have had can could may might must shall should will would
+    do does did let given give gives called denote denotes denoted denoting
+    represent represents represented representing define defines defined stand
+    stands indicate indicates indicated describe describes described express
+    expresses expressed obtained shown follows following respectively e g i ie
+    eg etc
+    """.split()
+)
+# verbs introducing the definition after the identifier, e.g. "x is the ..."
+CUE_WORD_SET = frozenset(
+    """
+    is are be was were denote denotes denoted represent represents represented
+    define defines defined stand stands indicate indicates indicated means
+    """.split()
+)
+# words skipped between the cue verb and the phrase, e.g. "x is given by the ..."
+CUE_FILLER_SET = frozenset(
+    ["a", "an", "the", "its", "their", "this", "these", "given", "by"]
+)
+# prepositions joining a noun phrase to the following one, e.g. "rate of reaction"
+JOINT_WORD_SET = frozenset(["of", "for", "in", "on", "between"])
+# may follow a joint word, as in "concentration of the reactant"
+ARTICLE_SET = frozenset(["a", "an", "the"])
+
+# characters which may surround a word of the text
+WORD_OPENING_SET = frozenset(["", " ", "\n", "\t", "(", "[", '"', "'", "-"])
+WORD_CLOSING_SET = frozenset(
+    ["", " ", "\n", "\t", ")", "]", '"', "'", "-", ".", ",", ";", ":", "?", "!"]
+)
+
+MAX_PHRASE_WORDS = 5
+
+# first character of the text of a <mi> element
+MI_TEXT_PATTERN = re.compile(r"<mi(?:\s[^>]*)?>\s*([^<\s])")
+TEX_COMMAND_PATTERN = re.compile(r"\\[A-Za-z]+")
+
+# weights and widths of the score of Pagel and Schubotz: the Gaussians fall to
+# 1/2 at the third word and at the fifth sentence from the first occurrence.
+ALPHA, BETA, GAMMA = 1.0, 1.0, 0.1
+SIGMA_DISTANCE = np.sqrt(2 / np.log(2))
+SIGMA_SENTENCE = np.sqrt(8 / np.log(2))
+
+CUE_WEIGHT = 0.5
+APPOSITION_WEIGHT = 0.25
+MATCH_CHARACTER_WEIGHT = 0.1
+
+
+def tokenize(sentence: str):
+    """split the masked sentence into tokens.
+
+    Words glued to a mask or an operator, e.g. "exp" in "MATH_0001\u2062exp",
+    belong to a formula and get the kind "math".
+
+    Returns:
+        list: (kind, text, start, end) tuples, where kind is "mask", "word",
+            "math" or "other".
+    """
+    token_list = []
+    for m in TOKEN_PATTERN.finditer(sentence):
+        kind = m.lastgroup
+        if kind == "word" and (
+            sentence[m.start() - 1 : m.start()] not in WORD_OPENING_SET
+            or sentence[m.end() : m.end() + 1] not in WORD_CLOSING_SET
+        ):
+            kind = "math"
+        token_list.append((kind, m.group(), m.start(), m.end()))
+    return token_list
+
+
+def noun_phrases(token_list):
+    """return the noun phrase candidates of a tokenized sentence.
+
+    A phrase is a run of words which are not stop words, keeping its last
+    MAX_PHRASE_WORDS words, optionally followed by a preposition in
+    JOINT_WORD_SET, an article and the next phrase.
+
+    Returns:
+        list: (start token, end token) spans, the end is exclusive.
+    """
+    chunk_list = []
+    start = None
+    for i, (kind, text, _, _) in enumerate(token_list + [("other", "", 0, 0)]):
+        if kind == "word" and text.lower() not in STOPWORD_SET:
+            if start is None:
+                start = i
+        elif start is not None:
+            chunk_list.append((max(start, i - MAX_PHRASE_WORDS), i))
+            start = None
+
+    span_list = list(chunk_list)
+    for (s0, e0), (s1, e1) in zip(chunk_list, chunk_list[1:]):
+        if token_list[e0][1].lower() not in JOINT_WORD_SET:
+            continue
+        if s1 == e0 + 1 or (
+            s1 == e0 + 2 and token_list[e0 + 1][1].lower() in ARTICLE_SET
+        ):
+            span_list.append((s0, e1))
+    return span_list
+
+
+def _cue_start(token_list, i: int) -> int:
+    """return the first token of the phrase introduced by a cue verb after the
+    identifier at i, or -1.
+
+    Enumerations such as "x and y are ..." are skipped over.
+    """
+    n = len(token_list)
+    i += 1
+    while i < n and (
+        token_list[i][0] == "mask" or token_list[i][1] in {",", "and", "or"}
+    ):
+        i += 1
+    if i >= n or token_list[i][1].lower() not in CUE_WORD_SET:
+        return -1
+    i += 1
+    while i < n and token_list[i][1].lower() in CUE_WORD_SET | CUE_FILLER_SET:
+        i += 1
+    return i if i < n else -1
+
+
+def identifier_initial(identifier) -> str:
+    """return the first character of the base of the identifier in lowercase,
+    e.g. "t" for T_R, taken from its first <mi> or from its tex without the
+    commands such as \\mathrm."""
+    m = MI_TEXT_PATTERN.search(identifier.text_html)
+    if m is not None:
+        return m.group(1).lower()
+    text = TEX_COMMAND_PATTERN.sub("", identifier.text_tex)
+    m = re.search(r"[^\W_]", text)
+    return m.group().lower() if m is not None else ""
+
+
+def _gaussian(x, sigma):
+    return np.exp(-((x - 1.0) ** 2) / (2 * sigma**2))
+
+
+def score_candidates(identifier_registry, sentence_list, top_k: int = 5) -> None:
+    """score the noun phrases around every identifier of the document and keep
+    the best ones in `Identifier.candidates`.
+
+    The sentences are tokenized once, and the features of all
+    (identifier occurrence, candidate) rows of the document are computed
+    together with numpy.
+
+    Args:
+        identifier_registry (IdentifierRegistry): identifiers of the document.
+        sentence_list (list): masked sentences.
+        top_k (int): number of candidates kept for each identifier.
+    """
+    n_identifier = len(identifier_registry)
+    # identifier occurrences
+    occ_sentence, occ_rank, occ_identifier, occ_cue = [], [], [], []
+    # candidate phrases
+    cand_sentence, cand_start, cand_end, cand_text = [], [], [], []
+    cand_text_list, cand_text_index = [], {}
+    cand_sentence_id = []
+    for s, sentence_ in enumerate(sentence_list):
+        if not MASK_PATTERN.search(sentence_):
+            continue
+        token_list = tokenize(sentence_)
+        # rank of the tokens among the words and masks, ignoring punctuation
+        rank_list = np.cumsum([kind != "other" for kind, _, _, _ in token_list]) - 1
+
+        for i, (kind, text, _, _) in enumerate(token_list):
+            identifier_number = int(text[len("MATH_") :]) if kind == "mask" else -1
+            if 0 <= identifier_number < n_identifier:
+                occ_sentence.append(s)
+                occ_rank.append(rank_list[i])
+                occ_identifier.append(identifier_number)
+                cue = _cue_start(token_list, i)
+                occ_cue.append(rank_list[cue] if cue >= 0 else -1)
+
+        sentence_id = identifier_registry.sentences.intern(sentence_)
+        for start, end in noun_phrases(token_list):
+            text = sentence_[token_list[start][2] : token_list[end - 1][3]]
+            text_id = cand_text_index.setdefault(text, len(cand_text_list))
+            if text_id == len(cand_text_list):
+                cand_text_list.append(text)
+            cand_sentence.append(s)
+            cand_start.append(rank_list[start])
+            cand_end.append(rank_list[end - 1] + 1)
+            cand_text.append(text_id)
+            cand_sentence_id.append(sentence_id)
+
+    for identifier_ in identifier_registry:
+        identifier_.candidates = []
+    if not occ_sentence or not cand_sentence:
+        return
+
+    occ_sentence = np.array(occ_sentence)
+    occ_rank = np.array(occ_rank)
+    occ_identifier = np.array(occ_identifier)
+    occ_cue = np.array(occ_cue)
+    cand_sentence = np.array(cand_sentence)
+    cand_start = np.array(cand_start)
+    cand_end = np.array(cand_end)
+    cand_text = np.array(cand_text)
+    cand_sentence_id = np.array(cand_sentence_id)
+
+    # pair every occurrence with the candidates of its sentence; both arrays
+    # are ordered by sentence
+    n_sentence = len(sentence_list)
+    cand_count = np.bincount(cand_sentence, minlength=n_sentence)
+    cand_offset = np.cumsum(cand_count) - cand_count
+    repeat = cand_count[occ_sentence]
+    row_occ = np.repeat(np.arange(len(occ_sentence)), repeat)
+    row_first = np.repeat(np.cumsum(repeat) - repeat, repeat)
+    row_cand = (
+        np.repeat(cand_offset[occ_sentence], repeat)
+        + np.arange(len(row_occ))
+        - row_first
+    )
+    if len(row_occ) == 0:
+        return
+
+    rank = occ_rank[row_occ]
+    start = cand_start[row_cand]
+    end = cand_end[row_cand]
+    before = end <= rank
+    word_count_btwn = np.where(before, rank - end, start - rank - 1)
+
+    first_sentence = np.full(n_identifier, n_sentence)
+    np.minimum.at(first_sentence, occ_identifier, occ_sentence)
+    identifier = occ_identifier[row_occ]
+    sentence_distance = occ_sentence[row_occ] - first_sentence[identifier]
+
+    text_count = np.bincount(cand_text)
+    term_frequency = text_count[cand_text[row_cand]] / text_count.max()
+
+    score_pagel = (
+        ALPHA * _gaussian(word_count_btwn + 1, SIGMA_DISTANCE)
+        + BETA * _gaussian(sentence_distance + 1, SIGMA_SENTENCE)
+        + GAMMA * term_frequency
+    ) / (ALPHA + BETA + GAMMA)
+
+    # the identifier character appears as an initial of the phrase; checked
+    # once for each distinct (text, identifier) pair
+    initial_list = [{w[0].lower() for w in text.split()} for text in cand_text_list]
+    identifier_initial_list = [
+        identifier_initial(identifier_) for identifier_ in identifier_registry
+    ]
+    pair_key = cand_text[row_cand] * n_identifier + identifier
+    pair_key_unique, pair_inverse = np.unique(pair_key, return_inverse=True)
+    score_match_character = np.array(
+        [
+            identifier_initial_list[k % n_identifier] in initial_list[k // n_identifier]
+            for k in pair_key_unique.tolist()
+        ],
+        dtype=np.int64,
+    )[pair_inverse]
+
+    cue = occ_cue[row_occ] == start
+    apposition = before & (word_count_btwn == 0)
+    score_propsed = (
+        score_pagel
+        + CUE_WEIGHT * cue
+        + APPOSITION_WEIGHT * apposition
+        + MATCH_CHARACTER_WEIGHT * score_match_character
+    )
+
+    # best row of each (identifier, text), then the top_k texts of each identifier
+    text = cand_text[row_cand]
+    order = np.lexsort((-score_propsed, text, identifier))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (identifier[order][1:] != identifier[order][:-1]) | (
+        text[order][1:] != text[order][:-1]
+    )
+    best = order[first]
+    best = best[np.lexsort((-score_propsed[best], identifier[best]))]
+    group_start = np.flatnonzero(
+        np.r_[True, identifier[best][1:] != identifier[best][:-1]]
+    )
+    group_rank = np.arange(len(best)) - np.repeat(
+        group_start, np.diff(np.r_[group_start, len(best)])
+    )
+    best = best[group_rank < top_k]
+
+    candidate_count = cand_count[cand_sentence[row_cand]]
+    for r in best:
+        identifier_registry[identifier[r]].candidates.append(
+            Candidate(
+                text=cand_text_list[text[r]],
+                score_pagel=float(score_pagel[r]),
+                score_propsed=float(score_propsed[r]),
+                included_sentence_id=int(cand_sentence_id[row_cand[r]]),
+                word_count_btwn_var_cand=int(word_count_btwn[r]),
+                candidate_count_in_sentence=int(candidate_count[r]),
+                score_match_character=int(score_match_character[r]),
+            )
+        )
+
+
+def suggestion_list(identifier) -> List[str]:
+    """return the texts of the candidates of the identifier, the best first."""
+    return [candidate_.text for candidate_ in identifier.candidates]
@@ -0,0 +1,213 @@
+import os
+import pathlib
+import pickle
+import re
+import tempfile
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from lib.cache import CACHE_DIRNAME
+from lib.dataset import list_papers
+from lib.instrument import span
+from lib.store import annotation_mtime, read_annotations
+
+# Bump this when the normalization or the entries change.
+INDEX_VERSION = 1
+INDEX_FILENAME = "identifier_index.pkl"
+
+# commands which only change the font of their argument, e.g. C_{\mathrm{A}}
+FONT_COMMAND_SET = frozenset(
+    ["\\mathrm", "\\rm", "\\text", "\\textrm", "\\mathit", "\\it", "\\displaystyle"]
+)
+_TEX_TOKEN_PATTERN = re.compile(r"\\[A-Za-z]+|\\.|\S")
+_TEX_COMMAND_PATTERN = re.compile(r"\\[A-Za-z]+")
+
+
+def normalize_tex(tex: str) -> str:
+    """return a canonical form of the TeX of an identifier.
+
+    The spacing, the font commands and the braces around a single token are
+    dropped, so `C_{\\mathrm{A}}`, `C_{A}` and `C_A` are the same identifier.
+    """
+    token_list = [
+        t_ for t_ in _TEX_TOKEN_PATTERN.findall(tex) if t_ not in FONT_COMMAND_SET
+    ]
+    # "{", token, "}" -> token, until no such group is left, e.g. {{A}} -> A
+    i = 0
+    while i + 2 < len(token_list):
+        if (
+            token_list[i] == "{"
+            and token_list[i + 2] == "}"
+            and token_list[i + 1] not in "{}"
+        ):
+            token_list[i : i + 3] = [token_list[i + 1]]
+            i = max(i - 1, 0)
+        else:
+            i += 1
+
+    normalized = []
+    for i, t_ in enumerate(token_list):
+        # a command is ended by a space before a letter, e.g. "\dot C"
+        if i > 0 and _TEX_COMMAND_PATTERN.fullmatch(token_list[i - 1]) and t_.isalpha():
+            normalized.append(" ")
+        normalized.append(t_)
+    return "".join(normalized)
+
+
+@dataclass
+class IndexEntry:
+    paper: str
+    math_id: str
+    identifier_tex: str
+    definitions: Tuple[str, ...]
+
+
+@dataclass
+class PriorDefinition:
+    """a definition given to an identifier in the annotated papers."""
+
+    definition: str
+    # number of identifiers annotated with this definition
+    frequency: int
+    # (paper, math_id) of these identifiers
+    locations: List[Tuple[str, str]] = field(default_factory=list)
+
+
+def paper_entries(paper_dir) -> List[IndexEntry]:
+    """return the identifiers of the paper which have a correct definition."""
+    paper_dir = pathlib.Path(paper_dir)
+    df = read_annotations(paper_dir)
+    df = df[df["identifier_tex"].notna() & df["definition_true"].notna()]
+    entry_list = []
+    for math_id_, tex_, def_true_ in zip(
+        df.index, df["identifier_tex"], df["definition_true"]
+    ):
+        definition_tuple = tuple(
+            d_.strip() for d_ in def_true_.split("\n") if d_.strip()
+        )
+        if definition_tuple:
+            entry_list.append(
+                IndexEntry(paper_dir.name, math_id_, tex_, definition_tuple)
+            )
+    return entry_list
+
+
+class IdentifierIndex:
+    """index of the definitions of the identifiers of all papers in a process.
+
+    The entries of each paper are kept together with the modification time of
+    its annotation, so `refresh` reads only the papers annotated since the last
+    refresh. The index is saved in the cache folder of the process.
+
+    Args:
+        process_path (Path): `[process]` folder.
+    """
+
+    def __init__(self, process_path):
+        self.process_path = pathlib.Path(process_path)
+        self.index_path = self.process_path / CACHE_DIRNAME / INDEX_FILENAME
+        # paper -> (annotation mtime, entries)
+        self.paper_dict: Dict[str, Tuple[float, List[IndexEntry]]] = {}
+        # normalized TeX -> definitions, the most frequent first
+        self.definition_dict: Dict[str, List[PriorDefinition]] = {}
+        self._load()
+
+    def _load(self):
+        if not self.index_path.is_file():
+            return
+        try:
+            with open(self.index_path, "rb") as f:
+                saved = pickle.load(f)
+            if saved["version"] == INDEX_VERSION:
+                self.paper_dict = saved["papers"]
+        except (OSError, EOFError, KeyError, pickle.UnpicklingError, AttributeError):
+            # rebuild a broken index
+            self.paper_dict = {}
+        self._aggregate()
+
+    def _save(self):
+        self.index_path.parent.mkdir(exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.index_path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(
+                {"version": INDEX_VERSION, "papers": self.paper_dict},
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(tmp_path, self.index_path)
+
+    def refresh(self) -> List[str]:
+        """re-read the papers whose annotation has changed and save the index.
+
+        Returns:
+            list: the papers read, or removed from the index.
+        """
+        changed_list = []
+        with span("refresh_identifier_index") as record:
+            paper_set = set()
+            for paper_ in list_papers(self.process_path):
+                try:
+                    mtime = annotation_mtime(self.process_path / paper_)
+                except FileNotFoundError:
+                    # not annotated yet
+                    continue
+                paper_set.add(paper_)
+                if self.paper_dict.get(paper_, (None,))[0] == mtime:
+                    continue
+                entry_list = paper_entries(self.process_path / paper_)
+                self.paper_dict[paper_] = (mtime, entry_list)
+                changed_list.append(paper_)
+            for paper_ in set(self.paper_dict) - paper_set:
+                del self.paper_dict[paper_]
+                changed_list.append(paper_)
+            record["n_changed"] = len(changed_list)
+            if changed_list:
+                self._aggregate()
+                self._save()
+        return changed_list
+
+    def _aggregate(self):
+        counter_dict = {}
+        location_dict = {}
+        for _, entry_list in self.paper_dict.values():
+            for entry_ in entry_list:
+                key = normalize_tex(entry_.identifier_tex)
+                counter = counter_dict.setdefault(key, Counter())
+                for definition_ in entry_.definitions:
+                    counter[definition_] += 1
+                    location_dict.setdefault((key, definition_), []).append(
+                        (entry_.paper, entry_.math_id)
+                    )
+        self.definition_dict = {
+            key_: [
+                PriorDefinition(d_, n_, sorted(location_dict[(key_, d_)]))
+                for d_, n_ in counter_.most_common()
+            ]
+            for key_, counter_ in counter_dict.items()
+        }
+
+    def lookup(self, tex: str, exclude_paper: str = None) -> List[PriorDefinition]:
+        """return the definitions of the identifier in the indexed papers.
+
+        Args:
+            tex (str): TeX of the identifier; it is normalized by `normalize_tex`.
+            exclude_paper (str, optional): ignore the definitions of this paper,
+                e.g. the one being annotated.
+        """
+        prior_list = self.definition_dict.get(normalize_tex(tex), [])
+        if exclude_paper is None:
+            return prior_list
+        result = []
+        for prior_ in prior_list:
+            location_list = [l_ for l_ in prior_.locations if l_[0] != exclude_paper]
+            if location_list:
+                result.append(
+                    PriorDefinition(
+                        prior_.definition, len(location_list), location_list
+                    )
+                )
+        return sorted(result, key=lambda p_: -p_.frequency)
+
+    def __len__(self):
+        return len(self.definition_dict)
@@ -0,0 +1,148 @@
+import os
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+from lib.cache import CACHE_DIRNAME
+from lib.masking import MASK_PATTERN
+from lib.store import annotation_mtime, read_annotations
+
+# Bump this when the columns of the definition table change.
+DATASET_VERSION = 1
+DEFINITION_COLUMNS = [
+    "ID",
+    "process",
+    "paper",
+    "math_id",
+    "index",
+    "identifier_tex",
+    "definition",
+    "extractable",
+]
+
+
+def explode_definitions(df, process: str, paper: str) -> pd.DataFrame:
+    """convert an annotation table into a long table with one row per
+    extracted definition.
+
+    `definition_extracted` and `extractable` hold newline-joined values. The
+    masks (MATH_xxxx) in the definitions are replaced by `identifier_tex`.
+
+    Args:
+        df (DataFrame): annotation table returned by `lib.store.read_annotations`.
+        process (str):
+        paper (str):
+
+    Returns:
+        DataFrame: columns are DEFINITION_COLUMNS.
+    """
+    tex_dict = df["identifier_tex"].dropna().to_dict()
+    df = df[df["extractable"].notna() & df["definition_extracted"].notna()]
+    # rows which have no extractable definition
+    df = df[df["extractable"] != "0"]
+    if df.empty:
+        return pd.DataFrame(columns=DEFINITION_COLUMNS)
+
+    def_list_series = df["definition_extracted"].str.split("\n")
+    extractable_list_series = df["extractable"].str.split("\n")
+    # the shorter list decides the number of definitions, as zip() does
+    n_def = np.minimum(def_list_series.str.len(), extractable_list_series.str.len())
+
+    df_def = pd.DataFrame(
+        {
+            "math_id": df.index.values,
+            "identifier_tex": df["identifier_tex"].values,
+            "definition": [d_[:n_] for d_, n_ in zip(def_list_series, n_def)],
+            "extractable": [e_[:n_] for e_, n_ in zip(extractable_list_series, n_def)],
+            "index": [list(range(n_)) for n_ in n_def],
+        }
+    )
+    df_def = df_def.explode(["definition", "extractable", "index"], ignore_index=True)
+    df_def = df_def.dropna(subset=["index"])
+    if df_def.empty:
+        return pd.DataFrame(columns=DEFINITION_COLUMNS)
+
+    df_def["definition"] = df_def["definition"].str.replace(
+        MASK_PATTERN, lambda m_: tex_dict.get(m_.group(), m_.group()), regex=True
+    )
+    df_def["index"] = df_def["index"].astype(int)
+    df_def["process"] = process
+    df_def["paper"] = paper
+    df_def["ID"] = (
+        process
+        + "/"
+        + paper
+        + "/"
+        + df_def["math_id"]
+        + "_"
+        + df_def["index"].astype(str)
+    )
+    return df_def[DEFINITION_COLUMNS].reset_index(drop=True)
+
+
+def list_papers(folder) -> list:
+    """return the subfolders of the folder (the processes of the data folder or
+    the papers of a process), skipping hidden ones such as the caches."""
+    folder = pathlib.Path(folder)
+    return [
+        f
+        for f in os.listdir(folder)
+        if os.path.isdir(folder / f) and not f.startswith(".")
+    ]
+
+
+def load_definitions(paper_dir) -> pd.DataFrame:
+    """return the definition table of a paper.
+
+    The table is cached next to the paper and rebuilt when the annotation
+    (the SQLite store or the xlsx) is modified.
+
+    Args:
+        paper_dir (Path): `[process]/[paper]` folder.
+    """
+    paper_dir = pathlib.Path(paper_dir)
+    cache_path = paper_dir / CACHE_DIRNAME / "definitions.pkl"
+    mtime = annotation_mtime(paper_dir)
+
+    if cache_path.is_file():
+        try:
+            cached = pd.read_pickle(cache_path)
+            if cached["version"] == DATASET_VERSION and cached["mtime"] == mtime:
+                return cached["definitions"]
+        except Exception:
+            # rebuild a broken cache
+            pass
+
+    df_def = explode_definitions(
+        read_annotations(paper_dir), paper_dir.parent.name, paper_dir.name
+    )
+    cache_path.parent.mkdir(exist_ok=True)
+    pd.to_pickle(
+        {"version": DATASET_VERSION, "mtime": mtime, "definitions": df_def}, cache_path
+    )
+    return df_def
+
+
+def load_corpus(process_path, paper_list=None) -> pd.DataFrame:
+    """return the definition table of all papers in the process."""
+    process_path = pathlib.Path(process_path)
+    if paper_list is None:
+        paper_list = list_papers(process_path)
+    df_def_list = [load_definitions(process_path / paper_) for paper_ in paper_list]
+    if not df_def_list:
+        return pd.DataFrame(columns=DEFINITION_COLUMNS)
+    return pd.concat(df_def_list, ignore_index=True)
+
+
+def extractable_definitions(df_def) -> pd.DataFrame:
+    """return the extractable definitions indexed by ID, as used for the
+    dictionary and the variable pair table."""
+    df_def = df_def[df_def["extractable"] == "1"]
+    return pd.DataFrame(
+        {
+            "identifier_tex": df_def["identifier_tex"].values,
+            "Definition": df_def["definition"].values,
+        },
+        index=df_def["ID"].values,
+    )
@@ -0,0 +1,149 @@
+import re
+from functools import cached_property
+from typing import List
+
+import lxml.html
+
+from lib.instrument import span
+from lib.masking import Masker, OffsetMap
+from lib.render import iter_block_elements
+from lib.util import (
+    e2htmltext,
+    extract_identifiers,
+    parse_html,
+    sentence_segmentation,
+)
+from lib.xmldoc_child import IdentifierRegistry
+
+
+class Document:
+    """a preprocessed paper parsed once.
+
+    The article is parsed when the Document is created and never re-parsed:
+    the views below are computed from the tree, or from the serialized <math>
+    elements, the first time they are used and kept afterwards. The tree itself
+    is never modified, so the views do not depend on the order in which they
+    are computed. The article is masked once; the masked <math> elements and
+    blocks are cut from the masked article through the offset map.
+
+    Args:
+        doc_processed_path (Path): path to `*_preprocessed.html`.
+    """
+
+    def __init__(self, doc_processed_path):
+        self.article = parse_html(doc_processed_path).getroot().cssselect("article")[0]
+
+    @cached_property
+    def original_html(self) -> str:
+        return e2htmltext(self.article)
+
+    @cached_property
+    def math_html_list(self) -> List[str]:
+        """the serialized <math> elements of the article in document order."""
+        return [e2htmltext(e) for e in self.article.iter("math")]
+
+    @cached_property
+    def _extraction(self):
+        return extract_identifiers(lambda: self.math_html_list)
+
+    @property
+    def identifiers(self) -> IdentifierRegistry:
+        return self._extraction[0]
+
+    @property
+    def replaced_string_list(self) -> List[tuple]:
+        return self._extraction[1]
+
+    @cached_property
+    def masker(self) -> Masker:
+        return Masker(self.replaced_string_list)
+
+    @cached_property
+    def _masking(self):
+        with span("mask_identifiers"):
+            return self.masker.mask(self.original_html)
+
+    @property
+    def masked_html(self) -> str:
+        return self._masking[0]
+
+    @property
+    def offset_map(self) -> OffsetMap:
+        """positions in masked_html -> positions in original_html."""
+        return self._masking[1]
+
+    def _masked_parts(self, part_list) -> List[str]:
+        """return the masked serializations of elements of the article given in
+        document order, cut from masked_html instead of masking them again."""
+        masked_list = []
+        pos = 0
+        for part_ in part_list:
+            start = self.original_html.find(part_, pos)
+            if start < 0:
+                # the serialization of an element is expected to be a part of
+                # that of the article
+                masked_list.append(self.masker.mask(part_)[0])
+                continue
+            end = start + len(part_)
+            masked_start = self.offset_map.to_masked(start)
+            masked_end = self.offset_map.to_masked(end, end=True)
+            masked_list.append(self.masked_html[masked_start:masked_end])
+            pos = end
+        return masked_list
+
+    @cached_property
+    def text(self) -> str:
+        """the text of the masked article, with runs of newlines collapsed.
+
+        Masking only rewrites the content of <math>, so the text outside of
+        them is taken from the tree and only the masked <math> are parsed.
+        """
+        math_text_list = []
+        for e_math_, math_html_, math_html_masked_ in zip(
+            self.article.iter("math"),
+            self.math_html_list,
+            self._masked_parts(self.math_html_list),
+        ):
+            if math_html_masked_ == math_html_:
+                math_text_list.append(e_math_.text_content())
+            else:
+                e_math_masked = lxml.html.fromstring(math_html_masked_)
+                math_text_list.append(e_math_masked.text_content())
+        math_text_iter = iter(math_text_list)
+        text = "".join(_iter_text(self.article, math_text_iter))
+        return re.sub(r"\n+", r"\n", text)
+
+    @cached_property
+    def sentences(self) -> List[str]:
+        return sentence_segmentation(self.text)
+
+    @cached_property
+    def blocks(self):
+        """the outermost blocks of the article, masked and original.
+
+        Returns:
+            tuple: (masked blocks, original blocks) of the same index, or the
+                whole articles when the article has no block element.
+        """
+        with span("split_blocks"):
+            block_original_list = [
+                e2htmltext(e) for e in iter_block_elements(self.article)
+            ]
+            if not block_original_list:
+                return [self.masked_html], [self.original_html]
+            block_masked_list = self._masked_parts(block_original_list)
+        return block_masked_list, block_original_list
+
+
+def _iter_text(e, math_text_iter):
+    # the same text as `text_content()`, with the text of each <math> taken
+    # from math_text_iter in document order
+    if e.tag == "math":
+        yield next(math_text_iter)
+        return
+    if isinstance(e, lxml.html.HtmlElement) and e.text:
+        yield e.text
+    for e_child in e:
+        yield from _iter_text(e_child, math_text_iter)
+        if e_child.tail:
+            yield e_child.tail
@@ -0,0 +1,112 @@
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+logger = logging.getLogger("varat.perf")
+
+# "1" traces the peak memory of the spans with tracemalloc, which slows the
+# code down; only meaningful when one thread runs the pipeline.
+TRACE_MEMORY = os.environ.get("VARAT_TRACE_MEMORY", "") == "1"
+# file to which the records are written as JSON lines, "-" for stderr
+PERF_LOG = os.environ.get("VARAT_PERF_LOG", "")
+
+_local = threading.local()
+_collector = contextvars.ContextVar("varat_perf_collector", default=None)
+
+
+def _span_stack() -> list:
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+def configure_perf_log(path: str) -> None:
+    """write the records of the spans to path as JSON lines ("-" for stderr)."""
+    handler = (
+        logging.StreamHandler(sys.stderr) if path == "-" else logging.FileHandler(path)
+    )
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+
+def set_trace_memory(enabled: bool) -> None:
+    global TRACE_MEMORY
+    TRACE_MEMORY = enabled
+
+
+@contextmanager
+def span(name: str, **fields):
+    """measure the time, and the peak memory if TRACE_MEMORY, of the block.
+
+    The record is logged by the "varat.perf" logger as JSON and added to the
+    list of the enclosing `collect`. Spans can be nested; the record names the
+    parent span.
+
+    Args:
+        name (str): name of the stage, e.g. "extract_symbols".
+        **fields: added to the record, e.g. symbol_type="serial".
+    """
+    stack = _span_stack()
+    record = {"span": name, "parent": stack[-1]["span"] if stack else None}
+    record.update(fields)
+    trace_memory = TRACE_MEMORY
+    if trace_memory:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            record["_started_tracing"] = True
+        current, peak = tracemalloc.get_traced_memory()
+        # the peak before this span is kept by the parent
+        if stack:
+            stack[-1]["_peak"] = max(stack[-1].get("_peak", 0), peak)
+        tracemalloc.reset_peak()
+        record["_start_memory"] = current
+    stack.append(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = time.perf_counter() - start
+        stack.pop()
+        if trace_memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(record.pop("_peak", 0), peak)
+            record["peak_mib"] = (peak - record.pop("_start_memory")) / 2**20
+            if stack:
+                stack[-1]["_peak"] = max(stack[-1].get("_peak", 0), peak)
+            if record.pop("_started_tracing", False):
+                tracemalloc.stop()
+        _emit(record)
+
+
+def _emit(record: dict) -> None:
+    collector = _collector.get()
+    if collector is not None:
+        collector.append(record)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(record, default=str))
+
+
+@contextmanager
+def collect():
+    """collect the records of the spans which end in the block.
+
+    Yields:
+        list: the records, in the order the spans end.
+    """
+    record_list = []
+    token = _collector.set(record_list)
+    try:
+        yield record_list
+    finally:
+        _collector.reset(token)
+
+
+if PERF_LOG:
+    configure_perf_log(PERF_LOG)
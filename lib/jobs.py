@@ -0,0 +1,191 @@
+import heapq
+import os
+import threading
+import time
+import traceback
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+@dataclass
+class Job:
+    key: str
+    # run after the other jobs, e.g. prefetching a paper nobody waits for yet
+    background: bool = False
+    status: str = QUEUED
+    # name of the step being run, reported by the function of the job
+    stage: str = ""
+    # fraction of the steps finished, reported by the function of the job
+    progress: float = 0.0
+    result: object = None
+    error: Optional[Exception] = None
+    error_traceback: str = ""
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def is_active(self) -> bool:
+        return self.status in (QUEUED, RUNNING)
+
+    @property
+    def seconds(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def report(self, stage: str, progress: float = None) -> None:
+        """record the step being run; passed to the function of the job."""
+        self.stage = stage
+        if progress is not None:
+            self.progress = progress
+
+
+class JobQueue:
+    """pool of threads running the jobs submitted by the annotation tool.
+
+    A job is identified by its key (e.g. the paper folder): a key is run once
+    at a time, and the last job of each key is kept so that its status can be
+    shown after it has finished. The functions of the jobs should be safe to
+    run in threads; the long steps (latexmlc) are subprocesses.
+
+    The jobs waited for by a page are run before the background ones (e.g.
+    prefetching the next papers), and one worker is kept for them: at most
+    max_workers - 1 background jobs run at once, unless there is one worker.
+
+    Args:
+        max_workers (int): number of jobs run concurrently.
+    """
+
+    def __init__(self, max_workers: int = 2):
+        if max_workers < 1:
+            raise ValueError(f"number of workers should be positive: {max_workers}")
+        self.max_workers = max_workers
+        self.max_background_workers = max(max_workers - 1, 1)
+        self._job_dict: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        # heap of (priority, order of submission, job, fn, args, kwargs)
+        self._pending = []
+        self._n_submitted = 0
+        self._n_background_running = 0
+        for i in range(max_workers):
+            threading.Thread(
+                target=self._work, name=f"varat-job-{i}", daemon=True
+            ).start()
+
+    def submit(
+        self,
+        key: str,
+        fn,
+        *args,
+        retry: bool = False,
+        background: bool = False,
+        **kwargs,
+    ) -> Job:
+        """run fn(*args, report=job.report, **kwargs) in the background.
+
+        Args:
+            key (str): a job of the same key which is queued or running is
+                returned instead of submitting a new one; a queued background
+                job is moved to the foreground if submitted again with
+                background False.
+            retry (bool): submit again if the last job of the key failed;
+                otherwise the failed job is returned.
+            background (bool): run after the foreground jobs, on at most
+                max_background_workers workers.
+
+        Returns:
+            Job:
+        """
+        with self._condition:
+            job = self._job_dict.get(key)
+            if job is not None and (
+                job.is_active or (job.status == FAILED and not retry)
+            ):
+                if job.status == QUEUED and job.background and not background:
+                    job.background = False
+                    self._push(job, fn, args, kwargs)
+                return job
+            job = Job(key, background=background)
+            self._job_dict[key] = job
+            self._push(job, fn, args, kwargs)
+        return job
+
+    def _push(self, job: Job, fn, args, kwargs):
+        # the lock is held
+        self._n_submitted += 1
+        heapq.heappush(
+            self._pending,
+            (job.background, self._n_submitted, job, fn, args, kwargs),
+        )
+        self._condition.notify()
+
+    def _next_task(self):
+        """wait for the next job which may start and mark it running."""
+        with self._condition:
+            while True:
+                # an entry of a job already started (moved to the foreground)
+                while self._pending and self._pending[0][2].status != QUEUED:
+                    heapq.heappop(self._pending)
+                if self._pending and (
+                    not self._pending[0][2].background
+                    or self._n_background_running < self.max_background_workers
+                ):
+                    _, _, job, fn, args, kwargs = heapq.heappop(self._pending)
+                    job.status = RUNNING
+                    self._n_background_running += job.background
+                    return job, fn, args, kwargs
+                self._condition.wait()
+
+    def _work(self):
+        while True:
+            job, fn, args, kwargs = self._next_task()
+            self._run(job, fn, args, kwargs)
+            with self._condition:
+                self._n_background_running -= job.background
+                self._condition.notify_all()
+
+    def _run(self, job: Job, fn, args, kwargs):
+        job.started_at = time.time()
+        try:
+            job.result = fn(*args, report=job.report, **kwargs)
+            job.progress = 1.0
+            job.status = DONE
+        except Exception as e:
+            job.error = e
+            job.error_traceback = traceback.format_exc()
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+
+    def get(self, key: str) -> Optional[Job]:
+        with self._lock:
+            return self._job_dict.get(key)
+
+    def jobs(self) -> List[Job]:
+        """return the last job of each key in the order of submission."""
+        with self._lock:
+            return sorted(self._job_dict.values(), key=lambda j_: j_.submitted_at)
+
+    def n_active(self) -> int:
+        return sum(job_.is_active for job_ in self.jobs())
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """return the process-wide queue, shared by all sessions of the tool."""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            max_workers = int(os.environ.get("VARAT_JOB_WORKERS", "2"))
+            _job_queue = JobQueue(max_workers)
+        return _job_queue
@@ -0,0 +1,158 @@
+import re
+from bisect import bisect_right
+from typing import List, Tuple
+
+MASK_PATTERN = re.compile(r"MATH_[0-9]{4}")
+
+
+def _trie_regex(word_list) -> str:
+    """return a regex matching the longest word at a position.
+
+    The words are merged into a trie so that the regex engine walks over
+    shared prefixes once instead of trying every word in turn.
+    """
+    trie = {}
+    for word_ in word_list:
+        node = trie
+        for ch in word_:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def to_regex(node) -> str:
+        # follow chains of single children without creating groups
+        prefix = ""
+        while len(node) == 1 and "" not in node:
+            ch, node = next(iter(node.items()))
+            prefix += re.escape(ch)
+        branch_list = [
+            re.escape(ch) + to_regex(child)
+            for ch, child in sorted(node.items())
+            if ch != ""
+        ]
+        if not branch_list:
+            return prefix
+        body = "(?:" + "|".join(branch_list) + ")"
+        # the greedy "?" tries the longer words first
+        return prefix + (body + "?" if "" in node else body)
+
+    return to_regex(trie)
+
+
+class OffsetMap:
+    """correspondence between the positions in the masked and the original text.
+
+    Each substitution is stored as a pair of spans. Positions outside the
+    spans are shifted by the length difference accumulated before them.
+    """
+
+    def __init__(self):
+        self.masked_starts: List[int] = []
+        self.masked_ends: List[int] = []
+        self.original_starts: List[int] = []
+        self.original_ends: List[int] = []
+
+    def __len__(self):
+        return len(self.masked_starts)
+
+    def add(self, masked_span: Tuple[int, int], original_span: Tuple[int, int]):
+        self.masked_starts.append(masked_span[0])
+        self.masked_ends.append(masked_span[1])
+        self.original_starts.append(original_span[0])
+        self.original_ends.append(original_span[1])
+
+    @staticmethod
+    def _convert(pos, starts, ends, other_starts, other_ends, end):
+        i = bisect_right(starts, pos) - 1
+        if i < 0:
+            return pos
+        if pos < ends[i] or (end and pos == ends[i] and pos > starts[i]):
+            # inside a substituted span
+            return other_ends[i] if end else other_starts[i]
+        return other_ends[i] + (pos - ends[i])
+
+    def to_original(self, pos: int, end: bool = False) -> int:
+        """return the position in the original text.
+
+        Args:
+            pos (int): position in the masked text.
+            end (bool): whether `pos` is the exclusive end of a span. A
+                position inside a mask is mapped to the end of the original
+                string instead of its start.
+        """
+        return self._convert(
+            pos,
+            self.masked_starts,
+            self.masked_ends,
+            self.original_starts,
+            self.original_ends,
+            end,
+        )
+
+    def to_masked(self, pos: int, end: bool = False) -> int:
+        return self._convert(
+            pos,
+            self.original_starts,
+            self.original_ends,
+            self.masked_starts,
+            self.masked_ends,
+            end,
+        )
+
+    def original_span(self, start: int, end: int) -> Tuple[int, int]:
+        return self.to_original(start), self.to_original(end, end=True)
+
+
+class Masker:
+    """replace the identifiers in a text with their masks in one pass.
+
+    At each position the longest identifier is replaced, so an identifier which
+    is a part of a longer one (e.g. `<mi>E</mi>` in `<msub><mi>E</mi>...`) never
+    breaks the longer match.
+
+    Args:
+        replaced_string_list (list): (text_tex, text_html, mask) tuples
+            returned by `extract_symbols`.
+    """
+
+    def __init__(self, replaced_string_list):
+        self.html_to_mask = {}
+        self.mask_to_html = {}
+        for _, html_, mask_ in replaced_string_list:
+            if html_ and html_ not in self.html_to_mask:
+                self.html_to_mask[html_] = mask_
+            self.mask_to_html.setdefault(mask_, html_)
+        if self.html_to_mask:
+            self.pattern = re.compile(_trie_regex(self.html_to_mask))
+        else:
+            self.pattern = None
+
+    def mask(self, text: str) -> Tuple[str, OffsetMap]:
+        """return the masked text and the offset map to the input text."""
+        offset_map = OffsetMap()
+        if self.pattern is None:
+            return text, offset_map
+
+        chunk_list = []
+        pos_original = 0
+        pos_masked = 0
+        for m_ in self.pattern.finditer(text):
+            start, end = m_.span()
+            mask_ = self.html_to_mask[m_.group()]
+            chunk_list.append(text[pos_original:start])
+            pos_masked += start - pos_original
+            chunk_list.append(mask_)
+            offset_map.add((pos_masked, pos_masked + len(mask_)), (start, end))
+            pos_masked += len(mask_)
+            pos_original = end
+        chunk_list.append(text[pos_original:])
+        return "".join(chunk_list), offset_map
+
+    def unmask(self, masked_text: str) -> str:
+        """restore the identifiers in a masked text."""
+        return MASK_PATTERN.sub(
+            lambda m_: self.mask_to_html.get(m_.group(), m_.group()), masked_text
+        )
+
+
+def mask_identifiers(text: str, replaced_string_list) -> Tuple[str, OffsetMap]:
+    return Masker(replaced_string_list).mask(text)
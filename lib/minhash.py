@@ -0,0 +1,183 @@
+import re
+import zlib
+from typing import List, Tuple
+
+import numpy as np
+
+# Mersenne prime larger than the shingle hashes reduced below; a * x + b stays
+# below 2**63 for a, b, x < 2**31.
+MERSENNE_PRIME = (1 << 31) - 1
+# definitions hashed at once, bounding the (num_perm, shingles) array
+SIGNATURE_CHUNK_SIZE = 4096
+# case-sensitive, so that an identifier such as "A" in "concentration of A" stays
+_ARTICLE_PATTERN = re.compile(r"\b(?:[Tt]he|[Aa]n|a)\b")
+_NON_WORD_PATTERN = re.compile(r"[^\w]+")
+
+
+def normalize_text(text: str) -> str:
+    """drop the articles and the punctuation and lowercase the text."""
+    text = _ARTICLE_PATTERN.sub(" ", text).lower()
+    return " ".join(_NON_WORD_PATTERN.sub(" ", text).split())
+
+
+def key_tokens(text: str) -> frozenset:
+    """return the tokens of the normalized text which name something, i.e. the
+    single characters and the words with a digit or an underscore (e.g. "t_r").
+
+    Two texts differing by such a token, e.g. "concentration of A" and
+    "concentration of B", are not near-duplicates however close the shingles.
+    """
+    return frozenset(
+        t_
+        for t_ in normalize_text(text).split()
+        if len(t_) == 1 or "_" in t_ or any(c_.isdigit() for c_ in t_)
+    )
+
+
+def shingles(text: str, k: int = 3) -> np.ndarray:
+    """return the crc32 hashes of the character k-grams of the normalized text.
+
+    Returns:
+        ndarray: unique uint32 hashes; a text shorter than k is one shingle.
+    """
+    text = normalize_text(text)
+    if not text:
+        return np.zeros(0, dtype=np.uint32)
+    gram_set = {text[i : i + k] for i in range(max(len(text) - k + 1, 1))}
+    return np.array([zlib.crc32(g_.encode()) for g_ in gram_set], dtype=np.uint32)
+
+
+def minhash_signatures(
+    shingle_list: List[np.ndarray], num_perm: int = 128, seed: int = 0
+) -> np.ndarray:
+    """return the MinHash signatures of the shingle sets.
+
+    Each of the num_perm permutations is the universal hash (a * x + b) mod p.
+    An empty set has the signature p, which equals no other.
+
+    Returns:
+        ndarray: (len(shingle_list), num_perm) uint64 array.
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+    signatures = np.full((len(shingle_list), num_perm), MERSENNE_PRIME, dtype=np.uint64)
+    for start in range(0, len(shingle_list), SIGNATURE_CHUNK_SIZE):
+        chunk = shingle_list[start : start + SIGNATURE_CHUNK_SIZE]
+        length = np.array([len(s_) for s_ in chunk])
+        non_empty = np.flatnonzero(length)
+        if len(non_empty) == 0:
+            continue
+        x = np.concatenate([chunk[i] for i in non_empty]).astype(np.uint64)
+        x %= MERSENNE_PRIME
+        hashed = (a[:, None] * x[None, :] + b[:, None]) % MERSENNE_PRIME
+        offset = np.concatenate([[0], np.cumsum(length[non_empty])[:-1]])
+        signatures[start + non_empty] = np.minimum.reduceat(hashed, offset, axis=1).T
+    return signatures
+
+
+def choose_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """return the (bands, rows) with bands * rows == num_perm whose S-curve
+    threshold (1 / bands) ** (1 / rows) is the closest to threshold."""
+    return min(
+        ((b_, num_perm // b_) for b_ in range(1, num_perm + 1) if num_perm % b_ == 0),
+        key=lambda br_: abs((1 / br_[0]) ** (1 / br_[1]) - threshold),
+    )
+
+
+def lsh_candidate_pairs(signatures: np.ndarray, bands: int) -> set:
+    """return the pairs of rows whose signatures are equal in at least one band.
+
+    Returns:
+        set: (i, j) tuples with i < j.
+    """
+    num_perm = signatures.shape[1]
+    rows = num_perm // bands
+    pair_set = set()
+    for band_ in range(bands):
+        bucket_dict = {}
+        band_signatures = np.ascontiguousarray(
+            signatures[:, band_ * rows : (band_ + 1) * rows]
+        )
+        for i, key_ in enumerate(band_signatures):
+            # an empty set is similar to nothing
+            if key_[0] == MERSENNE_PRIME:
+                continue
+            bucket_dict.setdefault(key_.tobytes(), []).append(i)
+        for bucket_ in bucket_dict.values():
+            for j, i in enumerate(bucket_):
+                pair_set.update((i, k_) for k_ in bucket_[j + 1 :])
+    return pair_set
+
+
+def jaccard(x: np.ndarray, y: np.ndarray) -> float:
+    if len(x) == 0 or len(y) == 0:
+        return 0.0
+    n_common = len(np.intersect1d(x, y, assume_unique=True))
+    return n_common / (len(x) + len(y) - n_common)
+
+
+class UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, i: int) -> int:
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        # path compression
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+        return root
+
+    def union(self, i: int, j: int) -> None:
+        root_i, root_j = self.find(i), self.find(j)
+        # the smaller index is the root, so a group is named by its first row
+        if root_i < root_j:
+            self.parent[root_j] = root_i
+        elif root_j < root_i:
+            self.parent[root_i] = root_j
+
+
+def cluster_texts(
+    text_list,
+    threshold: float = 0.6,
+    num_perm: int = 128,
+    k: int = 3,
+    bands: int = None,
+    seed: int = 0,
+) -> np.ndarray:
+    """group the near-duplicate texts.
+
+    The pairs sharing a band of their MinHash signatures are the candidates;
+    those with the same key tokens (`key_tokens`) and whose Jaccard similarity
+    of the shingles is at least threshold are joined, and the groups are the
+    connected components. The cost is linear in the number of texts except for
+    the candidate pairs.
+
+    Args:
+        text_list (list): e.g. the definitions of the dictionary.
+        threshold (float): minimum Jaccard similarity of a joined pair.
+        num_perm (int): length of the signatures.
+        k (int): length of the character shingles.
+        bands (int, optional): defaults to the number of bands whose LSH
+            threshold is the closest to threshold; more bands find more pairs.
+        seed (int): seed of the permutations.
+
+    Returns:
+        ndarray: for each text, the index of the first text of its group.
+    """
+    shingle_list = [shingles(t_, k) for t_ in text_list]
+    key_list = [key_tokens(t_) for t_ in text_list]
+    signatures = minhash_signatures(shingle_list, num_perm, seed)
+    if bands is None:
+        bands, _ = choose_bands(num_perm, threshold)
+    union_find = UnionFind(len(text_list))
+    for i, j in lsh_candidate_pairs(signatures, bands):
+        if union_find.find(i) == union_find.find(j):
+            continue
+        if key_list[i] != key_list[j]:
+            continue
+        if jaccard(shingle_list[i], shingle_list[j]) >= threshold:
+            union_find.union(i, j)
+    return np.array([union_find.find(i) for i in range(len(text_list))], dtype=int)
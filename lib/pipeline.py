@@ -0,0 +1,178 @@
+import hashlib
+import pathlib
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from lib.cache import CACHE_DIRNAME, ArtifactCache
+from lib.candidate import score_candidates
+from lib.document import Document
+from lib.instrument import span
+from lib.masking import MASK_PATTERN, OffsetMap
+from lib.render import index_blocks
+from lib.segmenter import get_segmenter
+from lib.xmldoc_child import IdentifierRegistry
+
+# Bump this when the artifacts change in a way the source fingerprint cannot
+# detect (e.g. a dependency upgrade changing the sentence segmentation).
+PIPELINE_VERSION = 1
+
+# modules whose source code determines the content of the artifacts
+_PIPELINE_SOURCES = [
+    "util.py",
+    "segmenter.py",
+    "document.py",
+    "xmldoc_child.py",
+    "masking.py",
+    "candidate.py",
+    "render.py",
+    "pipeline.py",
+]
+
+
+@dataclass
+class DocumentArtifacts:
+    identifiers: IdentifierRegistry = field(default_factory=IdentifierRegistry)
+    replaced_string_list: List[tuple] = field(default_factory=list)
+    article_original_html: str = ""
+    article_masked_html: str = ""
+    # positions in article_masked_html -> positions in article_original_html
+    offset_map: OffsetMap = field(default_factory=OffsetMap)
+    text: str = ""
+    sentences: List[str] = field(default_factory=list)
+    # mask (MATH_xxxx) -> indices of the sentences containing it
+    sentence_index: Dict[str, List[int]] = field(default_factory=dict)
+    # blocks (paragraphs, headings, equations) of the articles for windowed rendering
+    blocks_masked: List[str] = field(default_factory=list)
+    blocks_original: List[str] = field(default_factory=list)
+    # mask (MATH_xxxx) -> indices of the blocks containing it
+    block_index: Dict[str, List[int]] = field(default_factory=dict)
+
+
+def pipeline_fingerprint() -> str:
+    h = hashlib.sha256(str(PIPELINE_VERSION).encode())
+    # the sentences depend on the segmenter chosen for this process
+    h.update(get_segmenter().name.encode())
+    lib_path = pathlib.Path(__file__).parent
+    for source_ in _PIPELINE_SOURCES:
+        h.update((lib_path / source_).read_bytes())
+    return h.hexdigest()
+
+
+def index_sentences(identifier_registry, sentence_list) -> Dict[str, List[int]]:
+    """scan the masked sentences once and return the sentences containing each
+    identifier.
+
+    The sentences are also interned in the sentence table of the registry and
+    linked to the identifiers by `Identifier.sentence_ids`.
+
+    Returns:
+        dict: mask (MATH_xxxx) -> indices of the sentences in sentence_list.
+    """
+    sentence_index = {}
+    for i, sentence_ in enumerate(sentence_list):
+        sentence_id = identifier_registry.sentences.intern(sentence_)
+        for mask_ in dict.fromkeys(MASK_PATTERN.findall(sentence_)):
+            sentence_index.setdefault(mask_, []).append(i)
+            identifier_number = int(mask_[len("MATH_") :])
+            if identifier_number < len(identifier_registry):
+                sentence_id_list = identifier_registry[identifier_number].sentence_ids
+                if sentence_id not in sentence_id_list[-1:]:
+                    sentence_id_list.append(sentence_id)
+    return sentence_index
+
+
+def build_artifacts(doc_processed_path) -> DocumentArtifacts:
+    """extract the identifiers from the preprocessed html, mask them and segment
+    the masked text into sentences.
+
+    Args:
+        doc_processed_path (Path): path to `*_preprocessed.html`.
+
+    Returns:
+        DocumentArtifacts: everything the annotation tool needs to show the document.
+    """
+    document = Document(doc_processed_path)
+    symbol_list = document.identifiers
+    sentence_list = document.sentences
+    sentence_index = index_sentences(symbol_list, sentence_list)
+    with span("score_candidates"):
+        score_candidates(symbol_list, sentence_list)
+    blocks_masked, blocks_original = document.blocks
+
+    return DocumentArtifacts(
+        identifiers=symbol_list,
+        replaced_string_list=document.replaced_string_list,
+        article_original_html=document.original_html,
+        article_masked_html=document.masked_html,
+        offset_map=document.offset_map,
+        text=document.text,
+        sentences=sentence_list,
+        sentence_index=sentence_index,
+        blocks_masked=blocks_masked,
+        blocks_original=blocks_original,
+        block_index=index_blocks(blocks_masked),
+    )
+
+
+def _artifact_cache(doc_processed_path, cache_dir=None) -> ArtifactCache:
+    if cache_dir is None:
+        cache_dir = pathlib.Path(doc_processed_path).parent / CACHE_DIRNAME
+    return ArtifactCache(cache_dir, pipeline_fingerprint())
+
+
+def has_artifacts(doc_processed_path, cache_dir=None) -> bool:
+    """return whether the artifacts of the current document are already cached."""
+    cache = _artifact_cache(doc_processed_path, cache_dir)
+    return cache.key(doc_processed_path) in cache
+
+
+def load_artifacts(doc_processed_path, cache_dir=None) -> DocumentArtifacts:
+    """return the artifacts of the document, building them only when the
+    preprocessed html or the pipeline code has changed since the last build.
+
+    Args:
+        doc_processed_path (Path): path to `*_preprocessed.html`.
+        cache_dir (Path, optional): defaults to a hidden folder next to the document.
+    """
+    cache = _artifact_cache(doc_processed_path, cache_dir)
+    key = cache.key(doc_processed_path)
+
+    document = pathlib.Path(doc_processed_path).name
+    with span("load_artifacts", document=document) as record:
+        artifacts = cache.load(key)
+        record["cache_hit"] = artifacts is not None
+        if artifacts is None:
+            with span("build_artifacts"):
+                artifacts = build_artifacts(doc_processed_path)
+            cache.store(key, artifacts)
+    return artifacts
+
+
+def write_document_files(
+    paper_dir, artifacts: DocumentArtifacts, overwrite: bool = False
+) -> None:
+    """save the text, the sentences and the masked article of the paper.
+
+    Args:
+        overwrite (bool): rewrite the files which already exist, e.g. when the
+            artifacts have just been built from a changed document; otherwise
+            only the missing files are written.
+    """
+    paper_dir = pathlib.Path(paper_dir)
+    paper = paper_dir.name
+
+    doc_text_path = paper_dir / (paper + "_article.txt")
+    if overwrite or not doc_text_path.is_file():
+        with open(doc_text_path, "w") as f:
+            f.write(artifacts.text)
+
+    doc_article_sentence_path = paper_dir / (paper + "_article_sentence.txt")
+    if overwrite or not doc_article_sentence_path.is_file():
+        with open(doc_article_sentence_path, "w") as f:
+            for i, s_ in enumerate(artifacts.sentences):
+                f.write(f"{i}\t{s_}\n")
+
+    doc_article_masked_path = paper_dir / (paper + "_article_masked.html")
+    if overwrite or not doc_article_masked_path.is_file():
+        with open(doc_article_masked_path, "w") as f:
+            f.write(artifacts.article_masked_html)
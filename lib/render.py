@@ -0,0 +1,108 @@
+from typing import Dict, List
+
+import lxml.html
+
+from lib.masking import MASK_PATTERN
+from lib.util import e2htmltext
+
+# elements rendered as a unit; nested ones belong to the outermost block
+BLOCK_TAG_LIST = [
+    "p",
+    "h1",
+    "h2",
+    "h3",
+    "h4",
+    "h5",
+    "h6",
+    "table",
+    "figure",
+    "li",
+    "blockquote",
+    "pre",
+]
+HIGHLIGHT_STYLE = "background-color: #ffeb3b;"
+BLOCK_SEPARATOR = "<hr>"
+
+
+def iter_block_elements(root):
+    """yield the outermost block elements under root in document order."""
+    block_tag_set = set(BLOCK_TAG_LIST)
+    for e in root.iter(*BLOCK_TAG_LIST):
+        if any(a.tag in block_tag_set for a in e.iterancestors()):
+            continue
+        yield e
+
+
+def index_blocks(block_list) -> Dict[str, List[int]]:
+    """return the blocks containing each mask (MATH_xxxx)."""
+    block_index = {}
+    for i, block_ in enumerate(block_list):
+        for mask_ in dict.fromkeys(MASK_PATTERN.findall(block_)):
+            block_index.setdefault(mask_, []).append(i)
+    return block_index
+
+
+def window_block_ids(
+    block_index, n_blocks: int, mask: str, n_occurrence: int, context: int = 1
+):
+    """return the blocks of the first n_occurrence blocks containing the mask,
+    with `context` blocks before and after each of them.
+
+    Args:
+        block_index (dict): returned by `index_blocks`.
+        n_blocks (int): number of blocks, which bounds the ids.
+
+    Returns:
+        list: sorted block ids.
+    """
+    block_id_set = set()
+    for i in block_index.get(mask, [])[:n_occurrence]:
+        block_id_set.update(range(max(i - context, 0), min(i + context + 1, n_blocks)))
+    return sorted(block_id_set)
+
+
+def _highlight(block_html: str, math_id_set=None, mask: str = None):
+    """set HIGHLIGHT_STYLE on the <math> elements containing the mask or having
+    an id in math_id_set.
+
+    Returns:
+        tuple: (html of the block, set of the ids of the highlighted elements).
+    """
+    e_block = lxml.html.fromstring(block_html)
+    highlighted_id_set = set()
+    for e_math in e_block.iter("math"):
+        if mask is not None:
+            matched = mask in e_math.text_content()
+        else:
+            matched = e_math.get("id") in math_id_set
+        if matched:
+            e_math.set("style", HIGHLIGHT_STYLE)
+            highlighted_id_set.add(e_math.get("id"))
+    if not highlighted_id_set:
+        return block_html, highlighted_id_set
+    return e2htmltext(e_block), highlighted_id_set
+
+
+def render_window(
+    block_masked_list, block_original_list, block_id_list, mask: str
+) -> tuple:
+    """join the blocks of the window, highlighting the identifier.
+
+    The same formulae are highlighted in the original blocks, found by the id
+    of <math>. Gaps between the blocks are shown by BLOCK_SEPARATOR.
+
+    Returns:
+        tuple: (masked html, original html).
+    """
+    masked_list, original_list = [], []
+    previous_id = None
+    for i in block_id_list:
+        if previous_id is not None and i != previous_id + 1:
+            masked_list.append(BLOCK_SEPARATOR)
+            original_list.append(BLOCK_SEPARATOR)
+        previous_id = i
+        masked_html, math_id_set = _highlight(block_masked_list[i], mask=mask)
+        original_html, _ = _highlight(block_original_list[i], math_id_set=math_id_set)
+        masked_list.append(masked_html)
+        original_list.append(original_html)
+    return "\n".join(masked_list), "\n".join(original_list)
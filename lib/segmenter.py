@@ -0,0 +1,246 @@
+import abc
+import os
+import queue
+import re
+import threading
+from contextlib import contextmanager
+
+from lib.instrument import span
+
+# words ending with a period which does not end the sentence, in lowercase
+# and without the period, e.g. "Eq. (1)", "et al. (2010)", "i.e."
+ABBREVIATION_SET = frozenset(
+    """
+    e.g i.e cf vs viz al approx resp ca
+    fig figs eq eqs ref refs sec secs tab tabs chap ch app
+    no nos vol vols pp ed eds dr mr ms prof st
+    """.split()
+)
+# a sentence-final mark, the closing quotes or brackets after it, and the space
+_FINAL_PATTERN = re.compile(r"[.!?][\"')\]]*(?=\s)")
+_EQUATION_NUMBER_PATTERN = re.compile(r"\(\d+[a-z]?\)")
+_MASK_START_PATTERN = re.compile(r"MATH_\d")
+_SPACE_PATTERN = re.compile(r"\s*")
+# lines ending with these continue on the next line, e.g. "as follows:"
+_CONTINUED_LINE_ENDINGS = tuple(",:;=+-−([")
+
+
+class Segmenter(abc.ABC):
+    """splits the masked text of a document into sentences.
+
+    Subclasses implement `segment_many`; `name` is part of the fingerprint of
+    the cached artifacts, since the sentences depend on the segmenter.
+    """
+
+    name = ""
+
+    @abc.abstractmethod
+    def segment_many(self, texts, batch_size: int = 32):
+        """return the sentence list of each text; a sentence has no newline."""
+
+    def segment(self, text):
+        return self.segment_many([text])[0]
+
+
+class TokenizerPool:
+    """process-wide pool of stanza tokenize pipelines.
+
+    Pipelines are created lazily on the first request, so loading the model is
+    paid once per process instead of once per call.
+
+    Args:
+        size (int): maximum number of pipelines used concurrently.
+    """
+
+    def __init__(self, size: int = 1):
+        if size < 1:
+            raise ValueError(f"pool size should be positive: {size}")
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._n_created = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self):
+        try:
+            nlp = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._n_created < self.size
+                if create:
+                    self._n_created += 1
+            if create:
+                import stanza
+
+                try:
+                    nlp = stanza.Pipeline(lang="en", processors="tokenize")
+                except BaseException:
+                    with self._lock:
+                        self._n_created -= 1
+                    raise
+            else:
+                nlp = self._idle.get()
+        try:
+            yield nlp
+        finally:
+            self._idle.put(nlp)
+
+
+_tokenizer_pool = None
+_tokenizer_pool_lock = threading.Lock()
+
+
+def get_tokenizer_pool() -> TokenizerPool:
+    global _tokenizer_pool
+    with _tokenizer_pool_lock:
+        if _tokenizer_pool is None:
+            size = int(os.environ.get("VARAT_TOKENIZER_POOL_SIZE", "1"))
+            _tokenizer_pool = TokenizerPool(size)
+        return _tokenizer_pool
+
+
+def configure_tokenizer_pool(size: int) -> TokenizerPool:
+    """replace the shared pool by a pool with `size` pipelines."""
+    global _tokenizer_pool
+    with _tokenizer_pool_lock:
+        _tokenizer_pool = TokenizerPool(size)
+        return _tokenizer_pool
+
+
+class StanzaSegmenter(Segmenter):
+    """segments with the tokenizer of stanza, shared through the TokenizerPool.
+
+    stanza is imported when the first pipeline is created, so the other
+    segmenters do not need it.
+    """
+
+    name = "stanza"
+
+    def segment_many(self, texts, batch_size: int = 32):
+        """segment the texts in batches with one pipeline of the pool.
+
+        The texts are passed to stanza as lists of documents so that they are
+        tokenized in batches.
+        """
+        import stanza
+
+        texts = list(texts)
+        sentence_lists = []
+        with span("segment", segmenter=self.name, n_texts=len(texts)), (
+            get_tokenizer_pool().acquire()
+        ) as nlp:
+            for i in range(0, len(texts), batch_size):
+                docs = nlp(
+                    [
+                        stanza.Document([], text=text_)
+                        for text_ in texts[i : i + batch_size]
+                    ]
+                )
+                for doc_ in docs:
+                    # Each sentence should not include a line change.
+                    sentence_lists.append(
+                        [s_.text.replace("\n", " ") for s_ in doc_.sentences]
+                    )
+        return sentence_lists
+
+
+class RuleSegmenter(Segmenter):
+    """segments with rules on the punctuation and the line breaks.
+
+    A sentence ends at ".", "!" or "?" followed by a space, unless the word
+    before is an abbreviation (ABBREVIATION_SET), or the text after starts in
+    lowercase or with an equation number such as "(1)". A line break ends a
+    sentence if the next line starts with a capitalized word (not MATH_xxxx)
+    and the line does not end with a mark continuing it, e.g. after a heading.
+    Displayed equations, whose lines are masks, operators and equation
+    numbers, thus stay in the sentence which introduces them.
+    """
+
+    name = "rule"
+
+    def segment_many(self, texts, batch_size: int = 32):
+        texts = list(texts)
+        with span("segment", segmenter=self.name, n_texts=len(texts)):
+            return [self._segment(text_) for text_ in texts]
+
+    def _segment(self, text: str):
+        boundary_list = []
+        for m in _FINAL_PATTERN.finditer(text):
+            if self._ends_sentence(text, m.start(), m.end()):
+                boundary_list.append(m.end())
+        for m in re.finditer(r"\n", text):
+            if self._breaks_sentence(text, m.start()):
+                boundary_list.append(m.start())
+
+        sentence_list = []
+        start = 0
+        for end in sorted(set(boundary_list)) + [len(text)]:
+            sentence = text[start:end].replace("\n", " ").strip()
+            if sentence:
+                sentence_list.append(sentence)
+            start = end
+        return sentence_list
+
+    @staticmethod
+    def _ends_sentence(text: str, mark_start: int, mark_end: int) -> bool:
+        following = _SPACE_PATTERN.match(text, mark_end).end()
+        if following == len(text):
+            return True
+        if text[following].islower() or _EQUATION_NUMBER_PATTERN.match(
+            text, following
+        ):
+            return False
+        if text[mark_start] == ".":
+            word_list = text[max(mark_start - 32, 0) : mark_start].split()
+            if word_list and word_list[-1].lstrip("([").lower() in ABBREVIATION_SET:
+                return False
+        return True
+
+    @staticmethod
+    def _breaks_sentence(text: str, newline: int) -> bool:
+        line = text[text.rfind("\n", 0, newline) + 1 : newline].rstrip()
+        following = _SPACE_PATTERN.match(text, newline + 1).end()
+        if not line or following == len(text):
+            return False
+        if line.endswith(_CONTINUED_LINE_ENDINGS):
+            return False
+        return text[following].isupper() and not _MASK_START_PATTERN.match(
+            text, following
+        )
+
+
+SEGMENTER_CLASSES = {
+    StanzaSegmenter.name: StanzaSegmenter,
+    RuleSegmenter.name: RuleSegmenter,
+}
+DEFAULT_SEGMENTER = StanzaSegmenter.name
+
+_segmenter = None
+_segmenter_lock = threading.Lock()
+
+
+def create_segmenter(name: str) -> Segmenter:
+    if name not in SEGMENTER_CLASSES:
+        raise ValueError(
+            f"unknown segmenter {name!r}: choose from {sorted(SEGMENTER_CLASSES)}"
+        )
+    return SEGMENTER_CLASSES[name]()
+
+
+def get_segmenter() -> Segmenter:
+    """return the shared segmenter, chosen by VARAT_SEGMENTER (default stanza)."""
+    global _segmenter
+    with _segmenter_lock:
+        if _segmenter is None:
+            _segmenter = create_segmenter(
+                os.environ.get("VARAT_SEGMENTER", DEFAULT_SEGMENTER)
+            )
+        return _segmenter
+
+
+def configure_segmenter(name: str) -> Segmenter:
+    """replace the shared segmenter by the segmenter named `name`."""
+    global _segmenter
+    with _segmenter_lock:
+        _segmenter = create_segmenter(name)
+        return _segmenter
@@ -0,0 +1,197 @@
+import os
+import pathlib
+import sqlite3
+from contextlib import closing, contextmanager
+
+import pandas as pd
+
+from lib.instrument import span
+from lib.segmenter import DEFAULT_SEGMENTER
+
+ANNOTATION_COLUMNS = [
+    "identifier_html",
+    "identifier_tex",
+    "definition_extracted",
+    "definition_true",
+    "extractable",
+    "sentence_number",
+    "sentence_with_definition",
+]
+
+
+class AnnotationStore:
+    """annotation table of a paper stored in SQLite.
+
+    Each row is keyed by its mask (MATH_xxxx) and saved with an upsert in its
+    own transaction, so a save does not rewrite the whole table. The database
+    is in WAL mode: readers are not blocked by a writer, and concurrent writers
+    wait for each other instead of overwriting each other's rows.
+
+    Args:
+        db_path (Path):
+        timeout (float): seconds to wait for the lock held by another writer.
+    """
+
+    def __init__(self, db_path, timeout: float = 30.0):
+        self.db_path = pathlib.Path(db_path)
+        self.timeout = timeout
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS annotation ("
+                "math_id TEXT PRIMARY KEY, "
+                + ", ".join(f"{column_} TEXT" for column_ in ANNOTATION_COLUMNS)
+                + ")"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        with closing(sqlite3.connect(self.db_path, timeout=self.timeout)) as conn:
+            # commit on success, rollback on an exception
+            with conn:
+                yield conn
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM annotation").fetchone()[0]
+
+    def upsert(self, math_id: str, values: dict):
+        """insert the row or update the given columns of it."""
+        self.upsert_many([(math_id, values)])
+
+    def upsert_many(self, row_list):
+        """upsert (math_id, values) rows in one transaction."""
+        with self._connect() as conn:
+            for math_id, values in row_list:
+                column_list = [c for c in ANNOTATION_COLUMNS if c in values]
+                if len(column_list) != len(values):
+                    raise KeyError(f"unknown column: {set(values) - set(column_list)}")
+                if not column_list:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO annotation (math_id) VALUES (?)",
+                        [math_id],
+                    )
+                    continue
+                assignment = ", ".join(f"{c} = excluded.{c}" for c in column_list)
+                conn.execute(
+                    f"INSERT INTO annotation (math_id, {', '.join(column_list)}) "
+                    f"VALUES ({', '.join('?' * (len(column_list) + 1))}) "
+                    f"ON CONFLICT(math_id) DO UPDATE SET {assignment}",
+                    [math_id] + [_to_sql_value(values[c]) for c in column_list],
+                )
+
+    def initialize(self, symbol_list):
+        """add a row for each identifier which is not in the table yet."""
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO annotation "
+                "(math_id, identifier_html, identifier_tex) VALUES (?, ?, ?)",
+                [
+                    (f"MATH_{i:04d}", symbol_.text_html, symbol_.text_tex)
+                    for i, symbol_ in enumerate(symbol_list)
+                ],
+            )
+
+    def check_segmenter(self, name: str) -> None:
+        """record the segmenter whose sentences `sentence_number` refers to, or
+        raise ValueError if the annotations were made with another one.
+
+        The annotations saved before the segmenter was recorded were made with
+        the sentences of the default segmenter.
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value FROM meta WHERE key = 'segmenter'"
+            ).fetchone()
+            if row is not None:
+                recorded = row[0]
+            else:
+                n_annotated = conn.execute(
+                    "SELECT COUNT(*) FROM annotation WHERE sentence_number IS NOT NULL"
+                ).fetchone()[0]
+                recorded = DEFAULT_SEGMENTER if n_annotated else name
+                conn.execute(
+                    "INSERT INTO meta (key, value) VALUES ('segmenter', ?)", [recorded]
+                )
+        if recorded != name:
+            raise ValueError(
+                f"the sentence numbers of {self.db_path.name} refer to the sentences "
+                f"of the {recorded!r} segmenter, not {name!r}: "
+                f"set VARAT_SEGMENTER={recorded} to annotate this paper"
+            )
+
+    def load_dataframe(self) -> pd.DataFrame:
+        """return the table in the same shape as `pd.read_excel(xlsx_path, index_col=0, dtype=str)`."""
+        with span("load_dataframe"), self._connect() as conn:
+            df = pd.read_sql_query(
+                "SELECT * FROM annotation ORDER BY math_id", conn, index_col="math_id"
+            )
+        df.index.name = None
+        return df[ANNOTATION_COLUMNS]
+
+    def import_xlsx(self, xlsx_path):
+        with span("read_excel", path=pathlib.Path(xlsx_path).name):
+            df = pd.read_excel(xlsx_path, index_col=0, dtype=str)
+        self.upsert_many(
+            (math_id_, {c: row_[c] for c in ANNOTATION_COLUMNS if c in row_})
+            for math_id_, row_ in df.iterrows()
+        )
+
+    def export_xlsx(self, xlsx_path):
+        df = self.load_dataframe()
+        with span("to_excel", path=pathlib.Path(xlsx_path).name):
+            df.to_excel(xlsx_path)
+
+
+def _to_sql_value(value):
+    # an empty cell is read back from an xlsx as NaN, so it is saved as NULL
+    if value is None or (isinstance(value, float) and pd.isna(value)) or value == "":
+        return None
+    return str(value)
+
+
+def annotation_paths(paper_dir) -> dict:
+    paper_dir = pathlib.Path(paper_dir)
+    paper = paper_dir.name
+    return {
+        "db": paper_dir / (paper + ".sqlite3"),
+        "xlsx": paper_dir / (paper + ".xlsx"),
+    }
+
+
+def open_annotation_store(paper_dir, symbol_list=None) -> AnnotationStore:
+    """open the store of the paper, importing the xlsx when the store is new."""
+    paths = annotation_paths(paper_dir)
+    is_new = not paths["db"].is_file()
+    store = AnnotationStore(paths["db"])
+    if is_new and paths["xlsx"].is_file():
+        store.import_xlsx(paths["xlsx"])
+    if symbol_list is not None and len(store) == 0:
+        store.initialize(symbol_list)
+    return store
+
+
+def read_annotations(paper_dir) -> pd.DataFrame:
+    """return the annotation table of the paper from the store, or from the
+    xlsx if the paper has no store."""
+    paths = annotation_paths(paper_dir)
+    if paths["db"].is_file():
+        return AnnotationStore(paths["db"]).load_dataframe()
+    with span("read_excel", path=paths["xlsx"].name):
+        return pd.read_excel(paths["xlsx"], index_col=0, dtype=str)
+
+
+def annotation_mtime(paper_dir) -> float:
+    """return the last modification time of the annotation of the paper."""
+    paths = annotation_paths(paper_dir)
+    if paths["db"].is_file():
+        # the -wal file holds the rows saved since the last checkpoint
+        return max(
+            os.path.getmtime(path_)
+            for path_ in [paths["db"], paths["db"].with_name(paths["db"].name + "-wal")]
+            if path_.is_file()
+        )
+    return os.path.getmtime(paths["xlsx"])
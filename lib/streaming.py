@@ -0,0 +1,194 @@
+import pathlib
+import re
+
+import lxml.etree
+import lxml.html
+
+from lib.instrument import span
+from lib.masking import Masker
+from lib.util import e2htmltext, extract_identifiers, sentence_segmentation
+
+# bytes of the html fed to the parser at once
+STREAM_CHUNK_SIZE = 1 << 16
+# elements under <article> whose children are streamed one by one; LaTeXML
+# writes the chapters, sections and subsections as <section>
+CONTAINER_TAG_SET = frozenset(["section"])
+
+
+def _start_tag(e) -> str:
+    # the start tag of e with its escaped text, i.e. its html without children
+    e_open = lxml.html.Element(e.tag, dict(e.attrib))
+    e_open.text = e.text
+    return e2htmltext(e_open)[: -len(f"</{e.tag}>")]
+
+
+def _escaped_tail(e) -> str:
+    e_tail = lxml.html.Element("span")
+    e_tail.tail = e.tail
+    return lxml.html.tostring(e_tail, encoding="unicode")[len("<span></span>") :]
+
+
+def iter_article(html_path):
+    """parse the html incrementally and yield the parts of the first <article>.
+
+    The article and the sections in it (CONTAINER_TAG_SET) are containers; the
+    other children of a container, e.g. the paragraphs (`ltx_para`), are
+    units. Each unit is yielded once it is complete together with its tail,
+    and removed from the tree afterwards, so only one unit, and the start tags
+    of its containers, is held in memory at a time.
+
+    Yields:
+        tuple: ("open", start tag and escaped text before the first child, text)
+            for each container, ("unit", element, None) for each unit,
+            ("close", end tag, None) at the end of each container, and
+            ("tail", escaped tail, tail) after a container in another.
+    """
+    parser = lxml.etree.HTMLPullParser(events=("start", "end"), encoding="utf-8")
+    parser.set_element_class_lookup(lxml.html.HtmlElementClassLookup())
+    # containers hold references to the elements so that lxml keeps their proxies
+    state = {"container": set(), "opened": set(), "pending": None, "done": False}
+
+    def is_container(e) -> bool:
+        return e in state["container"]
+
+    def open_container(e):
+        state["opened"].add(e)
+        return "open", _start_tag(e), e.text or ""
+
+    def release_pending():
+        pending = state["pending"]
+        if pending is None:
+            return
+        state["pending"] = None
+        if is_container(pending):
+            yield "tail", _escaped_tail(pending), pending.tail or ""
+            state["container"].discard(pending)
+            state["opened"].discard(pending)
+        else:
+            yield "unit", pending, None
+        pending.getparent().remove(pending)
+
+    def handle(event_list):
+        for event_, e_ in event_list:
+            if state["done"]:
+                continue
+            if not state["container"]:
+                if event_ == "start" and e_.tag == "article":
+                    state["container"].add(e_)
+                continue
+            parent = e_.getparent()
+            if event_ == "start" and is_container(parent):
+                # the text before this child and the tail of the previous
+                # child are complete
+                if parent not in state["opened"]:
+                    yield open_container(parent)
+                yield from release_pending()
+                if e_.tag in CONTAINER_TAG_SET:
+                    state["container"].add(e_)
+            elif event_ == "end" and is_container(e_):
+                if e_ not in state["opened"]:
+                    yield open_container(e_)
+                yield from release_pending()
+                yield "close", f"</{e_.tag}>", None
+                if not is_container(parent):  # the end of the article
+                    state["done"] = True
+                else:
+                    state["pending"] = e_
+            elif event_ == "end" and is_container(parent):
+                state["pending"] = e_
+
+    with open(html_path, "rb") as f:
+        for chunk in iter(lambda: f.read(STREAM_CHUNK_SIZE), b""):
+            parser.feed(chunk)
+            yield from handle(parser.read_events())
+    parser.close()
+    yield from handle(parser.read_events())
+
+
+def _iter_math_html(html_path):
+    """yield the serialized <math> elements of the article in document order."""
+    for kind_, unit_, _ in iter_article(html_path):
+        if kind_ == "unit":
+            for e_math_ in unit_.iter("math"):
+                yield e2htmltext(e_math_)
+
+
+def stream_identifiers(doc_processed_path):
+    """extract the identifiers of the article reading the html twice as a stream.
+
+    Returns:
+        tuple: (IdentifierRegistry, replaced_string_list), the same as those of
+            `lib.pipeline.build_artifacts`.
+    """
+    return extract_identifiers(lambda: _iter_math_html(doc_processed_path))
+
+
+def _collapse_newlines(text: str, after_newline: bool) -> str:
+    text = re.sub(r"\n+", r"\n", text)
+    if after_newline and text.startswith("\n"):
+        text = text[1:]
+    return text
+
+
+def stream_document(doc_processed_path, paper_dir=None):
+    """extract the identifiers of a large document and write its masked
+    article, text and sentences without holding the whole document in memory.
+
+    The article is read as a stream three times: twice by
+    `stream_identifiers`, and once to mask each unit of `iter_article` and
+    write `_article_masked.html` and `_article.txt`. The text is then segmented as a
+    whole into `_article_sentence.txt`, so that the sentences are the same as
+    those of `lib.document.Document`; only the text, not the tree, is held in
+    memory for it.
+
+    Args:
+        doc_processed_path (Path): path to `*_preprocessed.html`.
+        paper_dir (Path, optional): defaults to the folder of the document.
+
+    Returns:
+        tuple: (IdentifierRegistry, replaced_string_list)
+    """
+    doc_processed_path = pathlib.Path(doc_processed_path)
+    if paper_dir is None:
+        paper_dir = doc_processed_path.parent
+    paper_dir = pathlib.Path(paper_dir)
+    paper = paper_dir.name
+
+    identifier_registry, replaced_string_list = stream_identifiers(
+        doc_processed_path
+    )
+    masker = Masker(replaced_string_list)
+
+    text_path = paper_dir / (paper + "_article.txt")
+    with span("write_masked", streaming=True), open(
+        paper_dir / (paper + "_article_masked.html"), "w"
+    ) as f_html, open(text_path, "w") as f_text:
+        after_newline = False
+        for kind_, part_, text_ in iter_article(doc_processed_path):
+            if kind_ == "unit":
+                html = lxml.html.tostring(part_, encoding="unicode", with_tail=True)
+                # the escaped tail has no tag, so it is never masked
+                tail_length = len(html) - len(e2htmltext(part_))
+                html_masked = masker.mask(html)[0]
+                f_html.write(html_masked)
+                e_masked = lxml.html.fromstring(
+                    html_masked[: len(html_masked) - tail_length]
+                )
+                text_ = e_masked.text_content() + (part_.tail or "")
+            else:
+                f_html.write(part_)
+            if not text_:
+                continue
+            text_ = _collapse_newlines(text_, after_newline)
+            if not text_:
+                continue
+            after_newline = text_.endswith("\n")
+            f_text.write(text_)
+
+    with open(text_path) as f_text:
+        sentence_list = sentence_segmentation(f_text.read())
+    with open(paper_dir / (paper + "_article_sentence.txt"), "w") as f_sentence:
+        for i, sentence_ in enumerate(sentence_list):
+            f_sentence.write(f"{i}\t{sentence_}\n")
+
+    return identifier_registry, replaced_string_list
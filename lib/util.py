@@ -3,15 +3,29 @@ import sys
 import warnings
 
 import lxml.html
-import stanza
 
-from lib.xmldoc_child import Identifier
+from lib.instrument import span
+from lib.masking import Masker
+from lib.segmenter import get_segmenter
+from lib.xmldoc_child import Identifier, IdentifierRegistry
 
 
 def e2htmltext(e: lxml.html.HtmlElement) -> str:
     return lxml.html.tostring(e, encoding="unicode", with_tail=False)
 
 
+def parse_html(html_path):
+    """parse an html file written by LaTeXML or tools.preprocess.
+
+    The files are always UTF-8, so the encoding is not guessed from <meta>,
+    which may not be in <head> in a malformed document.
+    """
+    with span("parse_html"):
+        return lxml.html.parse(
+            str(html_path), parser=lxml.html.HTMLParser(encoding="utf-8")
+        )
+
+
 def is_identifier(e_mltag: lxml.html.HtmlElement) -> bool:
     """return whether input string represents a variable.
 
@@ -54,13 +68,28 @@ def is_identifier(e_mltag: lxml.html.HtmlElement) -> bool:
     return not_number and not_roman and not_function
 
 
-def var_html_to_str(e_mltag: lxml.html.HtmlElement):
+def var_html_to_str(e_mltag: lxml.html.HtmlElement, memo: dict = None):
+    """convert a MathML element into a TeX-like string.
+
+    Args:
+        e_mltag (HtmlElement):
+        memo (dict, optional): results of the elements already converted.
+            The entries of the ancestors of a dropped element should be removed.
+
+    Returns:
+        tuple: the string and the strings of the children.
+    """
+    if memo is not None:
+        converted = memo.get(e_mltag)
+        if converted is not None:
+            return converted
+
     mi_list = []
     if e_mltag.tag in ["mi", "mo", "mn"]:
         math_txt = e_mltag.text_content()
         mi_list = [math_txt]
     else:
-        mi_list = [var_html_to_str(x)[0] for x in e_mltag]
+        mi_list = [var_html_to_str(x, memo)[0] for x in e_mltag]
 
         if e_mltag.tag == "mrow":
             math_txt = "".join(mi_list)
@@ -89,60 +118,111 @@ def var_html_to_str(e_mltag: lxml.html.HtmlElement):
             math_txt = ""
             warnings.warn(f"unexpected tag: {e_mltag}")
 
+    if memo is not None:
+        memo[e_mltag] = (math_txt, mi_list)
     return math_txt, mi_list
 
 
-def extract_ml_component(e_math, mltag, identifier_list, replaced_string_list):
+# a tag listed earlier has priority: e.g. once <msub> is extracted as an
+# identifier, the <mi> elements in it are not extracted separately.
+ML_TAG_LIST = [
+    "munderover",  # used for summation
+    "msubsup",
+    "msup",
+    "msub",
+    "munder",
+    "mover",
+    "mi",
+]
 
-    for e_mltag_ in e_math.cssselect(mltag):
-        math_txt, mi_list_ = var_html_to_str(e_mltag_)
-        # print('##########################')
-        # print(math_txt)
-        # print(mi_list_)
-        mi_list = []
-        # TODO: moverunderに対応する．
-        for mi_ in mi_list_:
-            mi_component = re.findall("(over|under)set{(.+)}{(.+)}", mi_)
-            if mi_component:
-                mi_list.extend([mi_component[0][1], mi_component[0][2]])
-            else:
-                mi_list.append(mi_)
 
-        if is_identifier(e_mltag_):
-            identifier = Identifier(
-                text_tex=math_txt, text_html=e2htmltext(e_mltag_), mi_list=mi_list
-            )
-            if identifier not in identifier_list:
-                identifier_list.append(identifier)
-            # mi_list_の要素に<mrow>...</mrow>の式が含まれるとき，
-            # その式に登場する変数を抽出できないので，変数以外の木構造は削除しないことで
-            # 抽出可能にする（良い処理か不明）
-            e_mltag_.drop_tree()
-        # else:
-        #     replaced_string_list.append(
-        #         (math_txt, e2htmltext(e_mltag_), math_txt))
+def _is_attached(e_mltag, e_math) -> bool:
+    """return whether e_mltag has not been dropped from e_math."""
+    for e_ancestor_ in e_mltag.iterancestors():
+        if e_ancestor_ is e_math:
+            return True
+    return False
+
 
-        # e_mltag_.drop_tree()
+def extract_ml_component(e_math_list, identifier_registry, replaced_string_list):
+    """extract identifiers from the MathML components in the order of ML_TAG_LIST.
 
-    return identifier_list, replaced_string_list
+    The elements of every tag are collected in one traversal of each <math>.
+    Then, for each tag, the elements which have not been dropped together with
+    an identifier of a preceding tag are examined in document order. An
+    element found to be an identifier is dropped from the tree.
+    """
+    ml_tag_component_dict = {ml_tag_: [] for ml_tag_ in ML_TAG_LIST}
+    for e_math_ in e_math_list:
+        for e_mltag_ in e_math_.iter(*ML_TAG_LIST):
+            ml_tag_component_dict[e_mltag_.tag].append((e_mltag_, e_math_))
+
+    memo = {}
+    for ml_tag_ in ML_TAG_LIST:
+        # elements dropped during this loop are still examined, since their
+        # children may be identifiers as well (e.g. <msub> in <msub>).
+        e_mltag_list = [
+            e_mltag_
+            for e_mltag_, e_math_ in ml_tag_component_dict[ml_tag_]
+            if _is_attached(e_mltag_, e_math_)
+        ]
+        for e_mltag_ in e_mltag_list:
+            math_txt, mi_list_ = var_html_to_str(e_mltag_, memo)
+            mi_list = []
+            # TODO: moverunderに対応する．
+            for mi_ in mi_list_:
+                mi_component = re.findall("(over|under)set{(.+)}{(.+)}", mi_)
+                if mi_component:
+                    mi_list.extend([mi_component[0][1], mi_component[0][2]])
+                else:
+                    mi_list.append(mi_)
+
+            if is_identifier(e_mltag_):
+                identifier_registry.add(
+                    Identifier(
+                        text_tex=math_txt,
+                        text_html=e2htmltext(e_mltag_),
+                        mi_list=mi_list,
+                    )
+                )
+                # the strings of the ancestors change when the element is dropped
+                for e_ancestor_ in e_mltag_.iterancestors():
+                    memo.pop(e_ancestor_, None)
+                # mi_list_の要素に<mrow>...</mrow>の式が含まれるとき，
+                # その式に登場する変数を抽出できないので，変数以外の木構造は削除しないことで
+                # 抽出可能にする（良い処理か不明）
+                e_mltag_.drop_tree()
+
+    return identifier_registry, replaced_string_list
+
+
+def segment_many(texts, batch_size: int = 32):
+    """segment many texts into sentences with the shared segmenter
+    (stanza unless VARAT_SEGMENTER selects another one).
+
+    Args:
+        texts (list): texts to be segmented.
+        batch_size (int): number of documents passed to stanza at once.
+
+    Returns:
+        list: sentence list for each text.
+    """
+    return get_segmenter().segment_many(texts, batch_size)
 
 
 def sentence_segmentation(text):
     """extract sentences which contain the identifier from the text.
-    sentences are segmented using stanza.
+    sentences are segmented using the shared segmenter.
 
     Returns:
         sentences (list): sentences which contain the identifier the text.
     """
-    nlp = stanza.Pipeline(lang="en", processors="tokenize")
-    doc = nlp(text)
-    # Each sentence should not include a line change.
-    sentence_list = [sentence.text.replace("\n", " ") for sentence in doc.sentences]
+    return segment_many([text])[0]
 
-    return sentence_list
 
-
-def extract_symbols(e_math_list, identifier_list, replaced_string_list, symbol_type):
+def extract_symbols(
+    e_math_list, identifier_registry, replaced_string_list, symbol_type
+):
 
     if symbol_type == "serial":
         for e_math_ in e_math_list:
@@ -150,7 +230,7 @@ def extract_symbols(e_math_list, identifier_list, replaced_string_list, symbol_t
             # 一連の記号を1つの変数を表す記号とみなす．
             # e.g. MW_{c,p}という場合があるのでカンマを入れている
             # 変数記号リストに変数を追加し，抽出対象のHTMLファイルを更新する．
-            e_mo_text_set = {e_mo_.text for e_mo_ in e_math_.cssselect("mo")}
+            e_mo_text_set = {e_mo_.text for e_mo_ in e_math_.iter("mo")}
             if not (
                 e_mo_text_set <= {"\u2062", "&#8290", ","} and e_mo_text_set != set()
             ):
@@ -173,39 +253,78 @@ def extract_symbols(e_math_list, identifier_list, replaced_string_list, symbol_t
 
             e_math_text_tex = e_math_.attrib.get("alttext")
             e_math_text_tex = e_math_text_tex.replace("\\displaystyle", "")
-            identifier = Identifier(
-                text_tex=e_math_text_tex, text_html=e_math_text_html
+            identifier_registry.add(
+                Identifier(text_tex=e_math_text_tex, text_html=e_math_text_html)
             )
-            if identifier not in identifier_list:
-                identifier_list.append(identifier)
             e_math_.drop_tree()
 
 
     elif symbol_type == "single":
-        ml_tag_list = [
-            "munderover",  # used for summation
-            "msubsup",
-            "msup",
-            "msub",
-            "munder",
-            "mover",
-            "mi",
-        ]
-
-        for ml_tag_ in ml_tag_list:
-            for e_math_ in e_math_list:
-                identifier_list, replaced_string_list = extract_ml_component(
-                    e_math_, ml_tag_, identifier_list, replaced_string_list
-                )
+        identifier_registry, replaced_string_list = extract_ml_component(
+            e_math_list, identifier_registry, replaced_string_list
+        )
     else:
         warnings('Choose appropriate symbol type: "serial" or "single".')
         sys.exit(1)
 
-    for i, identifier_ in enumerate(identifier_list):
-        if identifier_.id == -1:
-            replaced_string_list.append(
-                (identifier_.text_tex, identifier_.text_html, f"MATH_{i:04d}")
+    replaced_string_list.extend(identifier_registry.assign_ids())
+
+    return identifier_registry, replaced_string_list
+
+
+_TAG_PATTERN = re.compile(r"<([^\s/>]+)")
+
+
+def extract_identifiers(iter_math_html):
+    """extract the identifiers from each <math> alone.
+
+    The identifiers and their masks are the same as those of extracting the
+    "serial" symbols from every <math> of the article, masking them, and
+    extracting the "single" symbols from the masked article: in the second
+    pass each <math> is masked with the serial symbols, and its single symbols
+    are numbered in the order of ML_TAG_LIST and of the document, as
+    `extract_ml_component` numbers them when it is given every <math> at once.
+
+    Args:
+        iter_math_html (callable): returns an iterable of the serialized <math>
+            elements in document order; it is called once per pass.
+
+    Returns:
+        tuple: (IdentifierRegistry, replaced_string_list)
+    """
+    identifier_registry = IdentifierRegistry()
+    replaced_string_list = []
+
+    with span("extract_symbols", symbol_type="serial"):
+        for math_html_ in iter_math_html():
+            # serial symbols are joined by <mo>
+            if "<mo" not in math_html_:
+                continue
+            identifier_registry, replaced_string_list = extract_symbols(
+                [lxml.html.fromstring(math_html_)],
+                identifier_registry,
+                replaced_string_list,
+                "serial",
             )
-            identifier_list[i].id = i
 
-    return identifier_list, replaced_string_list
+    tag_rank_dict = {tag_: i for i, tag_ in enumerate(ML_TAG_LIST)}
+    serial_masker = Masker(replaced_string_list)
+    # identifier key -> (tag rank, math index, order in the math, identifier)
+    first_found_dict = {}
+    with span("extract_symbols", symbol_type="single"):
+        for i, math_html_ in enumerate(iter_math_html()):
+            e_math = lxml.html.fromstring(serial_masker.mask(math_html_)[0])
+            local_registry, _ = extract_ml_component(
+                [e_math], IdentifierRegistry(), []
+            )
+            for j, identifier_ in enumerate(local_registry):
+                key = (identifier_.text_tex, identifier_.text_html)
+                if key in first_found_dict:
+                    continue
+                tag = _TAG_PATTERN.match(identifier_.text_html).group(1)
+                first_found_dict[key] = (tag_rank_dict[tag], i, j, identifier_)
+
+    for *_, identifier_ in sorted(first_found_dict.values(), key=lambda v: v[:3]):
+        identifier_registry.add(identifier_)
+    replaced_string_list.extend(identifier_registry.assign_ids())
+    return identifier_registry, replaced_string_list
@@ -1,7 +1,21 @@
-from dataclasses import dataclass, field
-from typing import List
+from dataclasses import dataclass, field, fields
+from typing import Dict, Iterator, List, Tuple
 
 
+def _add_slots(cls):
+    """rebuild a dataclass with `__slots__` (`dataclass(slots=True)` needs Python 3.10)."""
+    cls_dict = dict(cls.__dict__)
+    field_names = tuple(f.name for f in fields(cls))
+    cls_dict["__slots__"] = field_names
+    for field_name_ in field_names:
+        # the default values are kept in the generated __init__
+        cls_dict.pop(field_name_, None)
+    cls_dict.pop("__dict__", None)
+    cls_dict.pop("__weakref__", None)
+    return type(cls)(cls.__name__, cls.__bases__, cls_dict)
+
+
+@_add_slots
 @dataclass
 class Sentence:
     id: int = 0
@@ -10,27 +24,128 @@ class Sentence:
     replaced: str = ""
 
 
+class SentenceTable:
+    """interned sentences of a document.
+
+    Identifiers and candidates refer to a sentence by its id, so a sentence
+    shared by many identifiers is stored only once.
+    """
+
+    __slots__ = ("_sentence_list", "_index")
+
+    def __init__(self):
+        self._sentence_list: List[Sentence] = []
+        self._index: Dict[str, int] = {}
+
+    def intern(self, original: str, tagged: str = "", replaced: str = "") -> int:
+        """return the id of the sentence, adding it if it is new."""
+        sentence_id = self._index.get(original)
+        if sentence_id is None:
+            sentence_id = len(self._sentence_list)
+            self._sentence_list.append(
+                Sentence(
+                    id=sentence_id, original=original, tagged=tagged, replaced=replaced
+                )
+            )
+            self._index[original] = sentence_id
+        return sentence_id
+
+    def __getitem__(self, sentence_id: int) -> Sentence:
+        return self._sentence_list[sentence_id]
+
+    def __len__(self):
+        return len(self._sentence_list)
+
+    def __iter__(self) -> Iterator[Sentence]:
+        return iter(self._sentence_list)
+
+
+@_add_slots
 @dataclass
 class Candidate:
     text: str
     score_pagel: float = 0.0
     score_propsed: float = 0.0
-    included_sentence: Sentence = field(default_factory=Sentence)
+    included_sentence_id: int = -1
     word_count_btwn_var_cand: int = 0
     candidate_count_in_sentence: int = 0
     score_match_character: int = 0
 
 
+@_add_slots
 @dataclass
 class Identifier:
     text_tex: str = ""
     text_html: str = ""
     mi_list: List[str] = field(default_factory=list)
     id: int = -1
-    sentences: List[Sentence] = field(default_factory=list)
+    sentence_ids: List[int] = field(default_factory=list)
     candidates: List[Candidate] = field(default_factory=list)
 
 
+class IdentifierRegistry:
+    """identifiers of a document indexed by (text_tex, text_html).
+
+    The registry behaves like the list of identifiers in the order they are
+    registered, and looking up an identifier costs O(1) instead of a scan
+    comparing every field.
+    """
+
+    def __init__(self):
+        self._identifier_list: List[Identifier] = []
+        self._index: Dict[Tuple[str, str], Identifier] = {}
+        self.sentences = SentenceTable()
+
+    @staticmethod
+    def _key(identifier: Identifier) -> Tuple[str, str]:
+        return identifier.text_tex, identifier.text_html
+
+    def add(self, identifier: Identifier) -> Identifier:
+        """register the identifier unless an equivalent one is already registered.
+
+        Returns:
+            Identifier: the registered identifier.
+        """
+        key = self._key(identifier)
+        registered = self._index.get(key)
+        if registered is None:
+            self._index[key] = identifier
+            self._identifier_list.append(identifier)
+            registered = identifier
+        return registered
+
+    def get(self, text_tex: str, text_html: str):
+        return self._index.get((text_tex, text_html))
+
+    def assign_ids(self) -> List[tuple]:
+        """give an id to every identifier which does not have one yet.
+
+        Returns:
+            list: (text_tex, text_html, mask) tuples of the newly numbered identifiers.
+        """
+        replaced_string_list = []
+        for i, identifier_ in enumerate(self._identifier_list):
+            if identifier_.id == -1:
+                identifier_.id = i
+                replaced_string_list.append(
+                    (identifier_.text_tex, identifier_.text_html, f"MATH_{i:04d}")
+                )
+        return replaced_string_list
+
+    def __contains__(self, identifier: Identifier) -> bool:
+        return self._key(identifier) in self._index
+
+    def __getitem__(self, i: int) -> Identifier:
+        return self._identifier_list[i]
+
+    def __iter__(self) -> Iterator[Identifier]:
+        return iter(self._identifier_list)
+
+    def __len__(self):
+        return len(self._identifier_list)
+
+
+@_add_slots
 @dataclass
 class Formulae:
     text_replaced: str = ""
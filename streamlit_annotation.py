@@ -1,17 +1,31 @@
 import os
 import pathlib
-import re
-import subprocess
+import time
 
-import lxml.html
 import pandas as pd
 import streamlit as st
 import streamlit.components.v1 as components
 
-from lib.util import e2htmltext, extract_symbols, sentence_segmentation
+from lib.corpus_index import IdentifierIndex
+from lib.dataset import list_papers
+from lib.instrument import collect, span
+from lib.jobs import DONE, FAILED, get_job_queue
+from lib.pipeline import has_artifacts, load_artifacts, write_document_files
+from lib.render import render_window, window_block_ids
+from lib.segmenter import get_segmenter
+from lib.store import open_annotation_store
+from tools.build_corpus import build_paper, needs_build
 
+# number of blocks containing the variable rendered at a time
+WINDOW_SIZE = 3
+TABLE_PAGE_SIZE = 50
+# papers after the open one built in the background
+PREFETCH_COUNT = 2
+# seconds between the refreshes of the page waiting for a job
+JOB_POLL_SECONDS = 1.0
 
-def main():
+
+def annotate():
 
     st.set_page_config(page_title="Annotation tool", page_icon="random", layout="wide")
     """
@@ -21,9 +35,7 @@ def main():
     ##############
     DATA_FOLDER = pathlib.Path(os.getcwd()) / "data/Anno"
 
-    process_list = [
-        f for f in os.listdir(DATA_FOLDER) if os.path.isdir(DATA_FOLDER / f)
-    ]
+    process_list = list_papers(DATA_FOLDER)
 
     process_select_expander = st.expander("Select process and document.", expanded=True)
 
@@ -32,9 +44,7 @@ def main():
             "Which process is used?", process_list
         )
 
-    paper_list = [
-        f for f in os.listdir(process_path) if os.path.isdir(process_path / f)
-    ]
+    paper_list = list_papers(process_path)
 
     def initialize_session_state():
         st.session_state.sentence_extracted_list = []
@@ -48,86 +58,29 @@ def main():
             "Which document is used?", paper_list, on_change=initialize_session_state
         )
 
-    doc_tex_path = process_path / doc_folder_path / (doc_folder_path + ".tex")
-    doc_html_path = process_path / doc_folder_path / (doc_folder_path + ".html")
-
-    if not os.path.isfile(doc_html_path):
-        if not os.path.isfile(doc_tex_path):
-            st.warning("Prepare tex file.")
-            st.stop()
-        st.write("html file does not exist. Convert tex to html.")
-        subprocess_var = subprocess.run(
-            [
-                "latexmlc",
-                str(doc_tex_path),
-                "--preload=amsmath.sty",
-                "--dest=" + str(doc_html_path),
-            ],
-            check=True,
-        )
-        st.write("Finish conversion.")
-
     doc_processed_path = (
         process_path / doc_folder_path / (doc_folder_path + "_preprocessed.html")
     )
 
-    if not os.path.isfile(doc_processed_path):
-        st.write("preprocessed html file does not exist. Convert tex to html.")
-        subprocess.run(["python", "-m", "tools.preprocess", doc_html_path], check=True)
-        st.write("Finish preprocessing.")
-
-    tree = lxml.html.parse(str(doc_processed_path))
-    root = tree.getroot()
-    doc_article = root.cssselect("article")[0]
-    doc_article_original = e2htmltext(doc_article)
-    doc_article = e2htmltext(doc_article)
-
-    symbol_list = []
-    replaced_string_list = []
-    # formula_list = []
-
-    for symbol_type in ["serial", "single"]:
-        doc_article_html = lxml.html.fromstring(doc_article)
-        math_component_list = doc_article_html.cssselect("math")
-        symbol_list, replaced_string_list = extract_symbols(
-            math_component_list, symbol_list, replaced_string_list, symbol_type
-        )
-        for replaced_string_ in replaced_string_list:
-            doc_article = doc_article.replace(replaced_string_[1], replaced_string_[2])
-
-    doc_article = lxml.html.fromstring(doc_article)
-    doc_text = doc_article.text_content()
-    doc_text = re.sub(r"\n+", r"\n", doc_text)
-
-    @st.cache
-    def return_sentence_list(sentences):
-        return sentence_segmentation(sentences)
-
-    sentence_list = return_sentence_list(doc_text)
-
-    ##########################################################################
-    # save doc
-    ##########################################################################
-    doc_text_path = process_path / doc_folder_path / (doc_folder_path + "_article.txt")
-    if not os.path.isfile(doc_text_path):
-        with open(doc_text_path, "w") as f:
-            f.write(doc_text)
-
-    doc_article_sentence_path = (
-        process_path / doc_folder_path / (doc_folder_path + "_article_sentence.txt")
-    )
-    if not os.path.isfile(doc_article_sentence_path):
-        with open(doc_article_sentence_path, "w") as f:
-            for i, s_ in enumerate(sentence_list):
-                f.write(f"{i}\t{s_}\n")
-
-    doc_article_masked_path = (
-        process_path / doc_folder_path / (doc_folder_path + "_article_masked.html")
-    )
-    if not os.path.isfile(doc_article_masked_path):
-        with open(doc_article_masked_path, "w") as f:
-            f.write(e2htmltext(doc_article))
-    ##########################################################################
+    # the documents are usually prebuilt by `python -m tools.build_corpus`;
+    # the others are built in the background while the page waits for them.
+    job_queue = get_job_queue()
+    paper_dir = process_path / doc_folder_path
+    job = job_queue.get(str(paper_dir))
+    if (job is not None and job.is_active) or not os.path.isfile(doc_processed_path):
+        job = job_queue.submit(str(paper_dir), build_paper, paper_dir)
+        wait_for_job(job_queue, job, paper_dir)
+
+    # built here when the document has changed since the last build
+    is_built = not has_artifacts(doc_processed_path)
+    artifacts = load_artifacts(doc_processed_path)
+    symbol_list = artifacts.identifiers
+    doc_article_original = artifacts.article_original_html
+    doc_article_masked = artifacts.article_masked_html
+    sentence_list = artifacts.sentences
+
+    write_document_files(paper_dir, artifacts, overwrite=is_built)
+    prefetch_papers(job_queue, process_path, paper_list, doc_folder_path)
 
     xlsx_path = process_path / doc_folder_path / (doc_folder_path + ".xlsx")
 
@@ -135,39 +88,68 @@ def main():
     # HTML_WIDTH = 700
     HTML_HEIGHT = 500
     with col_left:
-        with st.expander("Processed text", expanded=True):
-            components.html(
-                e2htmltext(doc_article), height=HTML_HEIGHT * 1.5, scrolling=True
+        render_mode = st.radio(
+            "Rendering",
+            ["Around the variable", "Full article"],
+            help="Around the variable sends only the blocks containing the selected variable.",
+        )
+        if render_mode == "Full article":
+            html_masked, html_original = doc_article_masked, doc_article_original
+        else:
+            symbol_MATH = f"MATH_{st.session_state.get('symbol_number', 0):04d}"
+            if st.session_state.get("window_symbol") != symbol_MATH:
+                st.session_state.window_symbol = symbol_MATH
+                st.session_state.window_size = WINDOW_SIZE
+            block_id_list = window_block_ids(
+                artifacts.block_index,
+                len(artifacts.blocks_masked),
+                symbol_MATH,
+                st.session_state.window_size,
             )
-        with st.expander("Original text", expanded=False):
-            components.html(doc_article_original, height=HTML_HEIGHT, scrolling=True)
+            with span("render_window", n_blocks=len(block_id_list)):
+                html_masked, html_original = render_window(
+                    artifacts.blocks_masked,
+                    artifacts.blocks_original,
+                    block_id_list,
+                    symbol_MATH,
+                )
 
-    # TODO: これより上の処理でxlsxのinitializeをして，ここはloadだけにする
-    # （引数がxlsx_pathだけになるように設計し直す方がすっきりする）
-    # xlsxがあったら前処理不要
+        with st.expander("Processed text", expanded=True):
+            components.html(html_masked, height=HTML_HEIGHT * 1.5, scrolling=True)
+        with st.expander("Original text", expanded=False):
+            components.html(html_original, height=HTML_HEIGHT, scrolling=True)
 
-    def load_xlsx(xlsx_path, symbol_list):
+        if render_mode != "Full article":
+            n_block = len(artifacts.block_index.get(symbol_MATH, []))
+            st.write(
+                f"Blocks with {symbol_MATH}: {min(st.session_state.window_size, n_block):d} / {n_block:d}"
+            )
+            if st.session_state.window_size < n_block:
+
+                def load_more():
+                    st.session_state.window_size += WINDOW_SIZE
+
+                st.button("Load more", on_click=load_more)
+
+    # the annotation is saved in SQLite; the xlsx is imported when the store is
+    # created and can be exported with the button below the table.
+    with span("open_annotation_store"):
+        store = open_annotation_store(process_path / doc_folder_path, symbol_list)
+    # the sentence numbers are indices in the sentences of one segmenter
+    try:
+        store.check_segmenter(get_segmenter().name)
+    except ValueError as e:
+        st.error(str(e))
+        st.stop()
+    df = store.load_dataframe()
+
+    # definitions given to the same identifiers in the other papers of the process
+    if st.session_state.get("identifier_index_process") != str(process_path):
+        st.session_state.identifier_index = IdentifierIndex(process_path)
+        st.session_state.identifier_index_process = str(process_path)
+    identifier_index = st.session_state.identifier_index
+    identifier_index.refresh()
 
-        if os.path.isfile(xlsx_path):
-            df = pd.read_excel(xlsx_path, index_col=0, dtype=str)
-        else:
-            df_columns = [
-                "identifier_html",
-                "identifier_tex",
-                "definition_extracted",
-                "definition_true",
-                "extractable",
-                "sentence_number",
-                "sentence_with_definition",
-            ]
-            df_index = [f"MATH_{i:04d}" for i, _ in enumerate(symbol_list)]
-            df = pd.DataFrame(columns=df_columns, index=df_index)
-            for i, index_ in enumerate(df_index):
-                df.loc[index_]["identifier_html"] = symbol_list[i].text_html
-                df.loc[index_]["identifier_tex"] = symbol_list[i].text_tex
-        return df
-
-    df = load_xlsx(xlsx_path, symbol_list)
     with col_right:
 
         def update_form(df, sentence_list):
@@ -178,7 +160,7 @@ def main():
             else:
                 s_list_ = df.loc[symbol_MATH]["sentence_number"].split("\n")
             st.session_state.sentence_extracted_list = [
-                sentence_list[int(i)] for i in s_list_
+                sentence_list[int(i)] for i in s_list_ if i != ""
             ]
 
             def_ex_ = df.loc[symbol_MATH]["definition_extracted"]
@@ -211,9 +193,68 @@ def main():
             f"HTML format: {symbol_selected.text_html}  \n TeX format: {symbol_selected.text_tex}"
         )
 
+        def use_suggestion(candidate):
+            st.session_state.sentence_extracted_list = [
+                symbol_list.sentences[candidate.included_sentence_id].original
+            ]
+            st.session_state.def_extracted = candidate.text
+
+        candidate_list = symbol_selected.candidates
+        if candidate_list:
+            candidate_number = st.selectbox(
+                "Suggested definitions",
+                [i for i, _ in enumerate(candidate_list)],
+                format_func=lambda i: f"{candidate_list[i].text} ({candidate_list[i].score_propsed:.2f})",
+            )
+            st.button(
+                "Use suggestion",
+                on_click=use_suggestion,
+                args=(candidate_list[candidate_number],),
+            )
+
+        def use_prior_definition(definition):
+            st.session_state.def_true = definition
+
+        prior_list = identifier_index.lookup(
+            symbol_selected.text_tex or "", exclude_paper=doc_folder_path
+        )
+        if prior_list:
+            prior_number = st.selectbox(
+                "Definitions in other papers",
+                [i for i, _ in enumerate(prior_list)],
+                format_func=lambda i: (
+                    f"{prior_list[i].definition} ({prior_list[i].frequency:d})"
+                ),
+            )
+            st.caption(
+                ", ".join(
+                    f"{paper_}/{math_id_}"
+                    for paper_, math_id_ in prior_list[prior_number].locations
+                )
+            )
+            st.button(
+                "Use as correct definition",
+                on_click=use_prior_definition,
+                args=(prior_list[prior_number].definition,),
+            )
+
+        show_all_sentences = st.checkbox("Show all sentences", value=False)
+        if show_all_sentences:
+            sentence_option_list = sentence_list
+        else:
+            # the sentences containing the variable, and the ones already selected
+            sentence_option_list = list(
+                dict.fromkeys(
+                    [
+                        sentence_list[i]
+                        for i in artifacts.sentence_index.get(symbol_MATH, [])
+                    ]
+                    + st.session_state.sentence_extracted_list
+                )
+            )
         sentence_extracted_list = st.multiselect(
             "Select the sentence including the variable definition.",
-            sentence_list,
+            sentence_option_list,
             key="sentence_extracted_list",
         )
         st.write(sentence_extracted_list)
@@ -271,22 +312,30 @@ def main():
                     )
                     st.stop()
 
-            df.loc[symbol_MATH]["sentence_number"] = "\n".join(
-                [str(sentence_list.index(s)) for s in sentence_extracted_list]
-            )
-            df.loc[symbol_MATH]["sentence_with_definition"] = "\n".join(
-                sentence_extracted_list
-            )
-            df.loc[symbol_MATH]["definition_extracted"] = def_extracted
-            df.loc[symbol_MATH]["definition_true"] = def_true
-            df.loc[symbol_MATH]["extractable"] = "\n".join(extractable_list)
-            df.to_excel(xlsx_path)
+            row_values = {
+                "sentence_number": "\n".join(
+                    [str(sentence_list.index(s)) for s in sentence_extracted_list]
+                ),
+                "sentence_with_definition": "\n".join(sentence_extracted_list),
+                "definition_extracted": def_extracted,
+                "definition_true": def_true,
+                "extractable": "\n".join(extractable_list),
+            }
+            with span("upsert", math_id=symbol_MATH):
+                store.upsert(symbol_MATH, row_values)
+            df.loc[symbol_MATH, list(row_values)] = list(row_values.values())
             st.write("Successfully saved table.")
-            n_annotated = pd.notna(df["definition_true"]).sum()
 
         table_expander = st.expander("Table", expanded=False)
         with table_expander:
-            st.dataframe(df)
+            n_page = (df.shape[0] - 1) // TABLE_PAGE_SIZE + 1
+            page = st.number_input("Page", min_value=1, max_value=max(n_page, 1), step=1)
+            st.dataframe(
+                df.iloc[(page - 1) * TABLE_PAGE_SIZE : page * TABLE_PAGE_SIZE]
+            )
+            if st.button("Export xlsx"):
+                store.export_xlsx(xlsx_path)
+                st.write(f"Exported {xlsx_path.name}.")
         n_annotated = pd.notna(df["extractable"]).sum()
         msg_progress = f"Progress: {n_annotated:d} / {df.shape[0]:d}"
         st.write(msg_progress)
@@ -296,5 +345,100 @@ def main():
             st.balloons()
 
 
+def wait_for_job(job_queue, job, paper_dir):
+    """show the progress of the job building the paper and rerun the page
+    until it is done."""
+    if job.status == FAILED:
+        if isinstance(job.error, FileNotFoundError):
+            st.warning("Prepare tex file.")
+        else:
+            st.error(f"Failed to build {paper_dir.name}: {job.error}")
+            with st.expander("Traceback", expanded=False):
+                st.code(job.error_traceback)
+        if st.button("Retry"):
+            job_queue.submit(str(paper_dir), build_paper, paper_dir, retry=True)
+            st.experimental_rerun()
+        st.stop()
+    if job.status == DONE:
+        return
+
+    st.info(
+        f"{paper_dir.name} is being converted and preprocessed in the background "
+        f"({job.stage or job.status}, {job.seconds:.0f} s). "
+        "Other documents can be opened meanwhile."
+    )
+    st.progress(job.progress)
+    time.sleep(JOB_POLL_SECONDS)
+    st.experimental_rerun()
+
+
+def prefetch_papers(job_queue, process_path, paper_list, paper):
+    """build the next papers of the list in the background so that they open
+    without waiting; the job queue runs them after the papers being opened."""
+    checked_set = st.session_state.setdefault("prefetch_checked", set())
+    i = paper_list.index(paper)
+    n_submitted = 0
+    for paper_ in paper_list[i + 1 :] + paper_list[:i]:
+        if n_submitted >= PREFETCH_COUNT:
+            break
+        paper_dir_ = process_path / paper_
+        if str(paper_dir_) in checked_set:
+            continue
+        job = job_queue.get(str(paper_dir_))
+        if job is not None and job.is_active:
+            n_submitted += 1
+            continue
+        checked_set.add(str(paper_dir_))
+        if needs_build(paper_dir_):
+            job_queue.submit(str(paper_dir_), build_paper, paper_dir_, background=True)
+            n_submitted += 1
+
+
+def show_jobs(job_queue):
+    job_list = job_queue.jobs()
+    if not job_list:
+        return
+    with st.expander(
+        f"Background jobs ({job_queue.n_active():d} running)", expanded=False
+    ):
+        st.dataframe(
+            pd.DataFrame(
+                [
+                    {
+                        "paper": pathlib.Path(job_.key).name,
+                        "status": job_.status,
+                        "stage": job_.stage,
+                        "progress": job_.progress,
+                        "seconds": job_.seconds,
+                        "error": "" if job_.error is None else str(job_.error),
+                    }
+                    for job_ in job_list
+                ]
+            )
+        )
+
+
+def show_performance(record_list):
+    with st.expander("Performance", expanded=False):
+        if not record_list:
+            st.write("No stage was measured in this run.")
+            return
+        st.write(
+            "Seconds of the stages run for this page, and the peak memory in MiB "
+            "if VARAT_TRACE_MEMORY=1."
+        )
+        st.dataframe(pd.DataFrame(record_list))
+
+
+def main():
+    # the stages measured while the page is built are shown at its bottom
+    with collect() as record_list:
+        try:
+            annotate()
+        finally:
+            show_jobs(get_job_queue())
+            show_performance(record_list)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,38 @@
+import pathlib
+import shutil
+
+import pytest
+
+from lib import segmenter
+from tools.build_corpus import build_paper
+
+SAMPLE_DIR = pathlib.Path(__file__).parent.parent / "data/Anno/Process1/sample"
+
+
+@pytest.fixture
+def rule_segmenter():
+    previous = segmenter._segmenter
+    segmenter.configure_segmenter("rule")
+    yield
+    segmenter._segmenter = previous
+
+
+def test_rebuild_rewrites_the_document_files(tmp_path, rule_segmenter):
+    paper_dir = tmp_path / "Process" / "paper"
+    paper_dir.mkdir(parents=True)
+    html_path = paper_dir / "paper.html"
+    shutil.copy(SAMPLE_DIR / "sample.html", html_path)
+    text_path = paper_dir / "paper_article.txt"
+    sentence_path = paper_dir / "paper_article_sentence.txt"
+
+    assert build_paper(paper_dir) == ["preprocessed", "artifacts"]
+    assert "Process Model" in text_path.read_text()
+
+    html_path.write_text(
+        html_path.read_text(encoding="utf-8").replace("Process Model", "Plant Model"),
+        encoding="utf-8",
+    )
+    assert build_paper(paper_dir) == ["preprocessed", "artifacts"]
+    assert "Plant Model" in text_path.read_text()
+    assert "Process Model" not in text_path.read_text()
+    assert "Process Model" not in sentence_path.read_text()
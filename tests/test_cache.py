@@ -0,0 +1,32 @@
+import pathlib
+import shutil
+
+from lib.cache import CACHE_DIRNAME, ArtifactCache
+from lib.dataset import load_definitions
+
+SAMPLE_DIR = pathlib.Path(__file__).parent.parent / "data/Anno/Process1/sample"
+
+
+def test_artifact_and_definition_caches_survive_each_other(tmp_path):
+    paper_dir = tmp_path / "Process" / "sample"
+    paper_dir.mkdir(parents=True)
+    shutil.copy(SAMPLE_DIR / "sample.xlsx", paper_dir)
+    source_path = paper_dir / "sample_preprocessed.html"
+    shutil.copy(SAMPLE_DIR / "sample_preprocessed.html", source_path)
+    cache_dir = paper_dir / CACHE_DIRNAME
+    definition_path = cache_dir / "definitions.pkl"
+
+    load_definitions(paper_dir)
+    cache = ArtifactCache(cache_dir, "v1")
+    cache.store(cache.key(source_path), "artifacts")
+    assert definition_path.is_file()
+
+    # a new fingerprint evicts the previous artifacts only
+    new_cache = ArtifactCache(cache_dir, "v2")
+    new_cache.store(new_cache.key(source_path), "artifacts")
+    assert definition_path.is_file()
+    assert cache.key(source_path) not in new_cache
+    assert new_cache.key(source_path) in new_cache
+
+    load_definitions(paper_dir)
+    assert new_cache.key(source_path) in new_cache
@@ -0,0 +1,31 @@
+from lib.candidate import identifier_initial, noun_phrases, score_candidates, tokenize
+from lib.xmldoc_child import Identifier, IdentifierRegistry
+
+
+def test_identifier_initial():
+    identifier = Identifier("T_R", "<msub><mi>T</mi><mi>R</mi></msub>")
+    assert identifier_initial(identifier) == "t"
+    assert identifier_initial(Identifier(r"\mathrm{Da}", "")) == "d"
+
+
+def test_score_match_character():
+    identifier_registry = IdentifierRegistry()
+    identifier_registry.add(
+        Identifier("T_R", '<msub><mi>T</mi><mi mathvariant="normal">R</mi></msub>')
+    )
+    score_candidates(
+        identifier_registry, ["The reactor temperature MATH_0000 is kept constant."]
+    )
+    score_dict = {
+        c_.text: c_.score_match_character for c_ in identifier_registry[0].candidates
+    }
+    assert score_dict["reactor temperature"] == 1
+
+
+def test_noun_phrase_joined_over_article():
+    token_list = tokenize("The concentration of the reactant MATH_0000 decreases.")
+    phrase_list = [
+        " ".join(t_[1] for t_ in token_list[s_:e_])
+        for s_, e_ in noun_phrases(token_list)
+    ]
+    assert "concentration of the reactant" in phrase_list
@@ -0,0 +1,54 @@
+import pandas as pd
+
+from tools.cluster_dict_draft import cluster_dict_draft, propose_ids
+from tools.generate_dict_draft import DRAFT_COLUMNS, DRAFT_FILENAME
+
+
+def test_rerun_keeps_reviewed_columns(tmp_path):
+    (tmp_path / "P").mkdir()
+    draft_path = tmp_path / "P" / DRAFT_FILENAME
+    pd.DataFrame(
+        [
+            ["0000", "T", "temperature of the reactor"],
+            ["0001", "T", "the temperature of the reactor"],
+            ["0002", "k", "rate constant"],
+        ],
+        index=["P/a/MATH_0000_0", "P/b/MATH_0000_0", "P/a/MATH_0001_0"],
+        columns=DRAFT_COLUMNS,
+    ).to_excel(draft_path)
+
+    df_draft = cluster_dict_draft("P", data_folder=tmp_path)
+    assert df_draft.set_index("ID")["ProposedID"].to_dict() == {
+        "0000": "0000",
+        "0001": "0000",
+        "0002": "0002",
+    }
+
+    # the reviewer splits the group and adds notes
+    df_draft = pd.read_excel(draft_path, index_col=0, dtype=str)
+    df_draft.loc[df_draft["ID"] == "0001", "ProposedID"] = "0001"
+    df_draft["Note"] = ["checked", None, None]
+    df_draft.to_excel(draft_path)
+
+    cluster_dict_draft("P", data_folder=tmp_path)
+    df_draft = pd.read_excel(draft_path, index_col=0, dtype=str).set_index("ID")
+    assert df_draft["ProposedID"].to_dict() == {
+        "0000": "0000",
+        "0001": "0001",
+        "0002": "0002",
+    }
+    assert df_draft["Note"].dropna().to_dict() == {"0000": "checked"}
+
+
+def test_smallest_id_past_9999_is_proposed():
+    df_draft = pd.DataFrame(
+        [
+            ["10000", "T", "temperature of the reactor"],
+            ["9999", "T", "the temperature of the reactor"],
+        ],
+        index=["P/a/MATH_0000_0", "P/a/MATH_0001_0"],
+        columns=DRAFT_COLUMNS,
+    )
+    df_draft = propose_ids(df_draft)
+    assert df_draft["ID"].tolist() == ["9999", "10000"]
+    assert df_draft["ProposedID"].tolist() == ["9999", "9999"]
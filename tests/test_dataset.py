@@ -0,0 +1,46 @@
+import pandas as pd
+
+from lib.dataset import DEFINITION_COLUMNS, explode_definitions
+from lib.store import ANNOTATION_COLUMNS
+
+
+def _annotation(row_dict):
+    return pd.DataFrame.from_dict(row_dict, orient="index", columns=ANNOTATION_COLUMNS)
+
+
+def test_explode_definitions():
+    df = _annotation(
+        {
+            "MATH_0000": ["<mi>T</mi>", "T", "temperature", "temp", "1", "0", ""],
+            "MATH_0001": [
+                "<mi>k</mi>",
+                "k",
+                "rate of MATH_0000\nrate",
+                "rate",
+                "1\n0",
+                "1\n2",
+                "",
+            ],
+        }
+    )
+    df_def = explode_definitions(df, "P", "paper")
+    assert list(df_def.columns) == DEFINITION_COLUMNS
+    assert df_def["ID"].tolist() == [
+        "P/paper/MATH_0000_0",
+        "P/paper/MATH_0001_0",
+        "P/paper/MATH_0001_1",
+    ]
+    assert df_def["definition"].tolist() == ["temperature", "rate of T", "rate"]
+
+
+def test_explode_definitions_without_extractable_definition():
+    not_extractable = _annotation(
+        {"MATH_0000": ["<mi>T</mi>", "T", None, "temperature", "0", None, None]}
+    )
+    not_annotated = _annotation(
+        {"MATH_0000": ["<mi>T</mi>", "T", None, None, None, None, None]}
+    )
+    for df_ in [not_extractable, not_annotated, _annotation({})]:
+        df_def = explode_definitions(df_, "P", "paper")
+        assert df_def.empty
+        assert list(df_def.columns) == DEFINITION_COLUMNS
@@ -0,0 +1,38 @@
+import pathlib
+
+import lxml.html
+import pandas as pd
+
+from lib.document import Document
+from lib.streaming import iter_article
+from lib.util import extract_identifiers
+
+SAMPLE_DIR = pathlib.Path(__file__).parent.parent / "data/Anno/Process1/sample"
+
+
+def test_identifiers_of_the_sample():
+    document = Document(SAMPLE_DIR / "sample_preprocessed.html")
+    identifier_list, _ = extract_identifiers(lambda: document.math_html_list)
+    df = pd.read_excel(SAMPLE_DIR / "sample.xlsx", index_col=0, dtype=str)
+    assert [(i_.text_html, i_.text_tex) for i_ in identifier_list] == list(
+        zip(df["identifier_html"], df["identifier_tex"])
+    )
+
+
+def test_masked_article_of_the_sample():
+    document = Document(SAMPLE_DIR / "sample_preprocessed.html")
+    masked_html = (SAMPLE_DIR / "sample_article_masked.html").read_text()
+    assert document.masked_html == masked_html
+
+
+def test_article_is_streamed_by_paragraph():
+    document = Document(SAMPLE_DIR / "sample_preprocessed.html")
+    html_list, unit_tag_list = [], []
+    for kind_, part_, _ in iter_article(SAMPLE_DIR / "sample_preprocessed.html"):
+        if kind_ == "unit":
+            unit_tag_list.append(part_.tag)
+            part_ = lxml.html.tostring(part_, encoding="unicode", with_tail=True)
+        html_list.append(part_)
+    # the paragraphs in the <section> are released, not the whole section
+    assert unit_tag_list and "section" not in unit_tag_list
+    assert "".join(html_list) == document.original_html
@@ -0,0 +1,15 @@
+from tools.generate_dict_draft import draft_dataframe, new_state
+
+
+def test_ids_past_9999_are_ordered_by_number():
+    state = new_state()
+    state["ids"] = [["T", "temperature of the reactor", "10000"]]
+    state["ids"].append(["T", "the temperature of the reactor", "9999"])
+    state["papers"]["a"] = {
+        "digest": "",
+        "rows": [
+            ["P/a/MATH_0000_0", "T", "temperature of the reactor"],
+            ["P/a/MATH_0001_0", "T", "the temperature of the reactor"],
+        ],
+    }
+    assert draft_dataframe(state)["ID"].tolist() == ["9999", "10000"]
@@ -0,0 +1,47 @@
+import threading
+import time
+
+from lib.jobs import DONE, RUNNING, JobQueue
+
+
+def _wait(event, report):
+    event.wait(10)
+
+
+def _done(report):
+    return "done"
+
+
+def _wait_for(job, timeout=5.0):
+    deadline = time.time() + timeout
+    while job.is_active and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_foreground_job_is_not_starved_by_background_jobs():
+    job_queue = JobQueue(max_workers=2)
+    event = threading.Event()
+    background_list = [
+        job_queue.submit(f"prefetch{i}", _wait, event, background=True)
+        for i in range(3)
+    ]
+    try:
+        job = job_queue.submit("open", _done)
+        _wait_for(job)
+        assert job.status == DONE
+        assert sum(job_.status == RUNNING for job_ in background_list) == 1
+    finally:
+        event.set()
+
+
+def test_queued_background_job_is_moved_to_the_foreground():
+    job_queue = JobQueue(max_workers=2)
+    event = threading.Event()
+    job_queue.submit("prefetch0", _wait, event, background=True)
+    job = job_queue.submit("prefetch1", _done, background=True)
+    try:
+        assert job_queue.submit("prefetch1", _done) is job
+        _wait_for(job)
+        assert job.status == DONE
+    finally:
+        event.set()
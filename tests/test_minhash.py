@@ -0,0 +1,19 @@
+from lib.minhash import cluster_texts, normalize_text
+
+
+def test_normalize_text_keeps_identifiers():
+    assert normalize_text("The concentration of A, a species") == (
+        "concentration of a species"
+    )
+    assert normalize_text("An initial value of B") == "initial value of b"
+
+
+def test_cluster_texts():
+    label_array = cluster_texts(
+        ["concentration of A", "concentration of B", "the concentration of A"]
+    )
+    assert label_array.tolist() == [0, 1, 0]
+    label_array = cluster_texts(
+        ["temperature of the reactor", "reactor temperature", "the reactor temperature"]
+    )
+    assert label_array.tolist() == [0, 1, 1]
@@ -0,0 +1,32 @@
+import pathlib
+import shutil
+
+from tools.preprocess import preprocess
+
+SAMPLE_DIR = pathlib.Path(__file__).parent.parent / "data/Anno/Process1/sample"
+
+
+def test_preprocess_reproduces_the_sample(tmp_path):
+    html_path = tmp_path / "sample.html"
+    shutil.copy(SAMPLE_DIR / "sample.html", html_path)
+    saved_path = preprocess(html_path)
+    assert (
+        pathlib.Path(saved_path).read_bytes()
+        == (SAMPLE_DIR / "sample_preprocessed.html").read_bytes()
+    )
+
+
+def test_preprocess_rewrites_powers(tmp_path):
+    html_path = tmp_path / "paper.html"
+    html_path.write_text(
+        '<!DOCTYPE html><html><head><meta charset="utf-8"></head><body>\n'
+        "<p>x <math><msup><mi>k</mi><mn>2</mn></msup></math> y "
+        '<math><mi mathsize="142%">T</mi></math></p>\n</body></html>\n',
+        encoding="utf-8",
+    )
+    saved_path = preprocess(html_path)
+    assert pathlib.Path(saved_path).read_text(encoding="utf-8") == (
+        '<!DOCTYPE html><html><head><meta charset="utf-8"></head><body>\n'
+        "<p>x <math><mi>k</mi>^<mn>2</mn></math> y "
+        "<math><mi>T</mi></math></p>\n</body></html>\n"
+    )
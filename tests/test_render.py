@@ -0,0 +1,26 @@
+import pathlib
+
+from lib.document import Document
+from lib.render import index_blocks, render_window, window_block_ids
+
+SAMPLE_DIR = pathlib.Path(__file__).parent.parent / "data/Anno/Process1/sample"
+
+
+def test_window_of_a_variable_in_the_last_block():
+    document = Document(SAMPLE_DIR / "sample_preprocessed.html")
+    blocks_masked, blocks_original = document.blocks
+    block_index = index_blocks(blocks_masked)
+    n_blocks = len(blocks_masked)
+    last_mask_list = [
+        mask_
+        for mask_, block_id_list_ in block_index.items()
+        if block_id_list_[-1] == n_blocks - 1
+    ]
+    assert last_mask_list
+    for mask_ in last_mask_list:
+        block_id_list = window_block_ids(block_index, n_blocks, mask_, 3)
+        assert block_id_list[-1] == n_blocks - 1
+        html_masked, _ = render_window(
+            blocks_masked, blocks_original, block_id_list, mask_
+        )
+        assert mask_ in html_masked
@@ -0,0 +1,19 @@
+import pytest
+
+from lib.store import AnnotationStore
+
+
+def test_check_segmenter(tmp_path):
+    store = AnnotationStore(tmp_path / "paper.sqlite3")
+    store.check_segmenter("rule")
+    store.check_segmenter("rule")
+    with pytest.raises(ValueError):
+        store.check_segmenter("stanza")
+
+
+def test_check_segmenter_of_previous_annotations(tmp_path):
+    store = AnnotationStore(tmp_path / "paper.sqlite3")
+    store.upsert("MATH_0000", {"sentence_number": "3"})
+    with pytest.raises(ValueError):
+        store.check_segmenter("rule")
+    store.check_segmenter("stanza")
@@ -0,0 +1,249 @@
+import argparse
+import contextlib
+import io
+import json
+import pathlib
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import lxml.html
+import pandas as pd
+
+from lib.cache import CACHE_DIRNAME
+from lib.masking import mask_identifiers
+from lib.util import (
+    e2htmltext,
+    extract_identifiers,
+    parse_html,
+    sentence_segmentation,
+)
+from tools.generate_synthetic_corpus import generate_corpus
+from tools.generate_var_pair_table import generate_pair_table
+from tools.preprocess import preprocess
+
+BENCHMARK_PROCESS = "Benchmark"
+
+
+def measure(fn, repeat: int = 3, setup=None) -> dict:
+    """time fn and trace its peak memory.
+
+    The time is the best of `repeat` runs. The peak is taken in a separate run
+    since tracemalloc slows the code down.
+
+    Args:
+        fn (callable): code to measure.
+        repeat (int): number of timed runs.
+        setup (callable, optional): run before each run of fn, not measured.
+
+    Returns:
+        dict: "seconds" and "peak_mib".
+    """
+    second_list = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        second_list.append(time.perf_counter() - start)
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": min(second_list), "peak_mib": peak / 2**20}
+
+
+def _extract(doc_article_original: str):
+    # the same steps as lib.document.Document
+    math_html_list = [
+        e2htmltext(e) for e in lxml.html.fromstring(doc_article_original).iter("math")
+    ]
+    return extract_identifiers(lambda: math_html_list)[1]
+
+
+def _remove_caches(process_path):
+    for cache_dir_ in process_path.glob("*/" + CACHE_DIRNAME):
+        shutil.rmtree(cache_dir_)
+
+
+def benchmark_size(
+    data_folder, n_equations: int, n_papers: int, depth: int, repeat: int, seed: int
+) -> dict:
+    """generate a corpus with n_equations per paper and measure each stage on it.
+
+    Returns:
+        dict: stage -> result of `measure`.
+    """
+    process_path = pathlib.Path(data_folder) / BENCHMARK_PROCESS
+    if process_path.exists():
+        shutil.rmtree(process_path)
+    paper_dir_list = generate_corpus(
+        process_path, n_papers, n_equations, depth, seed=seed
+    )
+    html_path_list = [str(d / (d.name + ".html")) for d in paper_dir_list]
+    result = {}
+
+    def run_preprocess():
+        # tools.preprocess prints every file
+        with contextlib.redirect_stdout(io.StringIO()):
+            for html_path_ in html_path_list:
+                preprocess(html_path_)
+
+    result["preprocess"] = measure(run_preprocess, repeat)
+
+    article_list = [
+        e2htmltext(parse_html(path_).find(".//article"))
+        for path_ in [p[: -len(".html")] + "_preprocessed.html" for p in html_path_list]
+    ]
+    replaced_list = []
+
+    def run_extract():
+        replaced_list[:] = [_extract(article_) for article_ in article_list]
+
+    result["extract"] = measure(run_extract, repeat)
+
+    masked_list = []
+
+    def run_mask():
+        masked_list[:] = [
+            mask_identifiers(article_, replaced_)[0]
+            for article_, replaced_ in zip(article_list, replaced_list)
+        ]
+
+    result["mask"] = measure(run_mask, repeat)
+
+    text_list = [lxml.html.fromstring(m).text_content() for m in masked_list]
+    # the pipeline of stanza is loaded outside of the measurement
+    sentence_segmentation(text_list[0][:1000])
+
+    def run_segment():
+        for text_ in text_list:
+            sentence_segmentation(text_)
+
+    result["segment"] = measure(run_segment, repeat)
+
+    result["pair_table"] = measure(
+        lambda: generate_pair_table(
+            BENCHMARK_PROCESS, data_folder=pathlib.Path(data_folder), verbose=False
+        ),
+        repeat,
+        setup=lambda: _remove_caches(process_path),
+    )
+    # the labeling of the equivalent definitions is measured only with them
+    df_label = pd.read_csv(
+        process_path / "variable_pair.tsv", sep="\t", usecols=["label"]
+    )
+    if not (df_label["label"] == 1).any():
+        raise RuntimeError(f"the pair table of {process_path} has no positive pair")
+    return result
+
+
+def compare(result: dict, baseline: dict, tolerance: float, min_seconds: float):
+    """return the measurements of result worse than the baseline by more than
+    tolerance (e.g. 0.25 for 25%).
+
+    Times shorter than min_seconds in both runs are too noisy to compare.
+
+    Returns:
+        list: (size, stage, metric, baseline value, value) tuples.
+    """
+    regression_list = []
+    for size_, stage_dict in result["sizes"].items():
+        for stage_, measurement in stage_dict.items():
+            base_measurement = baseline["sizes"].get(size_, {}).get(stage_)
+            if base_measurement is None:
+                continue
+            for metric_, value in measurement.items():
+                base_value = base_measurement[metric_]
+                if metric_ == "seconds" and max(value, base_value) < min_seconds:
+                    continue
+                if value > base_value * (1 + tolerance):
+                    regression_list.append((size_, stage_, metric_, base_value, value))
+    return regression_list
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the time and the peak memory of each stage of the "
+        "pipeline on synthetic corpora."
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[20, 100, 400],
+        help="numbers of equations per paper",
+    )
+    parser.add_argument("--papers", type=int, default=4)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=pathlib.Path, help="save the result as JSON")
+    parser.add_argument("--baseline", type=pathlib.Path, help="JSON saved by --output")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="allowed relative increase over the baseline",
+    )
+    parser.add_argument("--min-seconds", type=float, default=0.05)
+    parser.add_argument(
+        "--workdir",
+        type=pathlib.Path,
+        help="keep the corpora here (default: temporary)",
+    )
+    args = parser.parse_args()
+
+    result = {
+        "python": platform.python_version(),
+        "papers": args.papers,
+        "depth": args.depth,
+        "seed": args.seed,
+        "sizes": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir, warnings.catch_warnings():
+        # the extraction warns about every unexpected tag
+        warnings.simplefilter("ignore")
+        data_folder = args.workdir or pathlib.Path(tmp_dir)
+        for size_ in args.sizes:
+            result["sizes"][str(size_)] = benchmark_size(
+                data_folder, size_, args.papers, args.depth, args.repeat, args.seed
+            )
+
+    print(f"{'size':>6} {'stage':<12} {'seconds':>10} {'peak MiB':>10}")
+    for size_, stage_dict in result["sizes"].items():
+        for stage_, measurement in stage_dict.items():
+            print(
+                f"{size_:>6} {stage_:<12} {measurement['seconds']:>10.4f} "
+                f"{measurement['peak_mib']:>10.2f}"
+            )
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=1)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regression_list = compare(result, baseline, args.tolerance, args.min_seconds)
+        for size_, stage_, metric_, base_value, value in regression_list:
+            print(
+                f"regression: size {size_} {stage_} {metric_} "
+                f"{base_value:.4f} -> {value:.4f} ({value / base_value - 1:+.0%})"
+            )
+        if regression_list:
+            sys.exit(1)
+        print(f"No regression over {args.baseline}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import argparse
+import bisect
+import os
+import pathlib
+import time
+
+from lib.segmenter import SEGMENTER_CLASSES, create_segmenter
+from lib.store import annotation_paths, read_annotations
+from tools.build_corpus import list_paper_dirs
+
+DATA_FOLDER = pathlib.Path(os.getcwd()) / "data/Anno"
+
+
+def _squeeze(text: str) -> str:
+    # segmenters may normalize the spaces, so the texts are compared without them
+    return "".join(text.split())
+
+
+def sentence_boundaries(sentence_list) -> list:
+    """return the starts and ends of the sentences, counted in characters other
+    than spaces, in increasing order."""
+    boundary_list = [0]
+    for sentence_ in sentence_list:
+        boundary_list.append(boundary_list[-1] + len(_squeeze(sentence_)))
+    return boundary_list
+
+
+def reference_spans(text: str, reference_list) -> list:
+    """return the (start, end) of the first occurrence of each reference
+    sentence in the text, counted in characters other than spaces; the
+    sentences which are not found are skipped."""
+    squeezed = _squeeze(text)
+    span_list = []
+    for sentence_ in reference_list:
+        sentence_ = _squeeze(sentence_)
+        start = squeezed.find(sentence_) if sentence_ else -1
+        if start >= 0:
+            span_list.append((start, start + len(sentence_)))
+    return span_list
+
+
+def agreement(span_list, sentence_list) -> dict:
+    """compare the segmentation with the reference sentences.
+
+    Only the boundaries within the spans of the reference sentences are
+    counted, since the rest of the text has no reference.
+
+    Returns:
+        dict: the number of the reference boundaries (starts and ends of the
+            spans), of the predicted boundaries within the spans, of the
+            common ones, of the reference sentences, and of those predicted
+            exactly.
+    """
+    boundary_list = sentence_boundaries(sentence_list)
+    boundary_set = set(boundary_list)
+    reference_set = set()
+    predicted_set = set()
+    n_exact = 0
+    for start, end in span_list:
+        reference_set.update((start, end))
+        low = bisect.bisect_left(boundary_list, start)
+        high = bisect.bisect_right(boundary_list, end)
+        inside = boundary_list[low:high]
+        predicted_set.update(inside)
+        n_exact += inside == [start, end]
+    return {
+        "reference": len(reference_set),
+        "predicted": len(predicted_set),
+        "common": len(reference_set & boundary_set),
+        "sentences": len(span_list),
+        "exact": n_exact,
+    }
+
+
+def load_papers(paper_dir_list) -> list:
+    """return the (paper, text, reference sentences) of the papers which have
+    `_article.txt` and annotated sentences.
+
+    The reference is the sentences the annotators selected
+    (`sentence_with_definition`), which do not change when a segmenter writes
+    `_article_sentence.txt` again.
+    """
+    paper_list = []
+    for paper_dir_ in paper_dir_list:
+        text_path = paper_dir_ / (paper_dir_.name + "_article.txt")
+        paths = annotation_paths(paper_dir_)
+        if not text_path.is_file() or not (
+            paths["db"].is_file() or paths["xlsx"].is_file()
+        ):
+            continue
+        df = read_annotations(paper_dir_)
+        reference_list = list(
+            dict.fromkeys(
+                sentence_
+                for cell_ in df["sentence_with_definition"].dropna()
+                for sentence_ in cell_.split("\n")
+                if sentence_.strip()
+            )
+        )
+        if reference_list:
+            paper_list.append(
+                (
+                    f"{paper_dir_.parent.name}/{paper_dir_.name}",
+                    text_path.read_text(),
+                    reference_list,
+                )
+            )
+    return paper_list
+
+
+def benchmark_segmenter(name: str, paper_list, repeat: int) -> dict:
+    """segment the texts of the papers and compare with the annotated sentences.
+
+    Returns:
+        dict: the load time of the segmenter, the best time over `repeat` runs,
+            the throughput, the precision, recall and F1 of the boundaries, and
+            the fraction of the annotated sentences segmented exactly.
+    """
+    segmenter = create_segmenter(name)
+    text_list = [text_ for _, text_, _ in paper_list]
+
+    start = time.perf_counter()
+    # e.g. stanza loads its model on the first call
+    segmenter.segment("Load the segmenter. It is timed apart.")
+    load_seconds = time.perf_counter() - start
+
+    second_list = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        sentence_lists = segmenter.segment_many(text_list)
+        second_list.append(time.perf_counter() - start)
+
+    count = {"reference": 0, "predicted": 0, "common": 0, "sentences": 0, "exact": 0}
+    for (_, text_, reference_list), sentence_list_ in zip(paper_list, sentence_lists):
+        span_list = reference_spans(text_, reference_list)
+        for key_, value_ in agreement(span_list, sentence_list_).items():
+            count[key_] += value_
+    precision = count["common"] / count["predicted"] if count["predicted"] else 1.0
+    recall = count["common"] / count["reference"] if count["reference"] else 1.0
+    seconds = min(second_list)
+    n_char = sum(len(text_) for text_ in text_list)
+    return {
+        "load_seconds": load_seconds,
+        "seconds": seconds,
+        "chars_per_second": n_char / seconds if seconds else float("inf"),
+        "precision": precision,
+        "recall": recall,
+        "f1": 2 * precision * recall / (precision + recall)
+        if precision + recall
+        else 0.0,
+        "exact": count["exact"] / count["sentences"] if count["sentences"] else 1.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the sentence segmenters with the sentences selected "
+        "in the annotations (boundary agreement) and measure their speed."
+    )
+    parser.add_argument("process", nargs="*", help="default: all processes")
+    parser.add_argument(
+        "--segmenters",
+        nargs="+",
+        default=sorted(SEGMENTER_CLASSES),
+        choices=sorted(SEGMENTER_CLASSES),
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--data-folder", type=pathlib.Path, default=DATA_FOLDER)
+    args = parser.parse_args()
+
+    paper_list = load_papers(list_paper_dirs(args.data_folder, args.process))
+    if not paper_list:
+        print("No paper has both _article.txt and annotated sentences.")
+        return
+    n_sentence = sum(len(s_) for _, _, s_ in paper_list)
+    print(f"{len(paper_list)} papers, {n_sentence} reference sentences")
+
+    print(
+        f"{'segmenter':<10} {'load s':>8} {'seconds':>8} {'kchar/s':>9} "
+        f"{'precision':>9} {'recall':>7} {'F1':>6} {'exact':>6}"
+    )
+    for name_ in args.segmenters:
+        try:
+            result = benchmark_segmenter(name_, paper_list, args.repeat)
+        except ImportError as e:
+            print(f"{name_:<10} not available ({e})")
+            continue
+        print(
+            f"{name_:<10} {result['load_seconds']:>8.3f} {result['seconds']:>8.3f} "
+            f"{result['chars_per_second'] / 1000:>9.1f} {result['precision']:>9.3f} "
+            f"{result['recall']:>7.3f} {result['f1']:>6.3f} {result['exact']:>6.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
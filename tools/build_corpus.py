@@ -0,0 +1,206 @@
+import argparse
+import json
+import os
+import pathlib
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from lib.cache import CACHE_DIRNAME, file_digest
+from lib.dataset import list_papers
+from lib.pipeline import has_artifacts, load_artifacts, write_document_files
+from lib.streaming import stream_document
+from tools.preprocess import preprocess
+
+DATA_FOLDER = pathlib.Path(os.getcwd()) / "data/Anno"
+STAMP_FILENAME = "build.json"
+# stages of build_paper; the last one is "streamed" with --streaming
+BUILD_STAGE_LIST = ["html", "preprocessed", "artifacts"]
+
+
+def convert_tex_to_html(tex_path, html_path):
+    subprocess.run(
+        [
+            "latexmlc",
+            str(tex_path),
+            "--preload=amsmath.sty",
+            "--dest=" + str(html_path),
+        ],
+        check=True,
+    )
+
+
+def _preprocess_html(html_path, preprocessed_path):
+    # tools.preprocess names the output after the input
+    preprocess(html_path)
+
+
+def paper_file_paths(paper_dir) -> dict:
+    paper_dir = pathlib.Path(paper_dir)
+    paper = paper_dir.name
+    return {
+        "tex": paper_dir / (paper + ".tex"),
+        "html": paper_dir / (paper + ".html"),
+        "preprocessed": paper_dir / (paper + "_preprocessed.html"),
+    }
+
+
+def _load_stamps(paper_dir) -> dict:
+    stamp_path = pathlib.Path(paper_dir) / CACHE_DIRNAME / STAMP_FILENAME
+    if not stamp_path.is_file():
+        return {}
+    with open(stamp_path) as f:
+        return json.load(f)
+
+
+def _save_stamps(paper_dir, stamps: dict):
+    stamp_dir = pathlib.Path(paper_dir) / CACHE_DIRNAME
+    stamp_dir.mkdir(exist_ok=True)
+    with open(stamp_dir / STAMP_FILENAME, "w") as f:
+        json.dump(stamps, f, indent=1)
+
+
+def _is_up_to_date(input_path, output_path, stamp) -> bool:
+    if not output_path.is_file():
+        return False
+    if stamp is None:
+        # built before the stamps were introduced
+        return os.path.getmtime(output_path) >= os.path.getmtime(input_path)
+    return stamp == file_digest(input_path)
+
+
+def build_paper(
+    paper_dir, force: bool = False, streaming: bool = False, report=None
+) -> list:
+    """build the stages of a paper whose inputs have changed.
+
+    tex --(latexmlc)--> html --(tools.preprocess)--> _preprocessed.html
+    --(lib.pipeline)--> cached artifacts and the _article*.txt/html files.
+
+    Args:
+        paper_dir (Path): `[process]/[paper]` folder.
+        force (bool): rebuild all stages.
+        streaming (bool): write the _article*.txt/html files with
+            `lib.streaming.stream_document`, whose memory does not grow with
+            the document, instead of building the cached artifacts.
+        report (callable, optional): called with the name of each stage and
+            the fraction of the stages finished before building it, e.g.
+            `lib.jobs.Job.report`.
+
+    Returns:
+        list: names of the stages which were built.
+    """
+    paper_dir = pathlib.Path(paper_dir)
+    paths = paper_file_paths(paper_dir)
+    stamps = _load_stamps(paper_dir)
+    built_stage_list = []
+
+    def report_stage(stage: str, i: int):
+        if report is not None:
+            report(stage, i / len(BUILD_STAGE_LIST))
+
+    stage_list = [
+        ("html", paths["tex"], paths["html"], convert_tex_to_html),
+        ("preprocessed", paths["html"], paths["preprocessed"], _preprocess_html),
+    ]
+    for i, (stage_, input_path, output_path, build_) in enumerate(stage_list):
+        if not input_path.is_file():
+            if output_path.is_file():
+                # e.g. html prepared without a tex file
+                continue
+            raise FileNotFoundError(f"{input_path} does not exist.")
+        if not force and _is_up_to_date(input_path, output_path, stamps.get(stage_)):
+            continue
+        report_stage(stage_, i)
+        build_(input_path, output_path)
+        stamps[stage_] = file_digest(input_path)
+        _save_stamps(paper_dir, stamps)
+        built_stage_list.append(stage_)
+
+    if streaming:
+        masked_path = paper_dir / (paper_dir.name + "_article_masked.html")
+        if force or not _is_up_to_date(
+            paths["preprocessed"], masked_path, stamps.get("streamed")
+        ):
+            report_stage("streamed", 2)
+            stream_document(paths["preprocessed"], paper_dir)
+            stamps["streamed"] = file_digest(paths["preprocessed"])
+            _save_stamps(paper_dir, stamps)
+            built_stage_list.append("streamed")
+    elif force or built_stage_list or not has_artifacts(paths["preprocessed"]):
+        report_stage("artifacts", 2)
+        artifacts = load_artifacts(paths["preprocessed"])
+        # the files of a previous build describe the old document
+        write_document_files(paper_dir, artifacts, overwrite=True)
+        built_stage_list.append("artifacts")
+
+    return built_stage_list
+
+
+def needs_build(paper_dir) -> bool:
+    """return whether the paper has no preprocessed html or no cached
+    artifacts, i.e. whether opening it in the annotation tool would wait for
+    `build_paper`. Changed inputs of built papers are not checked."""
+    paths = paper_file_paths(paper_dir)
+    if not paths["preprocessed"].is_file():
+        return paths["html"].is_file() or paths["tex"].is_file()
+    return not has_artifacts(paths["preprocessed"])
+
+
+def list_paper_dirs(data_folder, process_list=None) -> list:
+    data_folder = pathlib.Path(data_folder)
+    if not process_list:
+        process_list = sorted(list_papers(data_folder))
+    paper_dir_list = []
+    for process_ in process_list:
+        process_path = data_folder / process_
+        paper_dir_list.extend(
+            process_path / f for f in sorted(list_papers(process_path))
+        )
+    return paper_dir_list
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build every stage of the papers whose inputs have changed."
+    )
+    parser.add_argument(
+        "process", nargs="*", help="processes to be built (default: all)"
+    )
+    parser.add_argument("--jobs", "-j", type=int, default=1)
+    parser.add_argument("--force", action="store_true", help="rebuild all stages")
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="extract very large documents as a stream instead of caching the "
+        "artifacts loaded by the annotation tool",
+    )
+    parser.add_argument("--data-folder", type=pathlib.Path, default=DATA_FOLDER)
+    args = parser.parse_args()
+
+    paper_dir_list = list_paper_dirs(args.data_folder, args.process)
+    n_failed = 0
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        future_dict = {
+            executor.submit(
+                build_paper, paper_dir_, args.force, args.streaming
+            ): paper_dir_
+            for paper_dir_ in paper_dir_list
+        }
+        for i, future_ in enumerate(as_completed(future_dict)):
+            paper_dir_ = future_dict[future_]
+            name = f"{paper_dir_.parent.name}/{paper_dir_.name}"
+            try:
+                built_stage_list = future_.result()
+            except Exception as e:
+                n_failed += 1
+                print(f"[{i + 1}/{len(future_dict)}] {name}: failed ({e})")
+                continue
+            msg = ", ".join(built_stage_list) if built_stage_list else "up to date"
+            print(f"[{i + 1}/{len(future_dict)}] {name}: {msg}")
+
+    return 1 if n_failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+import argparse
+import os
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+from lib.minhash import cluster_texts
+from tools.generate_dict_draft import DRAFT_FILENAME, id_sort_key
+
+DATA_FOLDER = pathlib.Path(os.getcwd()) / "data/Anno"
+
+
+def propose_ids(df_draft, threshold=0.6, num_perm=128, k=3, bands=None, seed=0):
+    """add a ProposedID column grouping the near-duplicate definitions.
+
+    The rows of a group are proposed the smallest ID of the group; a row with
+    no near-duplicate keeps its own ID. A ProposedID already in the draft,
+    e.g. reviewed after a previous run, is kept, and so are the other columns.
+
+    Returns:
+        DataFrame: the draft with ProposedID, sorted so the groups are together.
+    """
+    df_draft = df_draft.sort_values("ID", kind="stable", key=id_sort_key)
+    label_array = cluster_texts(
+        df_draft["Definition"].fillna("").tolist(), threshold, num_perm, k, bands, seed
+    )
+    proposed_id_array = df_draft["ID"].values[label_array]
+    if "ProposedID" in df_draft.columns:
+        reviewed_id = df_draft["ProposedID"]
+        is_reviewed = (reviewed_id.notna() & (reviewed_id != "")).values
+        proposed_id_array = np.where(is_reviewed, reviewed_id.values, proposed_id_array)
+    df_draft = df_draft.assign(ProposedID=proposed_id_array)
+    return df_draft.sort_values(["ProposedID", "ID"], kind="stable", key=id_sort_key)
+
+
+def cluster_dict_draft(
+    process: str,
+    threshold=0.6,
+    num_perm=128,
+    k=3,
+    bands=None,
+    seed=0,
+    data_folder=DATA_FOLDER,
+):
+    """write the proposed IDs to the draft of the dictionary of the process.
+
+    Returns:
+        DataFrame: the draft written.
+    """
+    draft_path = pathlib.Path(data_folder) / process / DRAFT_FILENAME
+    df_draft = pd.read_excel(draft_path, index_col=0, dtype=str)
+    df_draft = propose_ids(df_draft, threshold, num_perm, k, bands, seed)
+    df_draft.to_excel(draft_path)
+    return df_draft
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Propose a shared ID for the near-duplicate definitions of "
+        "the dictionary draft (Dict_0.xlsx) written by tools.generate_dict_draft."
+    )
+    parser.add_argument("process", help="e.g. crystallization")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.6,
+        help="minimum Jaccard similarity of the character shingles of two "
+        "definitions of a group",
+    )
+    parser.add_argument("--num-perm", type=int, default=128)
+    parser.add_argument("--shingle", type=int, default=3, help="length of shingles")
+    parser.add_argument(
+        "--bands",
+        type=int,
+        help="LSH bands (default: chosen from the threshold); more bands compare "
+        "more pairs",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    df_draft = cluster_dict_draft(
+        args.process,
+        args.threshold,
+        args.num_perm,
+        args.shingle,
+        args.bands,
+        args.seed,
+    )
+    n_grouped = (df_draft["ProposedID"] != df_draft["ID"]).sum()
+    print(
+        f"{n_grouped:d} of {df_draft.shape[0]:d} definitions are proposed the ID "
+        f"of another in {DRAFT_FILENAME}."
+    )
+
+
+if __name__ == "__main__":
+    main()
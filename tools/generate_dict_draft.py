@@ -1,85 +1,198 @@
+import argparse
+import hashlib
+import json
 import os
 import pathlib
-import re
-import sys
+import tempfile
 
 import pandas as pd
 
-DATA_FOLDER = pathlib.Path(os.getcwd()) / "data/Anno"
+from lib.cache import CACHE_DIRNAME
+from lib.dataset import extractable_definitions, list_papers, load_definitions
 
+DATA_FOLDER = pathlib.Path(os.getcwd()) / "data/Anno"
+DRAFT_FILENAME = "Dict_0.xlsx"
+DRAFT_COLUMNS = ["ID", "identifier_tex", "Definition"]
+# Bump this when the state file changes.
+STATE_VERSION = 1
+STATE_FILENAME = "dict_draft_state.json"
 
-def replace_math_mask_to_tex(definition: str, df):
-    for math_elem in re.findall("MATH_[0-9]{4}", definition):
-        definition = definition.replace(math_elem, df["identifier_tex"][math_elem])
 
-    return definition
+def id_sort_key(id_series) -> pd.Series:
+    """sort key of the IDs: the number, so that "10000" comes after "9999"."""
+    return pd.to_numeric(id_series, errors="coerce")
 
 
 def generate_df_with_ID_Def(process: str, paper: str, data_folder=DATA_FOLDER):
-    xlsx_path = data_folder / process / paper / (paper + ".xlsx")
-    df = pd.read_excel(xlsx_path, index_col=0, dtype="str")
-
-    # use definition_extracted
-    id_list = []
-    def_identifier_list = []
-    for i, extractable_str_ in enumerate(df["extractable"]):
-        if extractable_str_ == "0":
+    return extractable_definitions(load_definitions(data_folder / process / paper))
+
+
+def paper_rows(df_id_def) -> list:
+    """return the (source ID, identifier_tex, Definition) rows of a paper,
+    keeping the first row of each (identifier_tex, Definition)."""
+    row_dict = {}
+    for source_, tex_, def_ in zip(
+        df_id_def.index, df_id_def["identifier_tex"], df_id_def["Definition"]
+    ):
+        if pd.isna(def_):
             continue
-        extractable_list_ = extractable_str_.split("\n")
-        def_extracted_list_ = df["definition_extracted"][i].split("\n")
-
-        for ii, (def_extracted_, extractable_) in enumerate(
-            zip(def_extracted_list_, extractable_list_)
-        ):
-            if extractable_ == "1":
-                id_list.append(f"{process}/{paper}/{df.index[i]}_{ii}")
-
-                for math_elem in re.findall("MATH_[0-9]{4}", def_extracted_):
-                    def_extracted_ = def_extracted_.replace(
-                        math_elem, df["identifier_tex"][math_elem]
-                    )
-                def_identifier_list.append([df["identifier_tex"][i], def_extracted_])
-
-    # # use definition_true
-    # id_list = []
-    # def_identifier_list = []
-    # for i, (def_str_, identifier_str_) in enumerate(
-    #         zip(df['definition_true'], df['identifier_tex'])):
-
-    #     if not isinstance(def_str_, str):
-    #         continue
-    #     def_list_ = def_str_.split('\n')
-
-    #     id_list_ = [
-    #         f'{process}/{paper}/{i}_{ii}' for ii,
-    #         _ in enumerate(def_list_)]
-    #     id_list.extend(id_list_)
-    #     def_identifier_list_ = [
-    #         [identifier_str_, replace_math_mask_to_tex(def_, df)] for def_ in def_list_]
-    #     def_identifier_list.extend(def_identifier_list_)
-
-    return pd.DataFrame(
-        def_identifier_list, index=id_list, columns=["identifier_tex", "Definition"]
+        tex_ = "" if pd.isna(tex_) else tex_
+        row_dict.setdefault((tex_, def_), [source_, tex_, def_])
+    return list(row_dict.values())
+
+
+def rows_digest(row_list) -> str:
+    h = hashlib.sha256()
+    h.update(json.dumps(row_list, ensure_ascii=False).encode())
+    return h.hexdigest()
+
+
+def new_state() -> dict:
+    """return an empty state.
+
+    "ids" lists the [identifier_tex, Definition, ID] ever assigned, so an entry
+    keeps its ID while any paper contains it. "papers" keeps the rows of each
+    paper with their digest.
+    """
+    return {"version": STATE_VERSION, "next_id": 0, "ids": [], "papers": {}}
+
+
+def load_state(state_path, draft_path=None) -> dict:
+    """return the saved state, or a new one seeded with the IDs of the draft
+    written before the state existed."""
+    state_path = pathlib.Path(state_path)
+    if state_path.is_file():
+        with open(state_path) as f:
+            state = json.load(f)
+        if state.get("version") == STATE_VERSION:
+            return state
+    state = new_state()
+    if draft_path is not None and pathlib.Path(draft_path).is_file():
+        df_draft = pd.read_excel(draft_path, index_col=0, dtype=str)
+        seen_set = set()
+        tex_series = df_draft["identifier_tex"].fillna("")
+        for tex_, def_, id_ in zip(tex_series, df_draft["Definition"], df_draft["ID"]):
+            if pd.isna(def_) or (tex_, def_) in seen_set:
+                continue
+            seen_set.add((tex_, def_))
+            state["ids"].append([tex_, def_, id_])
+            state["next_id"] = max(state["next_id"], int(id_) + 1)
+    return state
+
+
+def save_state(state, state_path) -> None:
+    state_path = pathlib.Path(state_path)
+    state_path.parent.mkdir(exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=state_path.parent, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, state_path)
+
+
+def update_state(state, paper_rows_dict) -> list:
+    """replace the rows of the papers whose content has changed.
+
+    Args:
+        state (dict): returned by `load_state`, updated in place.
+        paper_rows_dict (dict): paper -> rows returned by `paper_rows`, for all
+            papers of the process; the other papers are removed.
+
+    Returns:
+        list: the papers added, updated or removed.
+    """
+    changed_list = []
+    for paper_, row_list in paper_rows_dict.items():
+        digest = rows_digest(row_list)
+        if state["papers"].get(paper_, {}).get("digest") == digest:
+            continue
+        state["papers"][paper_] = {"digest": digest, "rows": row_list}
+        changed_list.append(paper_)
+    for paper_ in set(state["papers"]) - set(paper_rows_dict):
+        del state["papers"][paper_]
+        changed_list.append(paper_)
+
+    # entries seen for the first time get the next IDs
+    id_dict = {(tex_, def_): id_ for tex_, def_, id_ in state["ids"]}
+    for paper_ in changed_list:
+        for _, tex_, def_ in state["papers"].get(paper_, {}).get("rows", []):
+            if (tex_, def_) not in id_dict:
+                id_dict[(tex_, def_)] = f"{state['next_id']:04}"
+                state["ids"].append([tex_, def_, id_dict[(tex_, def_)]])
+                state["next_id"] += 1
+    return changed_list
+
+
+def draft_dataframe(state) -> pd.DataFrame:
+    """return the draft: one row per (identifier_tex, Definition) found in the
+    papers, indexed by the definition ID (`process/paper/MATH_xxxx_i`) of its
+    first occurrence and sorted by ID."""
+    id_dict = {(tex_, def_): id_ for tex_, def_, id_ in state["ids"]}
+    row_dict = {}
+    for paper_ in sorted(state["papers"]):
+        for source_, tex_, def_ in state["papers"][paper_]["rows"]:
+            if (tex_, def_) not in row_dict:
+                row_dict[(tex_, def_)] = (source_, id_dict[(tex_, def_)])
+    df_draft = pd.DataFrame(
+        [(id_, tex_, def_) for (tex_, def_), (_, id_) in row_dict.items()],
+        index=[source_ for source_, _ in row_dict.values()],
+        columns=DRAFT_COLUMNS,
     )
+    return df_draft.sort_values("ID", kind="stable", key=id_sort_key)
+
+
+def keep_review_columns(df_draft, draft_path) -> pd.DataFrame:
+    """copy the columns added to the previous draft (e.g. the ProposedID written
+    by tools.cluster_dict_draft and reviewed since) to the rows of the same ID;
+    the new rows have them empty."""
+    draft_path = pathlib.Path(draft_path)
+    if not draft_path.is_file():
+        return df_draft
+    df_previous = pd.read_excel(draft_path, index_col=0, dtype=str)
+    extra_columns = [c_ for c_ in df_previous.columns if c_ not in DRAFT_COLUMNS]
+    if not extra_columns:
+        return df_draft
+    df_previous = df_previous.drop_duplicates("ID").set_index("ID")[extra_columns]
+    return df_draft.join(df_previous, on="ID")
+
+
+def generate_dict_draft(process: str, data_folder=DATA_FOLDER, rebuild=False):
+    """update the draft of the dictionary of the process with the papers whose
+    definitions have changed, keeping the columns added to the draft since.
+
+    Returns:
+        list: the papers added, updated or removed since the last run.
+    """
+    process_path = pathlib.Path(data_folder) / process
+    draft_path = process_path / DRAFT_FILENAME
+    state_path = process_path / CACHE_DIRNAME / STATE_FILENAME
+    state = new_state() if rebuild else load_state(state_path, draft_path)
+
+    paper_rows_dict = {
+        paper_: paper_rows(generate_df_with_ID_Def(process, paper_, data_folder))
+        for paper_ in sorted(list_papers(process_path))
+    }
+    changed_list = update_state(state, paper_rows_dict)
+    if changed_list or not draft_path.is_file():
+        keep_review_columns(draft_dataframe(state), draft_path).to_excel(draft_path)
+    save_state(state, state_path)
+    return changed_list
 
 
 def main():
-    args = sys.argv
-    process = args[1]  # e.g. crystallization
-    process_path = DATA_FOLDER / process
-
-    df_dict = pd.DataFrame(columns=["identifier_tex", "Definition"])
-
-    paper_list = [
-        f for f in os.listdir(process_path) if os.path.isdir(process_path / f)
-    ]
-    for paper_ in paper_list:
-        df_dict = pd.concat([df_dict, generate_df_with_ID_Def(process, paper_)], axis=0)
-    df_dict["ID"] = [f"{i:04}" for i in range(df_dict.shape[0])]
-    df_dict.to_excel(
-        DATA_FOLDER / process / "Dict_0.xlsx",
-        columns=["ID", "identifier_tex", "Definition"],
+    parser = argparse.ArgumentParser(
+        description="Write the draft of the dictionary (Dict_0.xlsx) from the "
+        "definitions of the papers. The IDs of the entries are kept across runs."
+    )
+    parser.add_argument("process", help="e.g. crystallization")
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="forget the previous IDs and number the entries from 0",
     )
+    args = parser.parse_args()
+
+    changed_list = generate_dict_draft(args.process, rebuild=args.rebuild)
+    print(f"{len(changed_list)} papers updated.")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,390 @@
+import argparse
+import os
+import pathlib
+import random
+
+import pandas as pd
+
+from lib.store import ANNOTATION_COLUMNS
+
+DATA_FOLDER = pathlib.Path(os.getcwd()) / "data/Anno"
+
+INVISIBLE_TIMES = "⁢"
+LETTER_LIST = list("CTPVFkmnqrhuxyzw")
+GREEK_LIST = [("α", "\\alpha"), ("β", "\\beta"), ("ρ", "\\rho"), ("μ", "\\mu")]
+QUANTITY_LIST = [
+    "concentration",
+    "temperature",
+    "pressure",
+    "flow rate",
+    "heat capacity",
+    "density",
+    "rate constant",
+    "activation energy",
+    "volume",
+    "mass",
+    "residence time",
+    "heat transfer coefficient",
+    "conversion",
+    "molar fraction",
+]
+# another name of each quantity, so that the phrasings of a meaning differ by
+# more than an article and make positive pairs in the pair table
+QUANTITY_SYNONYM_DICT = {
+    "concentration": "molar concentration",
+    "temperature": "absolute temperature",
+    "pressure": "absolute pressure",
+    "flow rate": "volumetric flow rate",
+    "heat capacity": "specific heat",
+    "density": "mass density",
+    "rate constant": "reaction rate constant",
+    "activation energy": "energy of activation",
+    "volume": "holdup volume",
+    "mass": "total mass",
+    "residence time": "mean residence time",
+    "heat transfer coefficient": "overall heat transfer coefficient",
+    "conversion": "fractional conversion",
+    "molar fraction": "mole fraction",
+}
+QUALIFIER_LIST = [
+    "of component A",
+    "of component B",
+    "in the reactor",
+    "of the feed",
+    "of the jacket",
+    "at the outlet",
+    "of the catalyst",
+    "of the solvent",
+]
+
+HTML_HEAD = """<!DOCTYPE html><html>
+<head>
+<title>{title}</title>
+<!--Generated by tools.generate_synthetic_corpus in the shape of LaTeXML.-->
+<meta http-equiv="Content-Type" content="text/html; charset=UTF-8">
+</head>
+<body>
+<div class="ltx_page_main">
+<div class="ltx_page_content">
+<article class="ltx_document">
+"""
+HTML_TAIL = """</article>
+</div>
+</div>
+</body>
+</html>
+"""
+
+
+def meaning_groups():
+    """return the phrasings of each meaning; the phrasings of a meaning share an
+    ID of Dict.xlsx.
+
+    The two first phrasings differ only by an article, so their pairs are
+    skipped by the pair table; the synonym makes the positive pairs.
+    """
+    return [
+        [
+            f"{quantity_} {qualifier_}",
+            f"the {quantity_} {qualifier_}",
+            f"the {QUANTITY_SYNONYM_DICT[quantity_]} {qualifier_}",
+        ]
+        for quantity_ in QUANTITY_LIST
+        for qualifier_ in QUALIFIER_LIST
+    ]
+
+
+def _mi(text: str, rng, normal: bool = False) -> str:
+    attrib = ' mathvariant="normal"' if normal else ""
+    # LaTeXML writes mathsize for \large etc.; tools.preprocess removes it
+    if rng.random() < 0.05:
+        attrib += ' mathsize="142%"'
+    return f"<mi{attrib}>{text}</mi>"
+
+
+def make_identifier(i: int, rng) -> dict:
+    """return the MathML and TeX of the i-th identifier of the pool.
+
+    The identifiers cover the shapes handled by lib.util.extract_symbols:
+    <mi>, <msub>, <msubsup>, <mmultiscripts>, <mover> and runs joined by
+    InvisibleTimes.
+    """
+    if i % 5 == 4:
+        html, tex = GREEK_LIST[i % len(GREEK_LIST)]
+    else:
+        html = tex = LETTER_LIST[i % len(LETTER_LIST)]
+    n = i // len(LETTER_LIST)
+    kind = n % 7
+    if kind == 0:
+        mathml = _mi(html, rng)
+    elif kind == 1:
+        mathml = f"<msub>{_mi(html, rng)}<mn>{n}</mn></msub>"
+        tex = f"{tex}_{{{n}}}"
+    elif kind == 2:
+        sub = "ABRLG"[n % 5]
+        mathml = f"<msub>{_mi(html, rng)}{_mi(sub, rng, normal=True)}</msub>"
+        tex = f"{tex}_{{\\mathrm{{{sub}}}}}"
+    elif kind == 3:
+        mathml = f"<msubsup>{_mi(html, rng)}<mi>i</mi><mo>′</mo></msubsup>"
+        tex = f"{tex}_{{i}}^{{\\prime}}"
+    elif kind == 4:
+        mathml = (
+            f"<mmultiscripts>{_mi(html, rng)}<none/><none/>"
+            f"<mprescripts/><mn>{n}</mn><none/></mmultiscripts>"
+        )
+        tex = f"{{}}_{{{n}}}{tex}"
+    elif kind == 5:
+        mathml = f'<mover accent="true">{_mi(html, rng)}<mo>˙</mo></mover>'
+        tex = f"\\dot{{{tex}}}"
+    else:
+        mathml = (
+            f"<mrow><mi>M</mi><mo>{INVISIBLE_TIMES}</mo>"
+            f"<msub>{_mi(html, rng)}<mi>c</mi></msub></mrow>"
+        )
+        tex = f"M{tex}_{{c}}"
+    return {"mathml": mathml, "tex": tex}
+
+
+def _expression(identifier_list, depth: int, rng):
+    """return the MathML and TeX of a random expression of the identifiers."""
+    r = rng.random()
+    if depth <= 0 or r < 0.25:
+        identifier_ = rng.choice(identifier_list)
+        return identifier_["mathml"], identifier_["tex"]
+    if r < 0.45:
+        # InvisibleTimes run
+        term_list = [
+            _expression(identifier_list, depth - 1, rng)
+            for _ in range(rng.randint(2, 4))
+        ]
+        mathml = f"<mo>{INVISIBLE_TIMES}</mo>".join(m for m, _ in term_list)
+        return f"<mrow>{mathml}</mrow>", " ".join(t for _, t in term_list)
+    if r < 0.6:
+        base_mathml, base_tex = _expression(identifier_list, depth - 1, rng)
+        if rng.random() < 0.5:
+            base_mathml = f"<mrow><mo>(</mo>{base_mathml}<mo>)</mo></mrow>"
+            base_tex = f"\\left({base_tex}\\right)"
+        power = rng.choice(["2", "3", "-1"])
+        power_mathml = (
+            f"<mn>{power}</mn>"
+            if power[0] != "-"
+            else f"<mrow><mo>-</mo><mn>{power[1:]}</mn></mrow>"
+        )
+        return (
+            f"<msup>{base_mathml}{power_mathml}</msup>",
+            f"{{{base_tex}}}^{{{power}}}",
+        )
+    if r < 0.72:
+        (m0, t0), (m1, t1) = (
+            _expression(identifier_list, depth - 1, rng),
+            _expression(identifier_list, depth - 1, rng),
+        )
+        return f"<mfrac>{m0}{m1}</mfrac>", f"\\frac{{{t0}}}{{{t1}}}"
+    if r < 0.82:
+        m0, t0 = _expression(identifier_list, depth - 1, rng)
+        return (
+            "<mrow><munderover><mo>∑</mo><mrow><mi>j</mi><mo>=</mo><mn>1</mn></mrow>"
+            f"<mi>N</mi></munderover>{m0}</mrow>",
+            f"\\sum_{{j=1}}^{{N}}{t0}",
+        )
+    (m0, t0), (m1, t1) = (
+        _expression(identifier_list, depth - 1, rng),
+        _expression(identifier_list, depth - 1, rng),
+    )
+    operator = rng.choice(["+", "-"])
+    return f"<mrow>{m0}<mo>{operator}</mo>{m1}</mrow>", f"{t0}{operator}{t1}"
+
+
+def _inline_math(math_id: str, identifier_: dict) -> str:
+    return (
+        f'<math id="{math_id}" class="ltx_Math" alttext="{identifier_["tex"]}" '
+        f'display="inline">{identifier_["mathml"]}</math>'
+    )
+
+
+def generate_paper(
+    n_equations: int,
+    depth: int = 3,
+    n_identifiers: int = None,
+    seed: int = 0,
+    pool_size: int = 200,
+):
+    """generate a paper in the shape of the LaTeXML output.
+
+    Each equation is followed by a sentence defining some of its identifiers,
+    e.g. "where x denotes the temperature in the reactor.".
+
+    Args:
+        n_equations (int): number of display equations.
+        depth (int): maximum nesting of the expressions.
+        n_identifiers (int): number of distinct identifiers (default: half of
+            n_equations, at least 4).
+        seed (int): seed of the paper.
+        pool_size (int): number of identifiers shared by the papers of a corpus.
+
+    Returns:
+        tuple: (html, annotation) where annotation is a list of
+            (identifier, definition) in the order of first definition.
+    """
+    rng = random.Random(seed)
+    group_list = meaning_groups()
+    if n_identifiers is None:
+        n_identifiers = max(4, n_equations // 2)
+    pool_rng = random.Random(0)
+    pool = [make_identifier(i, pool_rng) for i in range(pool_size)]
+    identifier_number_list = rng.sample(
+        range(pool_size), min(n_identifiers, pool_size)
+    )
+    identifier_list = [pool[i] for i in identifier_number_list]
+    # the meaning of an identifier is shared by the papers
+    definition_dict = {
+        identifier_["tex"]: rng.choice(group_list[i % len(group_list)])
+        for i, identifier_ in zip(identifier_number_list, identifier_list)
+    }
+
+    html_list = [HTML_HEAD.format(title=f"Synthetic paper {seed}")]
+    annotation = []
+    defined_set = set()
+    n_sections = max(1, n_equations // 10)
+    for e in range(n_equations):
+        section = e * n_sections // n_equations + 1
+        if e == 0 or section != (e - 1) * n_sections // n_equations + 1:
+            if e > 0:
+                html_list.append("</section>\n")
+            html_list.append(
+                f'<section id="S{section}" class="ltx_section">\n'
+                f'<h2 class="ltx_title ltx_title_section">'
+                f'<span class="ltx_tag ltx_tag_section">{section} </span>Model</h2>\n'
+            )
+        lhs = rng.choice(identifier_list)
+        rhs_mathml, rhs_tex = _expression(identifier_list, depth, rng)
+        defined_list = rng.sample(identifier_list, min(3, len(identifier_list)))
+        html_list.append(
+            f'<div id="S{section}.p{e + 1}" class="ltx_para">\n'
+            '<p class="ltx_p">The balance is given as follows:</p>\n'
+            f'<table id="S{section}.E{e + 1}" class="ltx_equation ltx_eqn_table">\n'
+            '<tr class="ltx_equation ltx_eqn_row ltx_align_baseline">\n'
+            '<td class="ltx_eqn_cell ltx_align_center">'
+            f'<math id="S{section}.E{e + 1}.m1" class="ltx_Math" '
+            f'alttext="{lhs["tex"]}={rhs_tex}" display="block">'
+            f'<mrow>{lhs["mathml"]}<mo>=</mo>{rhs_mathml}</mrow></math></td>\n'
+            '<td class="ltx_eqn_cell ltx_eqn_eqno ltx_align_middle ltx_align_right">'
+            f'<span class="ltx_tag ltx_tag_equation ltx_align_right">({e + 1})</span>'
+            "</td>\n</tr>\n</table>\n"
+        )
+        clause_list = []
+        for k, identifier_ in enumerate(defined_list):
+            definition = definition_dict[identifier_["tex"]]
+            clause_list.append(
+                f"{_inline_math(f'S{section}.p{e + 1}.m{k + 1}', identifier_)} "
+                f"denotes {definition}"
+            )
+            if identifier_["tex"] not in defined_set:
+                defined_set.add(identifier_["tex"])
+                annotation.append((identifier_, definition))
+        html_list.append(
+            f'<p class="ltx_p">where {", and ".join(clause_list)}.</p>\n</div>\n'
+        )
+    html_list.append("</section>\n")
+    html_list.append(HTML_TAIL)
+    return "".join(html_list), annotation
+
+
+def annotation_dataframe(annotation, seed: int = 0) -> pd.DataFrame:
+    """return the annotation table of the paper in the shape of the xlsx written
+    by the annotation tool.
+
+    The rows are numbered in the order the identifiers are first defined, which
+    may differ from the numbering of lib.util.extract_symbols; the definitions
+    are what lib.dataset and the pair table read.
+    """
+    rng = random.Random(seed)
+    row_dict = {}
+    for i, (identifier_, definition) in enumerate(annotation):
+        extractable = rng.random() < 0.8
+        row_dict[f"MATH_{i:04d}"] = {
+            "identifier_html": identifier_["mathml"],
+            "identifier_tex": identifier_["tex"],
+            "definition_extracted": definition if extractable else None,
+            "definition_true": definition,
+            "extractable": "1" if extractable else "0",
+            "sentence_number": None,
+            "sentence_with_definition": None,
+        }
+    return pd.DataFrame.from_dict(row_dict, orient="index", columns=ANNOTATION_COLUMNS)
+
+
+def dict_dataframe() -> pd.DataFrame:
+    """return Dict.xlsx giving the same ID to the phrasings of a meaning."""
+    row_list = [
+        {"ID": f"{i:04d}", "identifier_tex": "", "Definition": definition_}
+        for i, group_ in enumerate(meaning_groups())
+        for definition_ in group_
+    ]
+    return pd.DataFrame(row_list, columns=["ID", "identifier_tex", "Definition"])
+
+
+def generate_corpus(
+    process_path,
+    n_papers: int,
+    n_equations: int,
+    depth: int = 3,
+    n_identifiers: int = None,
+    seed: int = 0,
+):
+    """write n_papers synthetic papers with their annotation and Dict.xlsx.
+
+    The layout is the one of data/Anno: `[process]/[paper]/[paper].html`,
+    `[process]/[paper]/[paper].xlsx` and `[process]/Dict.xlsx`.
+
+    Returns:
+        list: paths to the paper directories.
+    """
+    process_path = pathlib.Path(process_path)
+    process_path.mkdir(parents=True, exist_ok=True)
+    paper_dir_list = []
+    for p in range(n_papers):
+        paper = f"paper{p:03d}"
+        paper_dir = process_path / paper
+        paper_dir.mkdir(exist_ok=True)
+        html, annotation = generate_paper(
+            n_equations, depth, n_identifiers, seed=seed * 1000 + p
+        )
+        with open(paper_dir / (paper + ".html"), "w", encoding="utf-8") as f:
+            f.write(html)
+        annotation_dataframe(annotation, seed=seed * 1000 + p).to_excel(
+            paper_dir / (paper + ".xlsx")
+        )
+        paper_dir_list.append(paper_dir)
+    dict_dataframe().to_excel(process_path / "Dict.xlsx", index=False)
+    return paper_dir_list
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic corpus in the shape of the LaTeXML output."
+    )
+    parser.add_argument("process", help="name of the generated process")
+    parser.add_argument("--papers", type=int, default=4)
+    parser.add_argument("--equations", type=int, default=50, help="per paper")
+    parser.add_argument("--depth", type=int, default=3, help="nesting of the equations")
+    parser.add_argument(
+        "--identifiers", type=int, default=None, help="distinct identifiers per paper"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-folder", type=pathlib.Path, default=DATA_FOLDER)
+    args = parser.parse_args()
+
+    paper_dir_list = generate_corpus(
+        args.data_folder / args.process,
+        args.papers,
+        args.equations,
+        args.depth,
+        args.identifiers,
+        args.seed,
+    )
+    print(f"Generated {len(paper_dir_list)} papers in {paper_dir_list[0].parent}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,22 @@
+import argparse
+import collections
 import itertools
 import os
 import pathlib
-import re
-import sys
+import tempfile
 import warnings
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 import pandas as pd
 
+from lib.dataset import extractable_definitions, list_papers, load_definitions
+
 DATA_FOLDER = pathlib.Path(os.getcwd()) / "data/Anno"
 
 
 def generate_df_with_ID_Def(process: str, paper: str, data_folder=DATA_FOLDER):
-    xlsx_path = data_folder / process / paper / (paper + ".xlsx")
-    df = pd.read_excel(xlsx_path, index_col=0, dtype="str")
-
-    id_list = []
-    definition_list = []
-    for i, extractable_str_ in enumerate(df["extractable"]):
-        if extractable_str_ == "0":
-            continue
-        extractable_list_ = extractable_str_.split("\n")
-        def_extracted_list_ = df["definition_extracted"][i].split("\n")
-
-        for ii, (def_extracted_, extractable_) in enumerate(
-            zip(def_extracted_list_, extractable_list_)
-        ):
-            if extractable_ == "1":
-                id_list.append(f"{process}/{paper}/{df.index[i]}_{ii}")
-
-                for math_elem in re.findall("MATH_[0-9]{4}", def_extracted_):
-                    def_extracted_ = def_extracted_.replace(
-                        math_elem, df["identifier_tex"][math_elem]
-                    )
-
-                definition_list.append(def_extracted_)
-
-    return pd.DataFrame(definition_list, index=id_list, columns=["Definition"])
+    return extractable_definitions(load_definitions(data_folder / process / paper))
 
 
 def load_dict(process: str, data_folder=DATA_FOLDER):
@@ -44,83 +25,507 @@ def load_dict(process: str, data_folder=DATA_FOLDER):
     return df
 
 
-def judge_equivalence_by_dict(df_dict, def_0, def_1):
-    dict_index_ID_0 = df_dict["ID"][((df_dict == def_0).sum(axis=1) == 1)].values
-    dict_index_ID_1 = df_dict["ID"][((df_dict == def_1).sum(axis=1) == 1)].values
-    if dict_index_ID_0.size > 0 and dict_index_ID_1.size > 0:
-        if len(dict_index_ID_0) > 1 or len(dict_index_ID_0) > 1:
-            warnings.warn(
-                f"len(dict_index_ID_0) is {len(dict_index_ID_0)} and\
-                     len(dict_index_ID_1) is {len(dict_index_ID_1)}. \
-                        Each length should be 0 or 1.\n \
-                        def_0: {def_0}\t def_1: {def_1}"
+ARTICLE_LIST = ["the", "The", "a", "an", "A", "An"]
+PAIR_COLUMNS = ["label", "ID0", "ID1", "Definition0", "Definition1"]
+# words ignored when blocking the pairs by shared words
+BLOCKING_STOPWORD_SET = frozenset(
+    ["a", "an", "the", "of", "for", "in", "on", "at", "to", "by", "with", "and", "or"]
+)
+# including the header row
+EXCEL_MAX_ROWS = 1048576
+
+
+def remove_article(def_word: str, target: str = None):
+    def_word_list = def_word.split(" ")
+    if def_word_list[0] in ARTICLE_LIST:
+        def_word = " ".join(def_word_list[1:])
+    if target == "all":
+        def_word = [x for x in def_word_list if x not in ARTICLE_LIST]
+    return def_word
+
+
+def build_dict_index(df_dict) -> dict:
+    """return the mapping from a definition to the IDs of the dictionary rows
+    in which it appears exactly once."""
+    dict_index = {}
+    for row_ in df_dict.itertuples(index=False):
+        cell_count_dict = {}
+        for cell_ in row_:
+            if isinstance(cell_, str):
+                cell_count_dict[cell_] = cell_count_dict.get(cell_, 0) + 1
+        for cell_, count_ in cell_count_dict.items():
+            if count_ == 1:
+                dict_index[cell_] = dict_index.get(cell_, ()) + (row_.ID,)
+    return dict_index
+
+
+def lookup_dict_ID(dict_index, definition: str) -> str:
+    dict_ID_tuple = dict_index.get(definition, ())
+    if len(dict_ID_tuple) > 1:
+        warnings.warn(
+            f"{definition} appears in {len(dict_ID_tuple)} rows of the dictionary. "
+            "Each definition should appear in one row."
+        )
+    # a definition in several rows is equivalent only to one in the same rows
+    return "".join(dict_ID_tuple)
+
+
+def judge_equivalence_by_dict(dict_index, def_0, def_1):
+    dict_ID_0 = lookup_dict_ID(dict_index, def_0)
+    dict_ID_1 = lookup_dict_ID(dict_index, def_1)
+    return dict_ID_0 != "" and dict_ID_0 == dict_ID_1
+
+
+def prepare_definitions(df_ID_Def, dict_index, word_code_dict) -> dict:
+    """precompute what is compared for each definition of a paper.
+
+    Args:
+        df_ID_Def (DataFrame): returned by `generate_df_with_ID_Def`.
+        dict_index (dict): returned by `build_dict_index`.
+        word_code_dict (dict): integer codes of the word lists, shared by all papers.
+
+    Returns:
+        dict: arrays of the IDs, the identifiers, the dictionary IDs, the
+            definitions without the first article, the codes of the word lists
+            without any article, and the sets of the words used for blocking.
+    """
+    dict_ID_list = []
+    def_stripped_list = []
+    word_code_list = []
+    token_list = []
+    for def_ in df_ID_Def["Definition"]:
+        dict_ID_list.append(lookup_dict_ID(dict_index, def_))
+        def_stripped = remove_article(def_)
+        def_stripped_list.append(def_stripped)
+        word_tuple = tuple(remove_article(def_stripped, "all"))
+        word_code_list.append(word_code_dict.setdefault(word_tuple, len(word_code_dict)))
+        token_list.append(
+            frozenset(w.lower() for w in word_tuple) - BLOCKING_STOPWORD_SET
+        )
+    return {
+        "ID": df_ID_Def.index.values,
+        "identifier_tex": df_ID_Def["identifier_tex"].values.astype(object),
+        "dict_ID": np.array(dict_ID_list, dtype=object),
+        "Definition": np.array(def_stripped_list, dtype=object),
+        "word_code": np.array(word_code_list, dtype=np.int64),
+        "token": np.array(token_list, dtype=object),
+    }
+
+
+def label_pairs(
+    definitions_0: dict,
+    definitions_1: dict,
+    chunk_pairs: int = 1000000,
+    sampler=None,
+    shard_key: int = 0,
+):
+    """label every pair of the definitions of two papers.
+
+    The pairs are in the order of itertools.product, and the pairs whose
+    definitions are the same except for articles are skipped.
+
+    Args:
+        definitions_0 (dict): returned by `prepare_definitions`.
+        definitions_1 (dict): returned by `prepare_definitions`.
+        chunk_pairs (int): approximate upper bound of the pairs in a chunk.
+        sampler (NegativeSampler, optional): if given, only the pairs it
+            selects are returned.
+        shard_key (int): seeds the sampler together with the chunk position,
+            e.g. the index of the paper combination.
+
+    Yields:
+        DataFrame: labeled pairs.
+    """
+    n_def_1 = len(definitions_1["ID"])
+    if n_def_1 == 0:
+        return
+    n_row_per_chunk = max(1, chunk_pairs // n_def_1)
+    for start in range(0, len(definitions_0["ID"]), n_row_per_chunk):
+        chunk_0 = {k: v[start : start + n_row_per_chunk] for k, v in definitions_0.items()}
+
+        is_equivalent = (
+            chunk_0["dict_ID"][:, None] == definitions_1["dict_ID"][None, :]
+        ) & (chunk_0["dict_ID"] != "")[:, None]
+        is_kept = chunk_0["word_code"][:, None] != definitions_1["word_code"][None, :]
+        if sampler is not None:
+            is_kept = sampler.select(
+                is_equivalent,
+                is_kept,
+                chunk_0,
+                definitions_1,
+                sampler.rng(shard_key, start),
             )
-        is_equivalent = "".join(dict_index_ID_0) == "".join(dict_index_ID_1)
-    else:
-        is_equivalent = False
-    return is_equivalent
+        index_0, index_1 = np.nonzero(is_kept)
 
+        yield pd.DataFrame(
+            {
+                "label": is_equivalent[index_0, index_1].astype(int),
+                "ID0": chunk_0["ID"][index_0],
+                "ID1": definitions_1["ID"][index_1],
+                "Definition0": chunk_0["Definition"][index_0],
+                "Definition1": definitions_1["Definition"][index_1],
+            },
+            columns=PAIR_COLUMNS,
+        )
 
-def main():
-    args = sys.argv
-    process = args[1]  # e.g. crystallization
-
-    process_path = DATA_FOLDER / process
-
-    df_dict = load_dict(process)
-
-    paper_list = [
-        f for f in os.listdir(process_path) if os.path.isdir(process_path / f)
-    ]
-    paper_combinations = itertools.combinations(paper_list, 2)
-
-    label_ID_Def_list = []
-    for i, (paper_0, paper_1) in enumerate(paper_combinations):
-        print(i, paper_0, paper_1)
-
-        df_0_ID_Def = generate_df_with_ID_Def(process, paper_0)
-        df_1_ID_Def = generate_df_with_ID_Def(process, paper_1)
-
-        product_set_ID_Def = itertools.product(df_0_ID_Def.index, df_1_ID_Def.index)
-        for ID_pair in product_set_ID_Def:
-            ID_0, ID_1 = ID_pair
-
-            def_0 = df_0_ID_Def["Definition"][ID_0]
-            def_1 = df_1_ID_Def["Definition"][ID_1]
-            is_equivalent = int(judge_equivalence_by_dict(df_dict, def_0, def_1))
-
-            def remove_article(def_word: str, target: str = None):
-                article_list = ["the", "The", "a", "an", "A", "An"]
-                def_word_list = def_word.split(" ")
-                if def_word_list[0] in article_list:
-                    def_word = " ".join(def_word_list[1:])
-                if target == "all":
-                    def_word = [x for x in def_word_list if x not in article_list]
-                return def_word
-
-            def_0 = remove_article(def_0)
-            def_1 = remove_article(def_1)
-
-            def_0_no_article = remove_article(def_0, "all")
-            def_1_no_article = remove_article(def_1, "all")
-            if def_0_no_article == def_1_no_article:
-                continue
-
-            label_ID_Def_list.append(
-                (
-                    is_equivalent,
-                    ID_0,
-                    ID_1,
-                    def_0,
-                    def_1,
-                )
+
+def share_token(definitions_0: dict, definitions_1: dict):
+    """return whether each pair of definitions has a word in common."""
+    vocabulary = {}
+    incidence_list = []
+    for definitions_ in [definitions_0, definitions_1]:
+        row_list, col_list = [], []
+        for i, token_set_ in enumerate(definitions_["token"]):
+            for token_ in token_set_:
+                row_list.append(i)
+                col_list.append(vocabulary.setdefault(token_, len(vocabulary)))
+        incidence_list.append((row_list, col_list))
+
+    n_token = max(len(vocabulary), 1)
+    matrix_list = []
+    for definitions_, (row_list, col_list) in zip(
+        [definitions_0, definitions_1], incidence_list
+    ):
+        matrix = np.zeros((len(definitions_["ID"]), n_token), dtype=np.int32)
+        matrix[row_list, col_list] = 1
+        matrix_list.append(matrix)
+    return (matrix_list[0] @ matrix_list[1].T) > 0
+
+
+class NegativeSampler:
+    """select the positive pairs and a bounded number of negative pairs.
+
+    Most of the pairs of two papers are negative. A positive pair shares a
+    dictionary ID. The hard negatives are the negative pairs which share the
+    identifier or a word, and random negatives are drawn from the others.
+
+    Args:
+        negatives_per_positive (int): random negatives drawn per positive pair.
+        hard_negatives_per_positive (int): upper bound of the hard negatives
+            per positive pair. Negative value means no bound.
+        seed (int):
+    """
+
+    def __init__(
+        self,
+        negatives_per_positive: int = 1,
+        hard_negatives_per_positive: int = -1,
+        seed: int = 0,
+    ):
+        self.negatives_per_positive = negatives_per_positive
+        self.hard_negatives_per_positive = hard_negatives_per_positive
+        self.seed = seed
+
+    def rng(self, *key) -> np.random.Generator:
+        # the same chunk gets the same stream whatever order chunks are made in
+        return np.random.default_rng([self.seed, *key])
+
+    @staticmethod
+    def _sample(candidate, n, rng):
+        index = np.flatnonzero(candidate)
+        if n < index.size:
+            index = rng.choice(index, size=n, replace=False)
+        selected = np.zeros(candidate.size, dtype=bool)
+        selected[index] = True
+        return selected.reshape(candidate.shape)
+
+    def select(self, is_equivalent, is_kept, definitions_0, definitions_1, rng):
+        is_positive = is_equivalent & is_kept
+        is_negative = ~is_equivalent & is_kept
+        n_positive = int(is_positive.sum())
+
+        is_blocked = (
+            definitions_0["identifier_tex"][:, None]
+            == definitions_1["identifier_tex"][None, :]
+        ) | share_token(definitions_0, definitions_1)
+        is_hard = is_negative & is_blocked
+        if self.hard_negatives_per_positive >= 0:
+            is_hard = self._sample(
+                is_hard, self.hard_negatives_per_positive * n_positive, rng
             )
-    df_var_pair = pd.DataFrame(
-        label_ID_Def_list, columns=["label", "ID0", "ID1", "Definition0", "Definition1"]
+        is_random = self._sample(
+            is_negative & ~is_blocked, self.negatives_per_positive * n_positive, rng
+        )
+        return is_positive | is_hard | is_random
+
+
+class PairTableWriter:
+    """write the pair table to TSV chunk by chunk, so that the memory usage
+    does not depend on the number of pairs.
+
+    Args:
+        tsv_path (Path): e.g. `variable_pair.tsv`.
+        shard_rows (int): if positive, the table is split into
+            `variable_pair_0000.tsv`, `variable_pair_0001.tsv`, ... with at
+            most this number of rows each.
+    """
+
+    def __init__(self, tsv_path, shard_rows: int = 0):
+        self.tsv_path = pathlib.Path(tsv_path)
+        self.shard_rows = shard_rows
+        self.path_list = []
+        self.n_rows = 0
+        self._n_rows_in_shard = 0
+
+    def _open_shard(self):
+        if self.shard_rows > 0:
+            path = self.tsv_path.with_name(
+                f"{self.tsv_path.stem}_{len(self.path_list):04d}{self.tsv_path.suffix}"
+            )
+        else:
+            path = self.tsv_path
+        pd.DataFrame(columns=PAIR_COLUMNS).to_csv(path, sep="\t", index=0)
+        self.path_list.append(path)
+        self._n_rows_in_shard = 0
+
+    def write(self, df_var_pair):
+        if not self.path_list:
+            self._open_shard()
+        start = 0
+        while start < df_var_pair.shape[0]:
+            if self.shard_rows > 0 and self._n_rows_in_shard >= self.shard_rows:
+                self._open_shard()
+            n_rows = df_var_pair.shape[0] - start
+            if self.shard_rows > 0:
+                n_rows = min(n_rows, self.shard_rows - self._n_rows_in_shard)
+            df_var_pair.iloc[start : start + n_rows].to_csv(
+                self.path_list[-1], sep="\t", index=0, header=False, mode="a"
+            )
+            self._n_rows_in_shard += n_rows
+            self.n_rows += n_rows
+            start += n_rows
+
+    def close(self):
+        if not self.path_list:
+            self._open_shard()
+        return self.path_list
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def export_xlsx(tsv_path_list, xlsx_path):
+    """export the pair table to xlsx, which is practical only for a small corpus."""
+    df_var_pair = pd.concat(
+        [pd.read_csv(path_, sep="\t", dtype=str) for path_ in tsv_path_list],
+        ignore_index=True,
+    )
+    if df_var_pair.shape[0] >= EXCEL_MAX_ROWS:
+        warnings.warn(
+            f"{df_var_pair.shape[0]} pairs do not fit in an Excel sheet. "
+            f"{xlsx_path} is not written."
+        )
+        return
+    df_var_pair["label"] = df_var_pair["label"].astype(int)
+    df_var_pair.to_excel(xlsx_path, index=0)
+
+
+# read-only state shared by the worker processes
+_worker_state = {}
+
+
+def _init_worker(definitions_dict, chunk_pairs, sampler, shard_dir=None):
+    _worker_state["definitions_dict"] = definitions_dict
+    _worker_state["chunk_pairs"] = chunk_pairs
+    _worker_state["sampler"] = sampler
+    _worker_state["shard_dir"] = shard_dir
+
+
+def _iter_combination_pairs(paper_0, paper_1, shard_key):
+    definitions_dict = _worker_state["definitions_dict"]
+    return label_pairs(
+        definitions_dict[paper_0],
+        definitions_dict[paper_1],
+        _worker_state["chunk_pairs"],
+        _worker_state["sampler"],
+        shard_key,
+    )
+
+
+def _label_combination_to_shard(combination):
+    """label the pairs of a combination in a worker and write them to a shard
+    file chunk by chunk, so that neither the worker nor the parent holds them."""
+    i, (paper_0, paper_1) = combination
+    shard_path = pathlib.Path(_worker_state["shard_dir"]) / f"{i:06d}.tsv"
+    pd.DataFrame(columns=PAIR_COLUMNS).to_csv(shard_path, sep="\t", index=0)
+    for df_var_pair_ in _iter_combination_pairs(paper_0, paper_1, i):
+        df_var_pair_.to_csv(shard_path, sep="\t", index=0, header=False, mode="a")
+    return shard_path
+
+
+def _read_shard(shard_path, chunk_pairs):
+    """yield the pairs of a shard file in chunks, then remove the file."""
+    try:
+        with pd.read_csv(
+            shard_path,
+            sep="\t",
+            dtype=str,
+            keep_default_na=False,
+            chunksize=max(1, chunk_pairs),
+        ) as reader:
+            yield from reader
+    finally:
+        os.remove(shard_path)
+
+
+def iter_labeled_combinations(
+    paper_combinations, definitions_dict, chunk_pairs, sampler=None, jobs=1
+):
+    """label the pairs of each paper combination, in parallel if jobs > 1.
+
+    The labeled pairs are yielded as an iterator of chunks, which should be
+    consumed before the next combination. With one job, the chunks come
+    straight from `label_pairs`; otherwise the workers write the pairs of each
+    combination to a shard file, which is read back in chunks. The results are
+    yielded in the order of paper_combinations whatever order they are
+    finished in, so the table does not depend on the number of jobs. At most
+    2 * jobs combinations are in flight to bound the disk usage of the shards.
+
+    Yields:
+        tuple: index of the combination, the papers, and the labeled pairs.
+    """
+    if jobs <= 1:
+        _init_worker(definitions_dict, chunk_pairs, sampler)
+        for i, (paper_0, paper_1) in paper_combinations:
+            yield i, paper_0, paper_1, _iter_combination_pairs(paper_0, paper_1, i)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="varat_pairs_") as shard_dir:
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_init_worker,
+            initargs=(definitions_dict, chunk_pairs, sampler, shard_dir),
+        ) as executor:
+            future_queue = collections.deque()
+
+            def merged(combination, future):
+                i, (paper_0, paper_1) = combination
+                return i, paper_0, paper_1, _read_shard(future.result(), chunk_pairs)
+
+            for combination_ in paper_combinations:
+                future_queue.append(
+                    (
+                        combination_,
+                        executor.submit(_label_combination_to_shard, combination_),
+                    )
+                )
+                if len(future_queue) >= 2 * jobs:
+                    yield merged(*future_queue.popleft())
+            while future_queue:
+                yield merged(*future_queue.popleft())
+
+
+def generate_pair_table(
+    process: str,
+    chunk_pairs: int = 1000000,
+    shard_rows: int = 0,
+    sampler=None,
+    jobs: int = 1,
+    data_folder=DATA_FOLDER,
+    verbose: bool = True,
+):
+    """label the pairs of definitions of every combination of papers of the
+    process and write them to `[process]/variable_pair.tsv`.
+
+    Returns:
+        list: paths to the written TSV files.
+    """
+    process_path = data_folder / process
+
+    dict_index = build_dict_index(load_dict(process, data_folder))
+
+    paper_list = list_papers(process_path)
+    # each paper is loaded once, not once per combination
+    word_code_dict = {}
+    definitions_dict = {
+        paper_: prepare_definitions(
+            generate_df_with_ID_Def(process, paper_, data_folder),
+            dict_index,
+            word_code_dict,
+        )
+        for paper_ in paper_list
+    }
+    paper_combinations = list(enumerate(itertools.combinations(paper_list, 2)))
+
+    with PairTableWriter(process_path / "variable_pair.tsv", shard_rows) as writer:
+        for i, paper_0, paper_1, df_var_pair_iter in iter_labeled_combinations(
+            paper_combinations, definitions_dict, chunk_pairs, sampler, jobs
+        ):
+            n_pairs = 0
+            for df_var_pair_ in df_var_pair_iter:
+                writer.write(df_var_pair_)
+                n_pairs += df_var_pair_.shape[0]
+            if verbose:
+                print(
+                    f"[{i + 1}/{len(paper_combinations)}] {paper_0} {paper_1}: "
+                    f"{n_pairs} pairs"
+                )
+    return writer.path_list
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate the table of the labeled pairs of variable definitions."
+    )
+    parser.add_argument("process", help="e.g. crystallization")
+    parser.add_argument(
+        "--chunk-pairs",
+        type=int,
+        default=1000000,
+        help="number of pairs held in memory at once",
+    )
+    parser.add_argument(
+        "--shard-rows",
+        type=int,
+        default=0,
+        help="split the TSV into files with at most this number of rows",
+    )
+    parser.add_argument(
+        "--xlsx", action="store_true", help="export variable_pair.xlsx as well"
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["full", "sampled"],
+        default="full",
+        help="full: every pair; sampled: positives, hard negatives and random negatives",
+    )
+    parser.add_argument(
+        "--negatives-per-positive",
+        type=int,
+        default=1,
+        help="random negatives per positive pair in the sampled mode",
+    )
+    parser.add_argument(
+        "--hard-negatives-per-positive",
+        type=int,
+        default=-1,
+        help="upper bound of hard negatives per positive pair (default: no bound)",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="number of processes labeling the paper combinations",
+    )
+    args = parser.parse_args()
+
+    sampler = None
+    if args.mode == "sampled":
+        sampler = NegativeSampler(
+            args.negatives_per_positive, args.hard_negatives_per_positive, args.seed
+        )
+
+    path_list = generate_pair_table(
+        args.process, args.chunk_pairs, args.shard_rows, sampler, args.jobs
     )
 
-    df_var_pair.to_excel(DATA_FOLDER / process / "variable_pair.xlsx", index=0)
-    df_var_pair.to_csv(DATA_FOLDER / process / "variable_pair.tsv", sep="\t", index=0)
+    if args.xlsx:
+        export_xlsx(path_list, DATA_FOLDER / args.process / "variable_pair.xlsx")
 
 
 if __name__ == "__main__":
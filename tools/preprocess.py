@@ -1,10 +1,17 @@
+import argparse
+import copy
+import os
+import pathlib
 import re
-import sys
 import warnings
+from concurrent.futures import ProcessPoolExecutor
 
 import lxml.html
 
-from lib.util import e2htmltext
+from lib.util import parse_html
+
+# a <math> element in the source; LaTeXML does not nest them
+MATH_SOURCE_PATTERN = re.compile(r"<math[\s>].*?</math>", re.DOTALL)
 
 
 def is_power(e):
@@ -23,82 +30,106 @@ def is_power(e):
     return is_power
 
 
-def replace_power(e_child, doc):
+def _wrap(e_child, tag, e_list):
+    e_wrapper = e_child.makeelement(tag, {})
+    for e_ in e_list:
+        e_.tail = None
+        e_wrapper.append(e_)
+    return e_wrapper
+
+
+def _rewrite_power(e_child):
+    """return the elements which replace e_child and the elements to be visited next.
+
+    A power `<msup>base exponent</msup>` is written as `base^exponent` so that
+    the base can be extracted as an identifier.
+    """
+    e_list = list(e_child)
     if e_child.tag == "mmultiscripts":
         # this is for "Faes_et_al_2019"
-        if is_power(e_child[-1]):
-            text_before_replaced = e2htmltext(e_child)
-
-            e_child_child_list = [e2htmltext(e_) for e_ in e_child]
-            if e_child[1].tag == "none":
-                text_after_replaced = (
-                    r"<msup>"
-                    + e_child_child_list[0]
-                    + e_child_child_list[2]
-                    + r"</msup>^"
-                    + e_child_child_list[-1]
-                )
-            elif e_child[2].tag == "none":
-                text_after_replaced = (
-                    r"<msub>"
-                    + e_child_child_list[0]
-                    + e_child_child_list[1]
-                    + r"</msub>^"
-                    + e_child_child_list[-1]
-                )
+        if is_power(e_list[-1]):
+            if e_list[1].tag == "none":
+                e_base = _wrap(e_child, "msup", [e_list[0], e_list[2]])
+            elif e_list[2].tag == "none":
+                e_base = _wrap(e_child, "msub", [e_list[0], e_list[1]])
             else:
-                text_after_replaced = (
-                    r"<msubsup>"
-                    + "".join(e_child_child_list[0:3])
-                    + r"</msubsup>^"
-                    + e_child_child_list[-1]
-                )
-            doc = doc.replace(text_before_replaced, text_after_replaced)
+                e_base = _wrap(e_child, "msubsup", e_list[0:3])
+            e_exponent = e_list[-1]
+            if e_exponent.getparent() is e_base:
+                e_exponent = copy.deepcopy(e_exponent)
+            return [e_base, e_exponent], list(e_base) + [e_exponent]
 
     if e_child.tag == "msubsup":
-        if is_power(e_child[2]):
-            text_before_replaced = e2htmltext(e_child)
-            text_after_replaced = (
-                r"<msub>"
-                + e2htmltext(e_child[0])
-                + e2htmltext(e_child[1])
-                + r"</msub>^"
-                + e2htmltext(e_child[2])
-            )
-            doc = doc.replace(text_before_replaced, text_after_replaced)
+        if is_power(e_list[2]):
+            e_base = _wrap(e_child, "msub", e_list[0:2])
+            return [e_base, e_list[2]], e_list
 
     if e_child.tag == "msup":
-        if is_power(e_child[1]):
-            text_before_replaced = e2htmltext(e_child)
-            text_after_replaced = e2htmltext(e_child[0]) + r"^" + e2htmltext(e_child[1])
-            doc = doc.replace(text_before_replaced, text_after_replaced)
-
-    for e_child_ in e_child.getchildren():
-        doc = replace_power(e_child_, doc)
-
-    return doc
-
-
-def main():
-    args = sys.argv
-    filepath = args[1]
-    if filepath[-5:] != ".html":
-        warnings.warn("input should be html format.")
-        return -1
-
+        if is_power(e_list[1]):
+            return e_list[0:2], e_list[0:2]
+
+    return [e_child], e_list
+
+
+def replace_power(e_child) -> bool:
+    """rewrite the powers in the subtree of e_child in place.
+
+    Returns:
+        bool: whether anything was rewritten.
+    """
+    e_replaced_list, e_next_list = _rewrite_power(e_child)
+    is_replaced = e_replaced_list != [e_child]
+    if is_replaced:
+        e_parent = e_child.getparent()
+        index = e_parent.index(e_child)
+        tail = e_child.tail
+        e_parent.remove(e_child)
+        for e_ in e_replaced_list[:-1]:
+            e_.tail = "^"
+        e_replaced_list[-1].tail = tail
+        e_parent[index:index] = e_replaced_list
+
+    for e_next_ in e_next_list:
+        is_replaced |= replace_power(e_next_)
+    return is_replaced
+
+
+def preprocess(filepath) -> str:
+    """preprocess the html converted by LaTeXML and return the path of the result.
+
+    Only the <math> elements with a power are serialized again and put in
+    place of their source; the rest of the file is kept as it is, since
+    serializing the whole tree would move or drop the malformed parts of
+    some documents (e.g. the <head> after a text before <html>).
+    """
+    filepath = str(filepath)
     print(f"preprocess {filepath}")
 
-    # preprocess
-    with open(filepath, "r") as f:
+    with open(filepath, encoding="utf-8", newline="") as f:
         doc = f.read()
-
-    tree = lxml.html.parse(str(filepath))
-    root = tree.getroot()
-
-    for e_math_ in root.cssselect("math"):
-
-        for e_child_ in e_math_.getchildren():
-            doc = replace_power(e_child_, doc)
+    root = parse_html(filepath).getroot()
+
+    e_math_list = list(root.iter("math"))
+    span_list = [m.span() for m in MATH_SOURCE_PATTERN.finditer(doc)]
+    if len(span_list) != len(e_math_list):
+        raise ValueError(
+            f"{filepath}: {len(span_list)} <math> tags in the source but "
+            f"{len(e_math_list)} parsed"
+        )
+    part_list = []
+    end = 0
+    for e_math_, (start_, end_) in zip(e_math_list, span_list):
+        is_replaced = False
+        for e_child_ in list(e_math_):
+            is_replaced |= replace_power(e_child_)
+        if is_replaced:
+            part_list.append(doc[end:start_])
+            part_list.append(
+                lxml.html.tostring(e_math_, encoding="unicode", with_tail=False)
+            )
+            end = end_
+    part_list.append(doc[end:])
+    doc = "".join(part_list)
 
     # mathsize="142%"の記述を削除する
     # e.g.
@@ -106,10 +137,58 @@ def main():
     # mathsize="142%">k</mi><mn
     # mathsize="140%">2</mn></msub><msub><mi>k</mi><mn>1</mn></msub></munderover>
     doc = re.sub(r'[\s]mathsize="[0-9]+%"', "", doc)
-    saved_filepath = filepath.rstrip(".html") + "_preprocessed.html"
-    with open(saved_filepath, "w") as f:
+    saved_filepath = filepath[: -len(".html")] + "_preprocessed.html"
+    with open(saved_filepath, "w", encoding="utf-8", newline="") as f:
         f.write(doc)
         print(f"save {saved_filepath}")
+    return saved_filepath
+
+
+def list_html_in_process(process_path) -> list:
+    """return the html files converted by LaTeXML in the process folder.
+
+    Each paper is in `[process]/[paper]/[paper].html`.
+    """
+    process_path = pathlib.Path(process_path)
+    html_list = []
+    for paper_ in sorted(os.listdir(process_path)):
+        html_path = process_path / paper_ / (paper_ + ".html")
+        if html_path.is_file():
+            html_list.append(html_path)
+    return html_list
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rewrite powers in the html files converted by LaTeXML."
+    )
+    parser.add_argument(
+        "path", help="html file, or process folder whose papers are all preprocessed"
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="number of processes used for a process folder",
+    )
+    args = parser.parse_args()
+
+    if os.path.isdir(args.path):
+        html_list = list_html_in_process(args.path)
+        if args.jobs > 1:
+            with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+                list(executor.map(preprocess, html_list))
+        else:
+            for html_path_ in html_list:
+                preprocess(html_path_)
+        return 0
+
+    if args.path[-5:] != ".html":
+        warnings.warn("input should be html format.")
+        return -1
+    preprocess(args.path)
+    return 0
 
 
 if __name__ == "__main__":